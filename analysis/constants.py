@@ -22,6 +22,10 @@ OVERVIEW_FACTORS = [2, 4, 8, 16, 32]
 
 MASK_RESOLUTION = 480  # meters
 
+# Web Mercator zoom level of full resolution rasters pre-warped for report maps
+# (~19m at the equator)
+MAP_RASTER_MAX_ZOOM = 13
+
 SECAS_STATES = [
     "AL",
     "AR",
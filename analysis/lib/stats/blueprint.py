@@ -29,7 +29,7 @@ CORRIDOR_BINS = range(0, len(CORRIDORS))
 
 
 async def summarize_blueprint_in_aoi(
-    rasterized_geometry, subregions, progress_callback=None
+    rasterized_geometry, subregions, progress_callback=None, cancellation=None
 ):
     """Extract areas by each Blueprint category based on rasterized geometry
 
@@ -44,6 +44,10 @@ async def summarize_blueprint_in_aoi(
     progress_callback : async function
         If not None, is an async function that is called with the percent that
         this task is complete
+    cancellation : Cancellation, optional (default: None)
+        If not None, is checked before each indicator; raises JobCancelledError
+        if cancelled, and remaining indicators are skipped once its time budget
+        is exceeded
 
     Returns
     -------
@@ -52,7 +56,8 @@ async def summarize_blueprint_in_aoi(
         "corridors": [{"value": <...>, "label": <...>, "acres": <...>, "percent": <...>, ...}, ...],
         "legend": [...],
         "ecosystems": ...,
-        "total_acres": <...>
+        "total_acres": <...>,
+        "skipped_indicators": [<indicator ID>, ...] (only if any were skipped)
     }
     """
 
@@ -110,8 +115,17 @@ async def summarize_blueprint_in_aoi(
                 indicators_present.append(indicator)
 
     indicators = {}
+    skipped_indicators = []
     for i, indicator in enumerate(indicators_present):
         id = indicator["id"]
+
+        if cancellation is not None:
+            cancellation.check()
+
+            if cancellation.over_budget():
+                skipped_indicators = [e["id"] for e in indicators_present[i:]]
+                break
+
         filename = src_dir / "indicators" / indicator["filename"]
         bins = range(0, indicator["values"][-1]["value"] + 1)
 
@@ -165,27 +179,34 @@ async def summarize_blueprint_in_aoi(
             await progress_callback(20 + (75 * (i + 1) / len(indicators_present)))
 
     ### aggregate indicators up to ecosystems
-    # determine ecosystems present from indicators
-    ecosystem_ids = {id.split("_")[0] for id in indicators}
+    # determine ecosystems present from indicators, including those that were
+    # skipped because they were not evaluated
+    ecosystem_ids = {id.split("_")[0] for id in indicators}.union(
+        id.split("_")[0] for id in skipped_indicators
+    )
     ecosystems_present = [deepcopy(e) for e in ECOSYSTEMS if e["id"] in ecosystem_ids]
     ecosystems = []
     for ecosystem in ecosystems_present:
         id = ecosystem["id"]
 
-        # include either indicators that are present or those expected based on
-        # subregions
+        # include either indicators that are present, were skipped, or those
+        # expected based on subregions
         expected_indicators = [
             id
             for id in ecosystem["indicators"]
             if id in indicators
+            or id in skipped_indicators
             or subregions.intersection(INDICATORS_INDEX[id]["subregions"])
         ]
 
+        # skipped indicators are not evaluated, so it is not known if they are
+        # present
         ecosystem["indicator_summary"] = [
             {
                 "id": id,
                 "label": INDICATORS_INDEX[id]["label"],
                 "present": id in indicators,
+                "evaluated": id not in skipped_indicators,
             }
             for id in expected_indicators
         ]
@@ -207,6 +228,9 @@ async def summarize_blueprint_in_aoi(
     if corridors:
         results["corridors"] = corridors
 
+    if skipped_indicators:
+        results["skipped_indicators"] = skipped_indicators
+
     return results
 
 
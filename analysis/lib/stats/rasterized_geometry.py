@@ -18,6 +18,26 @@ extent_mask_filename = bnd_dir / "blueprint_extent_mask.tif"
 WINDOW_SIZE = 2048  # approx 16 MB for 8 bit data
 
 
+def use_windows(num_windows, ratio):
+    """Return True if geometry should be read using multiple windows instead of
+    a single window for its bounds.
+
+    Threshold for using windows determined by testing performance.
+
+    Parameters
+    ----------
+    num_windows : int
+        number of windows that overlap geometry
+    ratio : float
+        ratio of overlapping windows to total number of windows in extent
+
+    Returns
+    -------
+    bool
+    """
+    return num_windows >= 50 or (num_windows > 1 and ratio <= 0.25)
+
+
 class RasterizedGeometry(object):
     """Helper class to detect and extract data for a rasterized geometry"""
 
@@ -48,8 +68,7 @@ class RasterizedGeometry(object):
             num_windows = len(windows)
             self.masks = []
 
-            # threshold for using windows determined by testing performance
-            if num_windows >= 50 or (num_windows > 1 and ratio <= 0.25):
+            if use_windows(num_windows, ratio):
                 print(f"Using {len(windows)} windows for reading (ratio: {ratio:.3f})")
                 for window in windows:
                     # clip geometry to window then rasterize
@@ -0,0 +1,74 @@
+"""
+Pre-render reports for all HUC12s and marine hexes for the current DATA_VERSION.
+
+Reports are rendered in parallel across processes and stored using
+api.prebuilt; the API serves these directly instead of enqueuing a job.
+
+This is resumable: units that already have a pre-rendered report for the
+current DATA_VERSION are skipped, so an interrupted run can be restarted.
+
+Reports with any errors (e.g., basemap could not be rendered) are not stored,
+so that those units are rendered on demand instead.
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import os
+from pathlib import Path
+from time import time
+
+import pandas as pd
+from progress.bar import Bar
+
+from api.prebuilt import get_prebuilt_report, save_prebuilt_report
+from api.settings import DATA_VERSION
+from api.summary_unit_report import render_summary_unit_report
+
+
+data_dir = Path("data")
+units_dir = data_dir / "inputs/summary_units"
+
+# each process also uses MAP_RENDER_THREADS threads to render maps
+NUM_PROCESSES = int(os.getenv("NUM_PROCESSES", max(1, (os.cpu_count() or 2) // 2)))
+
+
+def prerender_report(unit_type, unit_id):
+    try:
+        pdf, filename, errors = asyncio.run(
+            render_summary_unit_report(unit_type, unit_id)
+        )
+
+    except Exception as ex:
+        return unit_id, [str(ex)]
+
+    if not errors:
+        save_prebuilt_report(unit_type, unit_id, pdf, filename)
+
+    return unit_id, errors
+
+
+if __name__ == "__main__":
+    for unit_type in ["huc12", "marine_hex"]:
+        start = time()
+
+        ids = pd.read_feather(units_dir / f"{unit_type}.feather", columns=["id"]).id
+        ids = [id for id in ids.values if get_prebuilt_report(unit_type, id) is None]
+
+        print(
+            f"Pre-rendering {len(ids):,} {unit_type} reports for data version {DATA_VERSION}"
+        )
+
+        failed = {}
+        with ProcessPoolExecutor(max_workers=NUM_PROCESSES) as executor:
+            for unit_id, errors in Bar(f"Rendering {unit_type}", max=len(ids)).iter(
+                executor.map(prerender_report, [unit_type] * len(ids), ids)
+            ):
+                if errors:
+                    failed[unit_id] = errors
+
+        if failed:
+            print(f"{len(failed):,} {unit_type} reports could not be pre-rendered:")
+            for unit_id, errors in failed.items():
+                print(f"{unit_id}: {', '.join(errors)}")
+
+        print(f"Elapsed {(time() - start) / 60.0:.2f}m")
@@ -0,0 +1,84 @@
+"""
+Materialize the full report results for every HUC12 and marine hex created using
+tabulate_summary_units.py into an embedded key-value store.
+
+The API reads results for a summary unit from this store with a single key
+lookup instead of recalculating them from the tabulated results on every
+request.
+
+This must be re-run whenever tabulate_summary_units.py is re-run.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import time
+
+import pandas as pd
+from progress.bar import Bar
+
+from api.stats.store import SummaryUnitResultsStore, serialize_results
+from api.stats.summary_units import (
+    calculate_summary_unit_results,
+    results_store_filename,
+)
+
+
+data_dir = Path("data")
+units_dir = data_dir / "inputs/summary_units"
+
+# number of units to send to each worker process at a time
+CHUNK_SIZE = 64
+
+# number of units to write to the store per transaction
+BATCH_SIZE = 1000
+
+
+def get_serialized_results(unit_type, unit_id):
+    results = calculate_summary_unit_results(unit_type, unit_id)
+    if results is None:
+        return unit_id, None
+
+    return unit_id, serialize_results(results)
+
+
+if __name__ == "__main__":
+    start = time()
+
+    # write to a temporary file so that the API never sees a partial store
+    tmp_filename = results_store_filename.with_suffix(".db.tmp")
+    tmp_filename.unlink(missing_ok=True)
+
+    store = SummaryUnitResultsStore(tmp_filename, readonly=False)
+
+    for unit_type in ["huc12", "marine_hex"]:
+        ids = pd.read_feather(units_dir / f"{unit_type}.feather", columns=["id"]).id
+
+        batch = []
+        with ProcessPoolExecutor() as executor:
+            for unit_id, data in Bar(
+                f"Packaging {unit_type} results", max=len(ids)
+            ).iter(
+                executor.map(
+                    get_serialized_results,
+                    [unit_type] * len(ids),
+                    ids.values,
+                    chunksize=CHUNK_SIZE,
+                )
+            ):
+                if data is None:
+                    continue
+
+                batch.append((unit_id, data))
+                if len(batch) >= BATCH_SIZE:
+                    store.put_many(unit_type, batch)
+                    batch = []
+
+        if batch:
+            store.put_many(unit_type, batch)
+
+    store.close()
+    tmp_filename.rename(results_store_filename)
+
+    print(
+        f"Wrote results store ({results_store_filename.stat().st_size / (1024 * 1024):.1f} MB) in {(time() - start) / 60.0:.2f}m"
+    )
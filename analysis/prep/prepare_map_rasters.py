@@ -0,0 +1,97 @@
+"""Pre-warp raster layers rendered in report maps to Web Mercator.
+
+Each layer is written as a Cloud-Optimized GeoTIFF in EPSG:3857 that is aligned
+to the Web Mercator tile grid, with overviews at each Web Mercator zoom level,
+so that report maps are rendered using a windowed read and resample of these
+files instead of reprojecting the EPSG:5070 inputs for every map.
+
+Bit-packed pixel layers (see analysis/prep/tiles/encode_pixel_layers.py) are
+also pre-warped if present, along with their encoding, for rendering maps from
+pixel layers (MAP_RASTER_SOURCE=pixel_layers).  Run this again after encoding
+pixel layers.  Overviews of these are created using nearest neighbor instead
+of mode: mode would select the most common combination of values of all layers
+in a packed pixel rather than the most common value of each layer, whereas
+nearest neighbor keeps each packed value intact and matches how data are
+resampled when read for a map.
+
+These must be recreated whenever any of the input rasters change.
+"""
+
+from pathlib import Path
+import shutil
+import subprocess
+from time import time
+
+from progress.bar import Bar
+
+from analysis.constants import INDICATORS, MAP_RASTER_MAX_ZOOM
+
+
+src_dir = Path("data/inputs")
+out_dir = src_dir / "map"
+pixel_layers_dir = Path("data/for_tiles")
+
+# paths are relative to src_dir; outputs use the same relative path in out_dir
+layers = [
+    "blueprint.tif",
+    "corridors.tif",
+    "boundaries/parcas.tif",
+    "boundaries/protected_areas.tif",
+    "threats/slr/slr.tif",
+    "threats/urban/urban_2060_binned.tif",
+    "threats/wildfire_risk/wildfire_risk.tif",
+] + [f"indicators/{indicator['filename']}" for indicator in INDICATORS]
+
+# values are categorical; nearest for warping, mode for overviews of
+# individual layers, nearest for overviews of bit-packed pixel layers
+overview_options = ["-co", "OVERVIEW_RESAMPLING=MODE"]
+pixel_layer_overview_options = ["-co", "OVERVIEW_RESAMPLING=NEAREST"]
+
+# (input path, output path, overview creation options)
+layers = [
+    (src_dir / layer, out_dir / layer, overview_options) for layer in layers
+] + [
+    (filename, out_dir / "pixel_layers" / filename.name, pixel_layer_overview_options)
+    for filename in sorted(pixel_layers_dir.glob("se_pixel_layers_*.tif"))
+]
+
+
+start = time()
+
+for infilename, outfilename, overview_options in Bar(
+    "Warping layers to Web Mercator", max=len(layers)
+).iter(layers):
+    outfilename.parent.mkdir(parents=True, exist_ok=True)
+
+    ret = subprocess.run(
+        [
+            "gdal_translate",
+            "-q",
+            "-of",
+            "COG",
+            "-co",
+            "TILING_SCHEME=GoogleMapsCompatible",
+            "-co",
+            f"ZOOM_LEVEL={MAP_RASTER_MAX_ZOOM}",
+            "-co",
+            "RESAMPLING=NEAREST",
+            *overview_options,
+            "-co",
+            "ADD_ALPHA=NO",
+            "-co",
+            "COMPRESS=DEFLATE",
+            "-co",
+            "NUM_THREADS=ALL_CPUS",
+            str(infilename),
+            str(outfilename),
+        ]
+    )
+    ret.check_returncode()
+
+if (out_dir / "pixel_layers").exists():
+    shutil.copy(
+        pixel_layers_dir / "encoding.feather",
+        out_dir / "pixel_layers/encoding.feather",
+    )
+
+print(f"Done in {time() - start:.2f}s")
@@ -0,0 +1,274 @@
+"""Memory-aware admission control for report jobs.
+
+max_jobs limits the number of jobs that a worker runs at the same time, but
+jobs vary widely in memory use: summary unit reports use very little, whereas
+a custom report for a very large area allocates geometry masks and reads
+windows of data that can use several GB.
+
+Before a job is started, its peak memory is estimated from the number of
+pixels within the bounds of its area of interest and the windows that will be
+used to read data for that area (see RasterizedGeometry).  The job is admitted
+if its estimate fits within the remaining memory budget of the worker
+(WORKER_MEMORY_BUDGET_MB); otherwise it is deferred and retried later, when it
+may be picked up by this or another worker that has enough memory available.
+
+A worker that is not running any jobs admits any job, so that jobs larger than
+the budget still run, one at a time.
+
+If a job exits early (e.g., it failed, timed out, or was aborted), stages that
+it submitted to process pools may still be running until they reach their next
+cancellation checkpoint; its memory is only released once these have stopped.
+"""
+
+import asyncio
+from functools import wraps
+import logging
+
+from arq import Retry
+from arq.constants import retry_key_prefix
+import rasterio
+import shapely
+
+from analysis.lib.raster import get_overlapping_windows, get_window
+from analysis.lib.stats.rasterized_geometry import (
+    WINDOW_SIZE,
+    extent_filename,
+    use_windows,
+)
+from api.errors import DataError
+from api.executor import track_futures
+from api.geo import get_total_bounds
+from api.progress import set_progress
+from api.settings import (
+    ADMISSION_MAX_DEFERRALS,
+    ADMISSION_RETRY_DELAY,
+    FILE_RETENTION,
+    LOGGING_LEVEL,
+    WORKER_MEMORY_BUDGET_MB,
+)
+
+
+log = logging.getLogger(__name__)
+log.setLevel(LOGGING_LEVEL)
+
+
+MB = 1024 * 1024
+
+DEFERRALS_PREFIX = "arq:job-deferrals:"
+
+# approximate memory used by a job regardless of the size of its area of
+# interest (e.g., results, maps, and PDF)
+BASE_JOB_MEMORY = 256 * MB
+
+# bytes per pixel of the window that is currently being read, in addition to
+# its geometry mask (data read from dataset, intermediate arrays while
+# counting values, etc)
+READ_BYTES_PER_PIXEL = 4
+
+# estimated memory (bytes) of jobs currently running in this worker
+_reserved = 0
+
+# tasks that release memory of jobs that exited early, once their stages have
+# stopped; references are kept so that these are not garbage collected
+_release_tasks = set()
+
+
+def estimate_window_plan_memory(bounds):
+    """Estimate peak memory used to extract data for an area of interest from
+    the windows that will be used to read data within its bounds.
+
+    Geometry masks (1 byte per pixel) are retained for all windows while the
+    job runs; data are read for one window at a time.
+
+    Because this uses the bounds of the area of interest rather than its
+    geometry, it overestimates memory for areas that would be read using
+    multiple windows because they only cover a small part of their bounds.
+
+    Parameters
+    ----------
+    bounds : list-like of [xmin, ymin, xmax, ymax]
+        bounds of area of interest in DATA_CRS
+
+    Returns
+    -------
+    int
+        bytes
+    """
+    with rasterio.open(extent_filename) as src:
+        windows, ratio = get_overlapping_windows(
+            src, shapely.box(*bounds), bounds=bounds, window_size=WINDOW_SIZE
+        )
+
+        if use_windows(len(windows), ratio):
+            window_pixels = WINDOW_SIZE * WINDOW_SIZE
+            mask_pixels = len(windows) * window_pixels
+
+        else:
+            window = get_window(src, bounds)
+            window_pixels = int(window.width * window.height)
+            mask_pixels = window_pixels
+
+    return mask_pixels + window_pixels * READ_BYTES_PER_PIXEL
+
+
+def estimate_custom_report_memory(zip_filename, dataset, layer, name=""):
+    """Estimate peak memory of a custom report job; takes the same arguments
+    as create_custom_report.
+
+    Returns
+    -------
+    int
+        bytes
+    """
+    try:
+        bounds = get_total_bounds(f"/vsizip/{zip_filename}/{dataset}", layer)
+        return BASE_JOB_MEMORY + estimate_window_plan_memory(bounds)
+
+    except Exception as ex:
+        # the job will fail with a more useful error when it reads the dataset
+        log.error(f"Could not estimate memory of custom report job: {ex}")
+        return BASE_JOB_MEMORY
+
+
+def reserve(memory):
+    """Reserve memory for a job if it fits within the remaining memory budget
+    of this worker.
+
+    Parameters
+    ----------
+    memory : int
+        estimated peak memory of job, in bytes
+
+    Returns
+    -------
+    bool
+        True if job is admitted
+    """
+    global _reserved
+
+    if (
+        WORKER_MEMORY_BUDGET_MB > 0
+        and _reserved > 0
+        and _reserved + memory > WORKER_MEMORY_BUDGET_MB * MB
+    ):
+        return False
+
+    _reserved += memory
+    return True
+
+
+def release(memory):
+    global _reserved
+
+    _reserved = max(_reserved - memory, 0)
+
+
+async def release_when_done(memory, futures):
+    """Release memory once futures of stages still running for a job are done.
+
+    Parameters
+    ----------
+    memory : int
+        bytes
+    futures : list-like of concurrent.futures.Future
+    """
+    try:
+        await asyncio.wait([asyncio.wrap_future(f) for f in futures])
+
+    finally:
+        release(memory)
+
+
+async def count_deferral(redis, job_id):
+    """Count a deferral of a job by admission control.
+
+    Deferrals are counted separately from arq's tries, so that max_tries only
+    limits retries of jobs that failed or crashed the worker.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    job_id : str
+
+    Returns
+    -------
+    int
+        number of times job has been deferred, including this one
+    """
+    pipeline = redis.pipeline(transaction=True)
+    pipeline.incr(f"{DEFERRALS_PREFIX}{job_id}")
+    pipeline.expire(f"{DEFERRALS_PREFIX}{job_id}", FILE_RETENTION)
+    # undo the try counted by arq when it started this attempt
+    pipeline.decr(f"{retry_key_prefix}{job_id}")
+    deferrals, *_ = await pipeline.execute()
+
+    return deferrals
+
+
+def admission_controlled(estimate_memory):
+    """Decorator for job functions to only start jobs when their estimated
+    peak memory fits within the memory budget of the worker.
+
+    Jobs that do not fit are deferred by ADMISSION_RETRY_DELAY seconds and set
+    ctx["deferred"] so that the attempt is not recorded as a completed job.
+    Jobs that are deferred more than ADMISSION_MAX_DEFERRALS times fail.
+
+    Parameters
+    ----------
+    estimate_memory : function
+        called in a thread with the arguments of the job function (except ctx)
+        and returns estimated peak memory in bytes
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(ctx, *args, **kwargs):
+            # estimates read datasets using GDAL, so these are run in a thread
+            # to avoid blocking the event loop
+            memory = await asyncio.to_thread(estimate_memory, *args, **kwargs)
+
+            redis = ctx["redis"]
+            job_id = ctx["job_id"]
+
+            if not reserve(memory):
+                deferrals = await count_deferral(redis, job_id)
+                if deferrals > ADMISSION_MAX_DEFERRALS:
+                    await redis.delete(f"{DEFERRALS_PREFIX}{job_id}")
+                    raise DataError(
+                        "The server is too busy to create this report right now.  Please try again later."
+                    )
+
+                log.info(
+                    f"deferring job {job_id} ({deferrals} deferrals): estimated memory {memory / MB:,.0f} MB, reserved {_reserved / MB:,.0f} MB"
+                )
+                ctx["deferred"] = True
+                await set_progress(
+                    redis,
+                    job_id,
+                    0,
+                    "Waiting for resources to create report",
+                )
+                raise Retry(defer=ADMISSION_RETRY_DELAY)
+
+            await redis.delete(f"{DEFERRALS_PREFIX}{job_id}")
+
+            with track_futures() as futures:
+                try:
+                    return await func(ctx, *args, **kwargs)
+
+                finally:
+                    pending = [f for f in futures if not f.done()]
+                    if pending:
+                        log.info(
+                            f"job {ctx['job_id']} ended with {len(pending)} stages still running; holding its memory until they stop"
+                        )
+                        task = asyncio.create_task(release_when_done(memory, pending))
+                        _release_tasks.add(task)
+                        task.add_done_callback(_release_tasks.discard)
+
+                    else:
+                        release(memory)
+
+        return wrapper
+
+    return decorator
@@ -1,14 +1,18 @@
-from datetime import datetime
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from hashlib import sha256
 import logging
 from pathlib import Path
 from secrets import compare_digest
+import json
 import shutil
 import tempfile
 import time
 from typing import Optional
 from zipfile import ZipFile
 
-import arq
+from arq.constants import result_key_prefix
 from arq.jobs import Job, JobStatus
 from fastapi import (
     FastAPI,
@@ -16,40 +20,74 @@ from fastapi import (
     UploadFile,
     Form,
     HTTPException,
+    Query,
     Depends,
     Security,
 )
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.security.api_key import APIKeyQuery, APIKey
 from fastapi.requests import Request
-from fastapi.responses import Response, FileResponse, JSONResponse
-from redis.exceptions import TimeoutError
+from fastapi.responses import (
+    Response,
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
+from redis.exceptions import ConnectionError, TimeoutError
 import sentry_sdk
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 
-from api.errors import DataError
-from api.geo import get_dataset
+from api.cancellation import register_client, request_cancel
+from api.connections import call_redis, create_redis_pool, get_redis_stats
+from api.errors import DataError, JobCancelledError, RedisUnavailableError
+from api.geo import estimate_pixels, get_dataset
+from api.job_stats import get_job_stats
+from api.metrics import get_metrics
+from api.prebuilt import get_prebuilt_report
+from api.stats.summary_units import get_summary_unit_json
 from api.settings import (
     LOGGING_LEVEL,
-    REDIS,
-    REDIS_QUEUE,
+    JOB_CLASSES,
+    LARGE_CUSTOM_REPORT_PIXELS,
     API_TOKEN,
     API_SECRET,
     TEMP_DIR,
+    FILE_RETENTION,
     ENABLE_CORS,
     ALLOWED_ORIGINS,
     SENTRY_DSN,
+    RESULTS_MAX_AGE,
+    JOB_STATS_RETENTION,
+    SSE_STATUS_INTERVAL,
+    REDIS_CIRCUIT_RESET,
 )
-from api.progress import get_progress
+from api.progress import get_progress, ProgressSubscriber
+from api.queue import get_job_class, get_job_id, get_job_queue, get_queue_position
+from api.storage import get_result, track_file
 
 
 log = logging.getLogger("api")
 log.setLevel(LOGGING_LEVEL)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create Redis connection pool shared by all requests for the lifetime of
+    the application."""
+    app.state.redis = create_redis_pool()
+    app.state.progress_subscriber = ProgressSubscriber(app.state.redis)
+
+    yield
+
+    await app.state.progress_subscriber.close()
+    await app.state.redis.aclose()
+
+
 ### Create the main API app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 if SENTRY_DSN:
     log.info("setting up sentry")
@@ -84,6 +122,18 @@ async def catch_exceptions_middleware(request: Request, call_next):
         )
 
 
+@app.exception_handler(RedisUnavailableError)
+async def redis_unavailable_handler(request: Request, ex: RedisUnavailableError):
+    log.error(f"Error processing request: {ex}")
+    return JSONResponse(
+        {
+            "detail": "the server is temporarily unable to process reports.  Please try again in a few minutes."
+        },
+        status_code=503,
+        headers={"Retry-After": str(REDIS_CIRCUIT_RESET)},
+    )
+
+
 if ENABLE_CORS:
     app.add_middleware(
         CORSMiddleware,
@@ -111,6 +161,20 @@ def get_token(token: str = Security(APIKeyQuery(name="token", auto_error=True)))
     raise HTTPException(status_code=403, detail="Invalid token")
 
 
+def to_event(data):
+    """Format data as a Server-Sent Event message.
+
+    Parameters
+    ----------
+    data : dict
+
+    Returns
+    -------
+    str
+    """
+    return f"data: {json.dumps(data)}\n\n"
+
+
 def save_file(file: UploadFile) -> Path:
     """Save file to a temporary directory and return the path.
 
@@ -140,6 +204,81 @@ def save_file(file: UploadFile) -> Path:
     return Path(name)
 
 
+def hash_file(path):
+    """Calculate SHA-256 hash of file contents.
+
+    Parameters
+    ----------
+    path : Path
+
+    Returns
+    -------
+    str
+        hex digest
+    """
+    digest = sha256()
+    with open(path, "rb") as infile:
+        for chunk in iter(lambda: infile.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def inspect_upload(path):
+    """Find the dataset and layer in an uploaded zip file and estimate the
+    number of pixels in its area.
+
+    Parameters
+    ----------
+    path : Path
+
+    Returns
+    -------
+    (str, str, int or None)
+        tuple of dataset, layer, and estimated number of pixels (None if it
+        could not be estimated)
+
+    Raises
+    ------
+    ValueError
+        if upload does not contain a valid shapefile or FGDB
+    """
+    with ZipFile(path) as zip:
+        dataset, layer = get_dataset(zip)
+        num_pixels = estimate_pixels(zip, dataset, layer)
+
+    return dataset, layer, num_pixels
+
+
+def etag_matches(request, etag):
+    """Check if the If-None-Match header of a request matches an ETag.
+
+    Uses weak comparison, because proxies that compress responses (e.g., nginx
+    gzip) convert strong ETags to weak ones (W/"...") that clients then send
+    back.
+
+    Parameters
+    ----------
+    request : Request
+    etag : str
+
+    Returns
+    -------
+    bool
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+
+    etag = etag.removeprefix("W/")
+    for value in header.split(","):
+        value = value.strip()
+        if value == "*" or value.removeprefix("W/") == etag:
+            return True
+
+    return False
+
+
 def validate_content_type(file):
     if not (
         file.content_type
@@ -161,6 +300,80 @@ def validate_content_type(file):
         )
 
 
+async def enqueue_job(redis, job_class, function, *args, job_key, **kwargs):
+    """Create a background job in the queue for its job class.
+
+    Identical jobs are coalesced: if a job with the same job class and job_key
+    is already queued, in progress, or recently completed successfully, its ID
+    is returned instead of creating a new job.  Each request is registered as
+    a client of the job with its own client ID, so that a coalesced job is only
+    cancelled once all of its requests cancel it.
+
+    Parameters
+    ----------
+    redis : ArqRedis
+    job_class : str
+        one of JOB_CLASSES; determines the queue and workers used for the job
+    function : str
+        name of job function
+    *args, **kwargs
+        passed to job function
+    job_key : list-like of str
+        values that determine the output of the job
+
+    Returns
+    -------
+    dict
+        {"job": <job_id>, "client": <client_id>}
+    """
+    job_id = get_job_id(job_class, function, *job_key)
+    queue_name = JOB_CLASSES[job_class]["queue"]
+
+    async def enqueue():
+        return await redis.enqueue_job(
+            function, *args, _job_id=job_id, _queue_name=queue_name, **kwargs
+        )
+
+    try:
+        job = await call_redis("enqueue_job", enqueue)
+
+        if job is None:
+            # an identical job already exists; don't reuse it if it failed
+            info = await call_redis(
+                "job_result", Job(job_id, redis, _queue_name=queue_name).result_info
+            )
+            if info is not None and not info.success:
+                await call_redis(
+                    "delete_result",
+                    lambda: redis.delete(f"{result_key_prefix}{job_id}"),
+                )
+                await call_redis("enqueue_job", enqueue)
+                client_id = await call_redis(
+                    "register_client", lambda: register_client(redis, job_id, new=True)
+                )
+
+            else:
+                log.debug(f"attached request to existing job {job_id}")
+                client_id = await call_redis(
+                    "register_client", lambda: register_client(redis, job_id)
+                )
+
+            return {"job": job_id, "client": client_id}
+
+        client_id = await call_redis(
+            "register_client", lambda: register_client(redis, job_id, new=True)
+        )
+
+        return {"job": job.job_id, "client": client_id}
+
+    except RedisUnavailableError:
+        raise
+
+    except Exception as ex:
+        log.error(f"Error creating background task, is Redis offline?  {ex}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 @app.get("/api/health", status_code=200)
 @app.head("/api/health", status_code=200)
 async def health_endpoint():
@@ -169,6 +382,7 @@ async def health_endpoint():
 
 @app.post("/api/reports/custom")
 async def custom_report_endpoint(
+    request: Request,
     file: UploadFile = File(...),
     name: Optional[str] = Form(None),
     token: APIKey = Depends(get_token),
@@ -178,73 +392,117 @@ async def custom_report_endpoint(
     filename = save_file(file)
     log.debug(f"upload saved to: {filename}")
 
-    # validate that upload has a shapefile or FGDB
+    redis = request.app.state.redis
+    await call_redis("track_file", lambda: track_file(redis, filename))
+
+    # validate that upload has a shapefile or FGDB; this reads the upload
+    # using GDAL so is run in a thread to avoid blocking other requests
     try:
-        dataset, layer = get_dataset(ZipFile(filename))
+        dataset, layer, num_pixels = await run_in_threadpool(inspect_upload, filename)
 
     except ValueError as ex:
         raise HTTPException(status_code=400, detail=str(ex))
 
-    # Create report task
-    try:
-        redis = await arq.create_pool(REDIS)
-        job = await redis.enqueue_job(
-            "create_custom_report",
-            filename,
-            dataset,
-            layer,
-            name=name,
-            _queue_name=REDIS_QUEUE,
-        )
-        return {"job": job.job_id}
-
-    except Exception as ex:
-        log.error(f"Error creating background task, is Redis offline?  {ex}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+    # large areas are routed to a separate queue so that they do not delay
+    # other custom reports; if size could not be estimated, assume it is large
+    job_class = (
+        "custom"
+        if num_pixels is not None and num_pixels <= LARGE_CUSTOM_REPORT_PIXELS
+        else "large_custom"
+    )
 
-    finally:
-        await redis.close()
+    content_hash = await run_in_threadpool(hash_file, filename)
+
+    # Create report task; identical uploads with the same name share a job
+    return await enqueue_job(
+        redis,
+        job_class,
+        "create_custom_report",
+        filename,
+        dataset,
+        layer,
+        name=name,
+        job_key=[content_hash, name or ""],
+    )
 
 
 @app.post("/api/reports/huc12/{unit_id}")
-async def huc12_report_endpoint(unit_id: str, token: APIKey = Depends(get_token)):
-    try:
-        redis = await arq.create_pool(REDIS)
-        job = await redis.enqueue_job(
-            "create_summary_unit_report", "huc12", unit_id, _queue_name=REDIS_QUEUE
-        )
-        return {"job": job.job_id}
+async def huc12_report_endpoint(
+    unit_id: str, request: Request, token: APIKey = Depends(get_token)
+):
+    # serve pre-rendered report if available instead of creating a job
+    if get_prebuilt_report("huc12", unit_id) is not None:
+        return {"status": "success", "result": f"/api/reports/prebuilt/huc12/{unit_id}"}
+
+    return await enqueue_job(
+        request.app.state.redis,
+        "summary_unit",
+        "create_summary_unit_report",
+        "huc12",
+        unit_id,
+        job_key=["huc12", unit_id],
+    )
 
-    except Exception as ex:
-        log.error(f"Error creating background task, is Redis offline?  {ex}")
-        raise HTTPException(status_code=500, detail="Internal server error")
 
-    finally:
-        await redis.close()
+@app.post("/api/reports/marine_hex/{unit_id}")
+async def marine_hex_report_endpoint(
+    unit_id: str, request: Request, token: APIKey = Depends(get_token)
+):
+    # serve pre-rendered report if available instead of creating a job
+    if get_prebuilt_report("marine_hex", unit_id) is not None:
+        return {
+            "status": "success",
+            "result": f"/api/reports/prebuilt/marine_hex/{unit_id}",
+        }
 
+    return await enqueue_job(
+        request.app.state.redis,
+        "summary_unit",
+        "create_summary_unit_report",
+        "marine_hex",
+        unit_id,
+        job_key=["marine_hex", unit_id],
+    )
 
-@app.post("/api/reports/marine_hex/{unit_id}")
-async def marine_hex_report_endpoint(unit_id: str, token: APIKey = Depends(get_token)):
-    try:
-        redis = await arq.create_pool(REDIS)
-        job = await redis.enqueue_job(
-            "create_summary_unit_report",
-            "marine_hex",
-            unit_id,
-            _queue_name=REDIS_QUEUE,
+
+@app.get("/api/summary_units/{unit_type}/{unit_id}")
+def summary_unit_results_endpoint(
+    unit_type: str,
+    unit_id: str,
+    request: Request,
+    token: APIKey = Depends(get_token),
+):
+    """Return results for a HUC12 or marine hex as JSON.
+
+    This is handled directly in the API process rather than creating a job.
+    NOTE: this is intentionally not async so that reading results runs in
+    the threadpool rather than blocking the event loop.
+
+    Parameters
+    ----------
+    unit_type : str, one of {"huc12", "marine_hex"}
+    unit_id : str
+    """
+    if unit_type not in {"huc12", "marine_hex"}:
+        raise HTTPException(status_code=404, detail="Unit type not found")
+
+    result = get_summary_unit_json(unit_type, unit_id)
+    if result is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Unit id is not valid (not an existing subwatershed or marine hex grid ID)",
         )
-        return {"job": job.job_id}
 
-    except Exception as ex:
-        log.error(f"Error creating background task, is Redis offline?  {ex}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+    content, etag = result
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={RESULTS_MAX_AGE}"}
 
-    finally:
-        await redis.close()
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
 
+    return Response(content=content, media_type="application/json", headers=headers)
 
-@app.get("/api/reports/status/{job_id}")
-async def job_status_endpoint(job_id: str):
+
+async def get_job_status(redis, job_id):
     """Return the status of a job.
 
     Job status values derived from JobStatus enum at:
@@ -255,117 +513,237 @@ async def job_status_endpoint(job_id: str):
 
     Parameters
     ----------
+    redis : ArqRedis
     job_id : str
 
     Returns
     -------
-    JSON
+    dict
         {"status": "...", "progress": 0-100, "result": "...only if complete...", "detail": "...only if failed..."}
+
+    Raises
+    ------
+    RedisUnavailableError
+        if Redis is unavailable after retrying timeouts or connection errors
     """
 
-    # loop until return or hit number of retries
-    retry = 0
-    while retry <= 5:
-        redis = None
+    async def fetch_status():
+        job = Job(job_id, redis=redis, _queue_name=get_job_queue(job_id))
+        status = await job.status()
 
-        try:
-            redis = await arq.create_pool(REDIS)
+        if status == JobStatus.not_found:
+            raise HTTPException(
+                status_code=404,
+                detail="Job not found; it may have been cancelled, timed out, or the server restarted.  Please try again.",
+            )
 
-            job = Job(job_id, redis=redis, _queue_name=REDIS_QUEUE)
-            status = await job.status()
+        if status == JobStatus.queued:
+            job_info = await job.info()
+            elapsed_time = (
+                datetime.now(tz=job_info.enqueue_time.tzinfo)
+                - job_info.enqueue_time
+            )
 
-            if status == JobStatus.not_found:
-                raise HTTPException(
-                    status_code=404,
-                    detail="Job not found; it may have been cancelled, timed out, or the server restarted.  Please try again.",
-                )
+            queue_position, estimated_wait = await get_queue_position(redis, job_id)
 
-            if status == JobStatus.queued:
-                job_info = await job.info()
-                elapsed_time = (
-                    datetime.now(tz=job_info.enqueue_time.tzinfo)
-                    - job_info.enqueue_time
-                )
+            return {
+                "status": status,
+                "progress": 0,
+                "queue_position": queue_position or 0,
+                "estimated_wait": estimated_wait,
+                "elapsed_time": elapsed_time.seconds,
+            }
 
-                queued = [
-                    j[0]
-                    for j in sorted(
-                        [
-                            (job.job_id, job.enqueue_time)
-                            for job in await redis.queued_jobs(queue_name=REDIS_QUEUE)
-                        ],
-                        key=lambda x: x[1],
-                    )
-                ]
+        if status != JobStatus.complete:
+            progress, message, errors = await get_progress(redis, job_id)
 
-                return {
-                    "status": status,
-                    "progress": 0,
-                    "queue_position": queued.index(job_id),
-                    "elapsed_time": elapsed_time.seconds,
-                }
+            return {
+                "status": status,
+                "progress": progress,
+                "message": message,
+                "errors": errors,
+            }
 
-            if status != JobStatus.complete:
-                progress, message, errors = await get_progress(redis, job_id)
+        info = await job.result_info()
 
+        try:
+            # this re-raises the underlying exception raised in the worker
+            content_hash, out_filename, errors = await job.result()
+
+            if info.success:
                 return {
-                    "status": status,
-                    "progress": progress,
-                    "message": message,
+                    "status": "success",
+                    "result": f"/api/reports/results/{job_id}",
                     "errors": errors,
                 }
 
-            info = await job.result_info()
+        except DataError as ex:
+            message = str(ex)
 
-            try:
-                # this re-raises the underlying exception raised in the worker
-                filename, out_filename, errors = await job.result()
+        except JobCancelledError:
+            message = "Report was cancelled"
 
-                if info.success:
-                    return {
-                        "status": "success",
-                        "result": f"/api/reports/results/{job_id}",
-                        "errors": errors,
-                    }
+        # raise Redis errors so that status is retried
+        except (TimeoutError, ConnectionError) as ex:
+            raise ex
 
-            except DataError as ex:
-                message = str(ex)
+        except Exception as ex:
+            log.error(ex)
+            message = "Internal server error"
+            raise HTTPException(
+                status_code=500,
+                detail="Internal server error",
+            )
 
-            # raise timeout to outer retry loop
-            except TimeoutError as ex:
-                raise ex
+        return {"status": "failed", "detail": message}
 
-            except Exception as ex:
-                log.error(ex)
-                message = "Internal server error"
-                raise HTTPException(
-                    status_code=500,
-                    detail="Internal server error",
-                )
+    # status is fetched again from the start if there is a Redis timeout or
+    # connection error
+    return await call_redis("job_status", fetch_status)
+
+
+@app.get("/api/reports/status/{job_id}")
+async def job_status_endpoint(job_id: str, request: Request):
+    """Return the status of a job; see get_job_status() for details."""
+    return await get_job_status(request.app.state.redis, job_id)
+
+
+@app.get("/api/reports/events/{job_id}")
+async def job_events_endpoint(job_id: str, request: Request):
+    """Stream the status of a job as Server-Sent Events until it succeeds or
+    fails.
+
+    Each event contains the same JSON as returned by the status endpoint.
+    Progress updates are pushed as soon as they are published by the worker;
+    full job status is also checked every SSE_STATUS_INTERVAL seconds in case
+    no progress updates are received (e.g., while queued).
+
+    Parameters
+    ----------
+    job_id : str
+    """
+
+    redis = request.app.state.redis
+
+    # raise 404 before starting the stream if job does not exist
+    status = await get_job_status(redis, job_id)
 
-            return {"status": "failed", "detail": message}
+    async def stream():
+        async with request.app.state.progress_subscriber.subscribe(job_id) as queue:
+            # status may have changed before we subscribed
+            status = await get_job_status(redis, job_id)
+            yield to_event(status)
 
-        # in case we hit a Redis timeout while polling job status, make sure we don't break until connection cannot be re-established
-        except TimeoutError as ex:
-            retry += 1
-            log.error(f"Redis connection timeout, retry {retry}")
-            time.sleep(1)
+            while status["status"] not in {"success", "failed"}:
+                if await request.is_disconnected():
+                    return
 
-            if retry >= 5:
-                raise ex
+                try:
+                    progress, message, errors = await asyncio.wait_for(
+                        queue.get(), timeout=SSE_STATUS_INTERVAL
+                    )
+
+                    # final status is only available after the job completes
+                    if progress < 100:
+                        status = {
+                            "status": JobStatus.in_progress,
+                            "progress": progress,
+                            "message": message,
+                            "errors": errors,
+                        }
+                        yield to_event(status)
+                        continue
+
+                except asyncio.TimeoutError:
+                    pass
+
+                try:
+                    status = await get_job_status(redis, job_id)
+
+                except HTTPException as ex:
+                    yield to_event({"status": "failed", "detail": ex.detail})
+                    return
+
+                except RedisUnavailableError as ex:
+                    # client will reconnect or fall back to polling
+                    log.error(f"Error streaming job status: {ex}")
+                    return
+
+                yield to_event(status)
+
+    if status["status"] in {"success", "failed"}:
+        return StreamingResponse(
+            iter([to_event(status)]), media_type="text/event-stream"
+        )
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/reports/cancel/{job_id}")
+async def cancel_job_endpoint(job_id: str, client: str, request: Request):
+    """Cancel a job on behalf of a request that is no longer waiting on it
+    (e.g., the user closed the page).
 
-        finally:
-            if redis is not None:
-                await redis.close()
+    Jobs shared by multiple identical requests are only cancelled once all of
+    them have been cancelled.  Running jobs stop at their next checkpoint.
+
+    Parameters
+    ----------
+    job_id : str
+    client : str
+        client ID returned when the job was requested; each client can only
+        cancel once
+
+    Returns
+    -------
+    dict
+        {"status": "cancelling" | "detached" | "complete"}
+    """
+    redis = request.app.state.redis
+    job = Job(job_id, redis=redis, _queue_name=get_job_queue(job_id))
+    status = await call_redis("job_status", job.status)
+
+    if status == JobStatus.not_found:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if status == JobStatus.complete:
+        return {"status": "complete"}
+
+    cancelled = await call_redis(
+        "cancel_job", lambda: request_cancel(redis, job_id, client)
+    )
+
+    if cancelled is None:
+        raise HTTPException(
+            status_code=403,
+            detail="Unknown client or cancellation was already requested by client",
+        )
+
+    return {"status": "cancelling" if cancelled else "detached"}
 
 
 @app.get("/api/reports/results/{job_id}")
-async def report_pdf_endpoint(job_id: str):
-    redis = await arq.create_pool(REDIS)
+async def report_pdf_endpoint(job_id: str, request: Request):
+    """Return the report PDF for a job.
 
-    try:
-        job = Job(job_id, redis=redis, _queue_name=REDIS_QUEUE)
-        status = await job.status()
+    Reports are stored by content hash, which is used as a strong ETag.
+    Range requests are supported.
+
+    Parameters
+    ----------
+    job_id : str
+    """
+    redis = request.app.state.redis
+    result = await call_redis("job_report", lambda: get_result(redis, job_id))
+
+    if result is None:
+        # use job status to explain why there is no report
+        job = Job(job_id, redis=redis, _queue_name=get_job_queue(job_id))
+        status = await call_redis("job_status", job.status)
 
         if status == JobStatus.not_found:
             raise HTTPException(
@@ -376,7 +754,7 @@ async def report_pdf_endpoint(job_id: str):
         if status != JobStatus.complete:
             raise HTTPException(status_code=400, detail="Job not complete")
 
-        info = await job.result_info()
+        info = await call_redis("job_result", job.result_info)
 
         if not info.success:
             raise HTTPException(
@@ -384,21 +762,51 @@ async def report_pdf_endpoint(job_id: str):
                 detail="Job failed, cannot return results.  Please contact us to report an issue.",
             )
 
-        path, out_filename, errors = info.result
+        raise HTTPException(
+            status_code=404,
+            detail="Report is no longer available.  Please try again.",
+        )
 
-        return FileResponse(path, filename=out_filename, media_type="application/pdf")
+    path, out_filename, content_hash = result
 
-    finally:
-        await redis.close()
+    etag = f'"{content_hash}"'
+    # custom reports may contain user-provided data so are not stored in
+    # shared caches
+    visibility = "public" if get_job_class(job_id) == "summary_unit" else "private"
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"{visibility}, max-age={FILE_RETENTION}",
+    }
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        path, filename=out_filename, media_type="application/pdf", headers=headers
+    )
+
+
+@app.get("/api/reports/prebuilt/{unit_type}/{unit_id}")
+async def prebuilt_report_pdf_endpoint(unit_type: str, unit_id: str):
+    prebuilt = get_prebuilt_report(unit_type, unit_id)
+    if prebuilt is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    path, out_filename = prebuilt
+
+    return FileResponse(path, filename=out_filename, media_type="application/pdf")
 
 
 security = HTTPBasic()
 
 
-@app.get("/admin/jobs/status")
-async def get_jobs(credentials: HTTPBasicCredentials = Depends(security)):
-    """Return summary information about queued and completed jobs"""
+def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
+    """Verify admin credentials, otherwise raises HTTPException.
 
+    Parameters
+    ----------
+    credentials : HTTPBasicCredentials
+    """
     correct_username = compare_digest(credentials.username, "admin")
     correct_password = compare_digest(credentials.password, API_SECRET)
     if not (correct_username and correct_password):
@@ -408,26 +816,90 @@ async def get_jobs(credentials: HTTPBasicCredentials = Depends(security)):
             headers={"WWW-Authenticate": "Basic"},
         )
 
-    redis = await arq.create_pool(REDIS)
 
-    try:
-        queued = [
+@app.get("/admin/jobs/status", dependencies=[Depends(verify_admin)])
+async def get_jobs(request: Request):
+    """Return summary information about queued and completed jobs"""
+
+    redis = request.app.state.redis
+
+    queued = {}
+    for job_class, config in JOB_CLASSES.items():
+        queued[job_class] = [
             {"job": job.function, "args": job.args, "start": job.enqueue_time}
-            for job in await redis.queued_jobs(queue_name=REDIS_QUEUE)
+            for job in await call_redis(
+                "queued_jobs",
+                lambda: redis.queued_jobs(queue_name=config["queue"]),
+            )
         ]
 
-        results = [
-            {
-                "job": job.function,
-                "args": job.args,
-                "start": job.enqueue_time,
-                "success": job.success,
-                "elapsed": job.finish_time - job.enqueue_time,
-            }
-            for job in await redis.all_job_results()
-        ]
+    results = [
+        {
+            "job": job.function,
+            "args": job.args,
+            "start": job.enqueue_time,
+            "success": job.success,
+            "elapsed": job.finish_time - job.enqueue_time,
+        }
+        for job in await call_redis("all_job_results", redis.all_job_results)
+    ]
 
-        return {"queued": queued, "completed": results}
+    return {"queued": queued, "completed": results}
 
-    finally:
-        await redis.close()
+
+@app.get("/admin/jobs/stats", dependencies=[Depends(verify_admin)])
+async def get_jobs_stats(
+    request: Request,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Return count, outcomes, and p50 / p90 / p99 queue wait and run times
+    by job class, and a page of jobs (most recent first), for jobs that ended
+    within a time window.
+
+    Parameters
+    ----------
+    start : datetime, optional (default: None)
+        start of window; defaults to 24 hours before end
+    end : datetime, optional (default: None)
+        end of window; defaults to now
+    offset : int, optional (default: 0)
+    limit : int, optional (default: 100)
+    """
+    end = end or datetime.now().astimezone()
+    start = start or end - timedelta(days=1)
+
+    # statistics are not available beyond the retention period
+    start = max(start.timestamp(), time.time() - JOB_STATS_RETENTION)
+    end = end.timestamp()
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    redis = request.app.state.redis
+    return await call_redis(
+        "job_stats", lambda: get_job_stats(redis, start, end, offset, limit)
+    )
+
+
+@app.get("/admin/redis/status", dependencies=[Depends(verify_admin)])
+async def get_redis_status(request: Request):
+    """Return connection statistics for the shared Redis connection pool and
+    latency and retry statistics for each Redis operation"""
+
+    return {
+        "pool": request.app.state.redis.connection_pool.get_stats(),
+        **get_redis_stats(),
+    }
+
+
+@app.get("/metrics", dependencies=[Depends(verify_admin)])
+async def metrics_endpoint(request: Request):
+    """Return stage durations, queue wait times, and outcomes of report jobs
+    aggregated across all workers, in Prometheus text format"""
+
+    redis = request.app.state.redis
+    content = await call_redis("metrics", lambda: get_metrics(redis))
+
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4")
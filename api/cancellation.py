@@ -0,0 +1,235 @@
+"""Cooperative cancellation and time budgets for report jobs.
+
+Jobs check a Cancellation between stages and within long-running loops
+(checkpoints).  It is cancelled when a cancellation is requested via the API,
+which is polled from Redis while the job runs.  Checkpoints raise
+JobCancelledError if the job was cancelled.
+
+Each job also has a time budget, a fraction of its timeout; once this is
+exceeded, remaining optional sections of the report (e.g., some indicators or
+maps) are skipped so that the report completes with a note in its errors
+instead of failing when the job times out.
+
+Cancellation can be pickled so that it can be checked by stages run in the
+worker's process pools.  It is also cancelled if the job exits with an error,
+including when arq times out or aborts the job, so that stages already
+submitted to process pools do not keep running after the job has ended.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from functools import wraps
+import logging
+import secrets
+from time import time
+
+from api.errors import JobCancelledError
+from api.executor import create_event
+from api.queue import get_job_class
+from api.settings import (
+    CANCEL_CHECK_INTERVAL,
+    FILE_RETENTION,
+    JOB_CLASSES,
+    JOB_TIME_BUDGET,
+    LOGGING_LEVEL,
+)
+
+
+log = logging.getLogger(__name__)
+log.setLevel(LOGGING_LEVEL)
+
+
+CANCEL_PREFIX = "arq:job-cancel:"
+CLIENTS_PREFIX = "arq:job-clients:"
+
+# used in map rendering errors for maps that were skipped
+TIME_BUDGET_EXCEEDED = "time budget exceeded"
+
+
+class Cancellation(object):
+    """Cancellation state and time budget of a job"""
+
+    def __init__(self, event, deadline=None):
+        """
+        Parameters
+        ----------
+        event : Event
+            set when job is cancelled
+        deadline : float, optional (default: None)
+            time in seconds since epoch after which optional sections are skipped
+        """
+        self.event = event
+        self.deadline = deadline
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        """Raise JobCancelledError if the job was cancelled."""
+        if self.cancelled:
+            raise JobCancelledError("Report was cancelled")
+
+    def over_budget(self):
+        """Return True if the time budget of the job was exceeded."""
+        return self.deadline is not None and time() >= self.deadline
+
+
+# atomically remove a client from the clients of a job, then request
+# cancellation of the job if no clients remain; returns -1 if the client was
+# not registered (unknown or already cancelled), otherwise the number of
+# remaining clients
+REQUEST_CANCEL_SCRIPT = """
+if redis.call("SREM", KEYS[1], ARGV[1]) == 0 then
+    return -1
+end
+local remaining = redis.call("SCARD", KEYS[1])
+if remaining == 0 then
+    redis.call("SET", KEYS[2], 1, "EX", ARGV[2])
+end
+return remaining
+"""
+
+
+async def register_client(redis, job_id, new=False):
+    """Register a request that is waiting on a job, so that jobs shared by
+    multiple identical requests are only cancelled once all of them have
+    requested cancellation.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    job_id : str
+    new : bool, optional (default: False)
+        True if job was just created
+
+    Returns
+    -------
+    str
+        client ID, which is required to request cancellation of the job on
+        behalf of this request
+    """
+    client_id = secrets.token_urlsafe(16)
+    key = f"{CLIENTS_PREFIX}{job_id}"
+    pipeline = redis.pipeline(transaction=True)
+
+    if new:
+        pipeline.delete(key)
+        # clear any cancellation requested for a previous job with this ID
+        pipeline.delete(f"{CANCEL_PREFIX}{job_id}")
+
+    pipeline.sadd(key, client_id)
+    pipeline.expire(key, FILE_RETENTION)
+
+    await pipeline.execute()
+
+    return client_id
+
+
+async def request_cancel(redis, job_id, client_id):
+    """Request cancellation of a job on behalf of one of its clients.
+
+    Each client can only request cancellation once; repeated requests (e.g.,
+    from repeated page unload events) are rejected.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    job_id : str
+    client_id : str
+        returned by register_client() for the request
+
+    Returns
+    -------
+    bool or None
+        True if job will be cancelled, False if other clients are still waiting
+        on the job, None if client is not registered for the job
+    """
+    timeout = JOB_CLASSES[get_job_class(job_id)]["timeout"]
+    remaining = await redis.eval(
+        REQUEST_CANCEL_SCRIPT,
+        2,
+        f"{CLIENTS_PREFIX}{job_id}",
+        f"{CANCEL_PREFIX}{job_id}",
+        client_id,
+        timeout,
+    )
+
+    if remaining < 0:
+        return None
+
+    return remaining == 0
+
+
+@asynccontextmanager
+async def watch_cancellation(redis, job_id):
+    """Create a Cancellation for a job that is cancelled when a cancellation is
+    requested for the job.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    job_id : str
+
+    Yields
+    ------
+    Cancellation
+    """
+    timeout = JOB_CLASSES[get_job_class(job_id)]["timeout"]
+    cancellation = Cancellation(
+        create_event(), deadline=time() + JOB_TIME_BUDGET * timeout
+    )
+    key = f"{CANCEL_PREFIX}{job_id}"
+
+    async def check():
+        try:
+            if await redis.get(key) is not None:
+                log.info(f"cancelling job {job_id}")
+                await redis.delete(key)
+                cancellation.cancel()
+
+        except Exception as ex:
+            log.error(f"Error checking cancellation of job {job_id}: {ex}")
+
+        return cancellation.cancelled
+
+    async def poll():
+        while not await check():
+            await asyncio.sleep(CANCEL_CHECK_INTERVAL)
+
+    # check before starting in case cancellation was requested while queued
+    task = None
+    if not await check():
+        task = asyncio.create_task(poll())
+
+    completed = False
+    try:
+        yield cancellation
+        completed = True
+
+    finally:
+        if task is not None:
+            task.cancel()
+
+        # if the job failed, timed out, or was aborted by arq, stop stages
+        # that are still running in process pools at their next checkpoint
+        if not completed:
+            cancellation.cancel()
+
+
+def cancellable(func):
+    """Decorator for job functions to watch for cancellation while they run.
+
+    The Cancellation for the job is stored in ctx["cancellation"].
+    """
+
+    @wraps(func)
+    async def wrapper(ctx, *args, **kwargs):
+        async with watch_cancellation(ctx["redis"], ctx["job_id"]) as cancellation:
+            ctx["cancellation"] = cancellation
+            return await func(ctx, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,268 @@
+"""Shared Redis connection pool and resilient access to Redis.
+
+A single pool is created when the API starts and is shared by all request
+handlers, instead of creating and closing a pool on every request.
+
+Redis operations are run using call_redis(), which retries timeouts and
+connection errors using jittered exponential backoff without blocking the
+event loop, and fails fast using a circuit breaker while Redis is unavailable.
+"""
+
+import asyncio
+from collections import defaultdict
+from contextvars import ContextVar
+import logging
+import random
+import time
+
+from arq.connections import ArqRedis
+from redis.asyncio import BlockingConnectionPool
+from redis.exceptions import ConnectionError, TimeoutError
+
+from api.errors import RedisUnavailableError
+from api.settings import (
+    LOGGING_LEVEL,
+    REDIS,
+    REDIS_QUEUE,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_HEALTH_CHECK_INTERVAL,
+    REDIS_POOL_TIMEOUT,
+    REDIS_RETRIES,
+    REDIS_RETRY_BASE_DELAY,
+    REDIS_RETRY_MAX_DELAY,
+    REDIS_CIRCUIT_FAILURES,
+    REDIS_CIRCUIT_RESET,
+)
+
+
+log = logging.getLogger("api")
+log.setLevel(LOGGING_LEVEL)
+
+
+class MonitoredConnectionPool(BlockingConnectionPool):
+    """Redis connection pool that counts connections created, in order to
+    monitor connection churn.
+
+    Requests wait up to REDIS_POOL_TIMEOUT seconds for a connection if all
+    connections are in use.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections_created = 0
+
+    def make_connection(self):
+        self.connections_created += 1
+        return super().make_connection()
+
+    def get_stats(self):
+        """Return connection statistics for monitoring.
+
+        Returns
+        -------
+        dict
+        """
+        return {
+            "max_connections": self.max_connections,
+            "connections_created": self.connections_created,
+            "connections_available": len(self._available_connections),
+            "connections_in_use": len(self._in_use_connections),
+        }
+
+
+def create_redis_pool():
+    """Create an arq Redis client backed by a shared, monitored connection pool.
+
+    Connections are lazily created on first use, so this does not fail if Redis
+    is not yet available.
+
+    Returns
+    -------
+    ArqRedis
+    """
+    pool = MonitoredConnectionPool(
+        host=REDIS.host,
+        port=REDIS.port,
+        db=REDIS.database,
+        username=REDIS.username,
+        password=REDIS.password,
+        socket_connect_timeout=REDIS.conn_timeout,
+        retry_on_timeout=REDIS.retry_on_timeout,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        # connections idle for longer than this are checked before use
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    )
+
+    log.info(f"created Redis pool (max connections: {REDIS_MAX_CONNECTIONS})")
+
+    return ArqRedis(pool, default_queue_name=REDIS_QUEUE)
+
+
+class CircuitBreaker(object):
+    """Fail fast while Redis is unavailable.
+
+    The circuit opens after failure_threshold consecutive failures, and all
+    calls fail immediately until reset_timeout seconds have elapsed.  After
+    that, calls are allowed through again; the circuit closes on the first
+    success or re-opens on the next failure.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+
+        return "half_open"
+
+    def check(self):
+        if self.state == "open":
+            raise RedisUnavailableError("Redis is unavailable")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.state == "half_open":
+                log.error(f"Redis circuit opened after {self.failures} failures")
+
+            self.opened_at = time.monotonic()
+
+
+class OperationStats(object):
+    """Latency and retry statistics for a Redis operation"""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds, retries, failed=False):
+        self.calls += 1
+        self.retries += retries
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if failed:
+            self.failures += 1
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "mean_seconds": self.total_seconds / self.calls if self.calls else 0,
+            "max_seconds": self.max_seconds,
+        }
+
+
+circuit_breaker = CircuitBreaker(REDIS_CIRCUIT_FAILURES, REDIS_CIRCUIT_RESET)
+operation_stats = defaultdict(OperationStats)
+
+# set while within call_redis so that nested calls are only retried by the
+# outermost call
+_in_call = ContextVar("in_redis_call", default=False)
+
+
+def get_backoff(retry):
+    """Get delay in seconds before the next retry, using exponential backoff
+    with full jitter.
+
+    Parameters
+    ----------
+    retry : int
+        number of the retry, starting at 1
+
+    Returns
+    -------
+    float
+    """
+    return random.uniform(
+        0, min(REDIS_RETRY_MAX_DELAY, REDIS_RETRY_BASE_DELAY * 2 ** (retry - 1))
+    )
+
+
+async def call_redis(name, func, retries=REDIS_RETRIES):
+    """Call an async function that uses Redis, retrying on timeouts or connection
+    errors.
+
+    Parameters
+    ----------
+    name : str
+        name of operation, used to record statistics
+    func : async function
+        called without arguments; may be called multiple times
+    retries : int, optional (default: REDIS_RETRIES)
+        max number of retries
+
+    Returns
+    -------
+    result of func
+
+    Raises
+    ------
+    RedisUnavailableError
+        if the circuit is open or all retries failed
+    """
+    if _in_call.get():
+        return await func()
+
+    circuit_breaker.check()
+
+    token = _in_call.set(True)
+    start = time.perf_counter()
+    retry = 0
+
+    try:
+        while True:
+            try:
+                result = await func()
+                circuit_breaker.record_success()
+                operation_stats[name].record(time.perf_counter() - start, retry)
+                return result
+
+            except (TimeoutError, ConnectionError) as ex:
+                circuit_breaker.record_failure()
+
+                if retry >= retries or circuit_breaker.state == "open":
+                    operation_stats[name].record(
+                        time.perf_counter() - start, retry, failed=True
+                    )
+                    raise RedisUnavailableError(
+                        f"Redis unavailable for {name}: {ex}"
+                    ) from ex
+
+                retry += 1
+                log.error(f"Redis error in {name} ({ex}), retry {retry}")
+                await asyncio.sleep(get_backoff(retry))
+
+    finally:
+        _in_call.reset(token)
+
+
+def get_redis_stats():
+    """Return circuit breaker state and statistics for each Redis operation.
+
+    Returns
+    -------
+    dict
+    """
+    return {
+        "circuit": circuit_breaker.state,
+        "operations": {
+            name: stats.to_dict() for name, stats in sorted(operation_stats.items())
+        },
+    }
@@ -1,23 +1,26 @@
 """Create a custom report for a user-uploaded area of interest."""
 
 import logging
-import tempfile
 
 import numpy as np
 from pyogrio import read_dataframe
 import shapely
 
+from api.admission import admission_controlled, estimate_custom_report_memory
+from api.cancellation import TIME_BUDGET_EXCEEDED, cancellable
 from api.errors import DataError
+from api.executor import run_in_process
+from api.metrics import job_metrics, stage_timer
 from api.report.map import render_maps
 from api.report import create_report
 from api.settings import (
     LOGGING_LEVEL,
-    TEMP_DIR,
     CUSTOM_REPORT_MAX_ACRES,
     MAX_POLYGONS,
     MAX_VERTICES,
 )
 from api.stats.custom_area import get_custom_area_results
+from api.storage import store_result
 from api.progress import set_progress
 
 from analysis.constants import DATA_CRS, GEO_CRS, M2_ACRES, STANDARD_RESOLUTION
@@ -27,6 +30,9 @@ log = logging.getLogger(__name__)
 log.setLevel(LOGGING_LEVEL)
 
 
+@admission_controlled(estimate_custom_report_memory)
+@job_metrics
+@cancellable
 async def create_custom_report(ctx, zip_filename, dataset, layer, name=""):
     """Create a Blueprint report for a user-uploaded GIS file contained in a zip.
     Zip must contain either a shapefile or a file geodatabase.
@@ -61,6 +67,7 @@ async def create_custom_report(ctx, zip_filename, dataset, layer, name=""):
     )
 
     errors = []
+    cancellation = ctx["cancellation"]
 
     await set_progress(ctx["redis"], ctx["job_id"], 0, "Preparing area of interest")
 
@@ -132,6 +139,8 @@ async def create_custom_report(ctx, zip_filename, dataset, layer, name=""):
                 "Could not dissolve features together for analysis.  Please make sure all features have valid geometries and are of the same type."
             )
 
+    cancellation.check()
+
     await set_progress(
         ctx["redis"], ctx["job_id"], 10, "Calculating results (this might take a while)"
     )
@@ -147,13 +156,26 @@ async def create_custom_report(ctx, zip_filename, dataset, layer, name=""):
             "Calculating results (this might take a while)",
         )
 
-    results = await get_custom_area_results(df, progress_callback=progress_callback)
+    with stage_timer("get_custom_area_results"):
+        results = await run_in_process(
+            get_custom_area_results,
+            df,
+            progress_callback=progress_callback,
+            cancellation=cancellation,
+        )
 
     if results is None:
         raise DataError(
             "area of interest does not overlap Southeast Blueprint or area of interest did not overlap with the center of at least one 30m pixel in the Southeast Blueprint"
         )
 
+    if results.get("skipped_indicators") or results.get("skipped"):
+        errors.append(
+            "Some sections of this report were omitted because it took too long to create"
+        )
+
+    cancellation.check()
+
     # compile indicator IDs across all ecosystems
     indicators = []
     for ecosystem in results.get("ecosystems", []):
@@ -176,6 +198,7 @@ async def create_custom_report(ctx, zip_filename, dataset, layer, name=""):
         urban="urban" in results,
         wildfire_risk="wildfire_risk" in results,
         add_mask=results["acres"] >= 10000000,
+        cancellation=cancellation,
     )
 
     if map_errors:
@@ -186,7 +209,13 @@ async def create_custom_report(ctx, zip_filename, dataset, layer, name=""):
         if "aoi" in map_errors:
             errors.append("Error rendering area of interest on maps")
 
-        if set(map_errors.keys()).difference(["basemap", "aoi"]):
+        skipped_maps = {k for k, v in map_errors.items() if v == TIME_BUDGET_EXCEEDED}
+        if skipped_maps:
+            errors.append(
+                "Some maps were omitted because this report took too long to create"
+            )
+
+        if set(map_errors.keys()).difference(["basemap", "aoi"], skipped_maps):
             errors.append("Error creating one or more maps")
 
     await set_progress(
@@ -199,16 +228,19 @@ async def create_custom_report(ctx, zip_filename, dataset, layer, name=""):
 
     results["scale"] = scale
 
-    pdf = create_report(maps=maps, results=results, name=name, area_type="custom")
+    cancellation.check()
+
+    with stage_timer("create_report"):
+        pdf = await run_in_process(
+            create_report, maps=maps, results=results, name=name, area_type="custom"
+        )
 
     await set_progress(ctx["redis"], ctx["job_id"], 95, "Nearly done", errors=errors)
 
-    fp, name = tempfile.mkstemp(suffix=".pdf", dir=TEMP_DIR)
-    with open(fp, "wb") as out:
-        out.write(pdf)
+    content_hash = await store_result(ctx["redis"], ctx["job_id"], pdf, filename)
 
     await set_progress(ctx["redis"], ctx["job_id"], 100, "All done!", errors=errors)
 
-    log.debug(f"Created PDF at: {name}")
+    log.debug(f"Created PDF: {content_hash}")
 
-    return name, filename, errors
+    return content_hash, filename, errors
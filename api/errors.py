@@ -1,2 +1,10 @@
 class DataError(Exception):
     pass
+
+
+class RedisUnavailableError(Exception):
+    pass
+
+
+class JobCancelledError(Exception):
+    pass
@@ -0,0 +1,307 @@
+"""Process pool used by background workers to run CPU-bound stages of reports.
+
+arq runs jobs on the worker's event loop, so synchronous CPU-bound work (e.g.,
+calculating results, rendering maps, creating the PDF) blocks all other jobs,
+progress updates, and heartbeats of that worker.  These stages are instead run
+using run_in_process(), which runs them in a pool of processes created when
+the worker starts so that a single worker can run several reports on several
+cores.
+
+Outside of workers (e.g., scripts or tests), the pool is not started and
+run_in_process() runs functions in the current process.
+
+Raster maps are rendered in a separate pool (see render_raster_maps()), so that
+map rendering concurrency can be tuned independently of other stages.
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import contextvars
+from functools import partial
+import inspect
+import logging
+import multiprocessing
+from queue import Empty
+import threading
+
+from api.settings import LOGGING_LEVEL
+
+
+log = logging.getLogger(__name__)
+log.setLevel(LOGGING_LEVEL)
+
+
+# seconds between checks for progress of functions run in the pool
+PROGRESS_INTERVAL = 0.25
+
+_pool = None
+_pool_size = 0
+_manager = None
+
+_map_pool = None
+_map_pool_size = 0
+
+# seconds spent warming up this process, if it is in the pool
+_warmup_seconds = None
+
+# futures submitted to executors by the current job; see track_futures()
+_job_futures = contextvars.ContextVar("job_futures", default=None)
+
+
+def init_process():
+    """Load modules used to create reports once per process, so that data,
+    templates, and other resources loaded when they are imported are reused
+    across jobs, then warm up the process."""
+    global _warmup_seconds
+
+    import api.report  # noqa: F401
+    import api.report.map  # noqa: F401
+    import api.stats.custom_area  # noqa: F401
+    from api.warmup import warm_up
+
+    _warmup_seconds = warm_up()
+
+
+def init_map_process():
+    """Load modules used to render raster maps once per process, then warm up
+    the process."""
+    global _warmup_seconds
+
+    import api.report.map  # noqa: F401
+    from api.warmup import warm_up_map_rendering
+
+    _warmup_seconds = warm_up_map_rendering()
+
+
+def _get_warmup_seconds():
+    return _warmup_seconds
+
+
+def start_process_pool(max_workers):
+    """Start the process pool.
+
+    Processes are started using spawn rather than fork, because the worker
+    process has an active event loop, Redis connections, and threads.
+
+    Parameters
+    ----------
+    max_workers : int
+    """
+    global _pool, _pool_size, _manager
+
+    context = multiprocessing.get_context("spawn")
+    _pool = ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=context, initializer=init_process
+    )
+    _pool_size = max_workers
+    # used to create queues for progress updates and cancellation events
+    # shared with processes in the pool
+    if _manager is None:
+        _manager = context.Manager()
+
+    log.info(f"started process pool with {max_workers} processes")
+
+
+def start_map_process_pool(max_workers):
+    """Start the process pool used to render raster maps.
+
+    Parameters
+    ----------
+    max_workers : int
+    """
+    global _map_pool, _map_pool_size, _manager
+
+    context = multiprocessing.get_context("spawn")
+    _map_pool = ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=context, initializer=init_map_process
+    )
+    _map_pool_size = max_workers
+
+    # cancellation events must be shared with the map pool even if the
+    # process pool was not started (WORKER_PROCESSES=0)
+    if _manager is None:
+        _manager = context.Manager()
+
+    log.info(f"started map rendering process pool with {max_workers} processes")
+
+
+def shutdown_process_pool():
+    global _pool, _manager, _map_pool
+
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+
+    if _map_pool is not None:
+        _map_pool.shutdown(cancel_futures=True)
+
+    if _manager is not None:
+        _manager.shutdown()
+
+    _pool = None
+    _manager = None
+    _map_pool = None
+
+
+def create_event():
+    """Create an event that can be shared with processes in the process pool
+    and map rendering process pool, if either was started.
+
+    Returns
+    -------
+    Event
+    """
+    if _manager is not None:
+        return _manager.Event()
+
+    return threading.Event()
+
+
+def get_process_pool():
+    """Return the process pool, or None if it has not been started."""
+    return _pool
+
+
+def get_map_process_pool():
+    """Return the process pool used to render raster maps, or None if it has
+    not been started."""
+    return _map_pool
+
+
+async def warm_up_process_pool(map_pool=False):
+    """Start all processes in the pool and wait for them to warm up.
+
+    Processes are otherwise started on demand, so the first jobs would include
+    the time to start and warm up each process.
+
+    Parameters
+    ----------
+    map_pool : bool, optional (default: False)
+        if True, warm up the pool used to render raster maps
+
+    Returns
+    -------
+    float
+        max seconds spent warming up a process
+    """
+    pool, size = (_map_pool, _map_pool_size) if map_pool else (_pool, _pool_size)
+
+    loop = asyncio.get_running_loop()
+    # submit one task per process at the same time so that all processes are
+    # started
+    seconds = await asyncio.gather(
+        *(loop.run_in_executor(pool, _get_warmup_seconds) for _ in range(size))
+    )
+    return max((s for s in seconds if s is not None), default=0)
+
+
+@contextmanager
+def track_futures():
+    """Track futures submitted to executors using submit() by the current job
+    (and tasks it creates) while in context.
+
+    Functions that are already running in a process cannot be interrupted, so
+    these are used to determine when a job that exited early has actually
+    stopped using its resources.
+
+    Yields
+    ------
+    set of concurrent.futures.Future
+    """
+    futures = set()
+    token = _job_futures.set(futures)
+    try:
+        yield futures
+
+    finally:
+        _job_futures.reset(token)
+
+
+def submit(executor, func, *args):
+    """Submit a function to an executor, tracking it for the current job if
+    within track_futures().
+
+    Parameters
+    ----------
+    executor : Executor
+    func : function
+    *args
+        passed to func
+
+    Returns
+    -------
+    asyncio.Future
+    """
+    future = executor.submit(func, *args)
+
+    futures = _job_futures.get()
+    if futures is not None:
+        futures.add(future)
+
+    return asyncio.wrap_future(future)
+
+
+def _run_async(func, args, kwargs):
+    return asyncio.run(func(*args, **kwargs))
+
+
+def _run_with_progress(func, queue, args, kwargs):
+    async def progress_callback(percent):
+        queue.put(percent)
+
+    return asyncio.run(func(*args, progress_callback=progress_callback, **kwargs))
+
+
+async def run_in_process(func, *args, progress_callback=None, **kwargs):
+    """Run a function, which may be async, in the process pool.
+
+    Function and arguments must be picklable.
+
+    Parameters
+    ----------
+    func : function or async function
+        must be defined at the top level of a module
+    *args, **kwargs
+        passed to func
+    progress_callback : async function, optional (default: None)
+        If not None, func must be an async function that accepts a
+        progress_callback keyword argument; progress is relayed from the pool
+        to this callback
+
+    Returns
+    -------
+    result of func
+    """
+    is_async = inspect.iscoroutinefunction(func)
+
+    if _pool is None:
+        if progress_callback is not None:
+            kwargs["progress_callback"] = progress_callback
+
+        if is_async:
+            return await func(*args, **kwargs)
+
+        return func(*args, **kwargs)
+
+    if progress_callback is None:
+        if is_async:
+            return await submit(_pool, _run_async, func, args, kwargs)
+
+        return await submit(_pool, partial(func, *args, **kwargs))
+
+    queue = _manager.Queue()
+    future = submit(_pool, _run_with_progress, func, queue, args, kwargs)
+
+    while True:
+        done, _ = await asyncio.wait({future}, timeout=PROGRESS_INTERVAL)
+
+        while True:
+            try:
+                percent = queue.get_nowait()
+            except Empty:
+                break
+
+            await progress_callback(percent)
+
+        if done:
+            return future.result()
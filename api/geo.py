@@ -1,8 +1,10 @@
 import logging
 
 from pyogrio import list_layers, read_info
+from rasterio.warp import transform_bounds
 
 from api.settings import MAX_POLYGONS
+from analysis.constants import DATA_CRS, STANDARD_RESOLUTION
 
 
 log = logging.getLogger(__name__)
@@ -111,3 +113,56 @@ def get_dataset(zip):
         )
 
     return filename, layers[0, 0]
+
+
+def get_total_bounds(path, layer):
+    """Get the total bounds of a dataset in DATA_CRS.
+
+    This only reads the dataset's metadata and total bounds, not its
+    geometries.
+
+    Parameters
+    ----------
+    path : str
+        full path to dataset, may be a /vsizip/ path
+    layer : str
+        name of layer within dataset
+
+    Returns
+    -------
+    (xmin, ymin, xmax, ymax)
+    """
+    info = read_info(path, layer, force_total_bounds=True)
+    return transform_bounds(info["crs"], DATA_CRS, *info["total_bounds"])
+
+
+def estimate_pixels(zip, dataset, layer):
+    """Estimate the number of 30m pixels within the bounds of the area of
+    interest, used to route large areas to a separate queue.
+
+    This only reads the dataset's metadata and total bounds, not its
+    geometries.
+
+    Parameters
+    ----------
+    zip : open ZipFile
+    dataset : str
+        geospatial file within zip file
+    layer : str
+        name of layer within dataset
+
+    Returns
+    -------
+    int or None
+        estimated number of pixels, or None if it could not be estimated
+    """
+    try:
+        xmin, ymin, xmax, ymax = get_total_bounds(
+            f"/vsizip/{zip.fp.name}/{dataset}", layer
+        )
+
+    except Exception as ex:
+        log.error(f"Could not estimate size of upload: {ex}")
+        return None
+
+    return int(((xmax - xmin) * (ymax - ymin)) / (STANDARD_RESOLUTION**2))
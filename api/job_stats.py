@@ -0,0 +1,179 @@
+"""Aggregated statistics of completed jobs for admin monitoring.
+
+Statistics are maintained incrementally as each job ends, rather than by
+scanning all job results:
+
+* counts of jobs, outcomes, and histograms of queue wait and run times are
+  added to a Redis hash for the hour in which the job ended, which are used to
+  estimate percentiles by job class over a time window
+* a short summary of each job is added to a sorted set scored by the time the
+  job ended, which is used to list recent jobs a page at a time
+
+Both expire after JOB_STATS_RETENTION seconds.
+"""
+
+import json
+import math
+from time import time
+
+from api.queue import get_job_class
+from api.settings import JOB_STATS_RETENTION
+
+
+STATS_PREFIX = "arq:job-stats:"
+HISTORY_KEY = "arq:job-history"
+
+# histogram buckets used to estimate percentiles: the upper bound of each
+# bucket is 25% larger than the previous one, starting at MIN_SECONDS; the
+# last bucket includes all larger values
+MIN_SECONDS = 0.05
+BUCKET_FACTOR = 1.25
+NUM_BUCKETS = 50
+
+PERCENTILES = (50, 90, 99)
+
+
+def get_bucket(seconds):
+    if seconds <= MIN_SECONDS:
+        return 0
+
+    bucket = math.ceil(math.log(seconds / MIN_SECONDS) / math.log(BUCKET_FACTOR))
+    return min(bucket, NUM_BUCKETS - 1)
+
+
+def get_bucket_bound(bucket):
+    return MIN_SECONDS * BUCKET_FACTOR**bucket
+
+
+def get_percentiles(histogram):
+    """Estimate percentiles from a histogram.
+
+    Percentiles are estimated as the upper bound of the bucket that contains
+    them, so are within 25% of the actual value.
+
+    Parameters
+    ----------
+    histogram : dict
+        bucket to count
+
+    Returns
+    -------
+    dict
+        {"p50": <seconds>, ...}, values are None if there are no observations
+    """
+    total = sum(histogram.values())
+    percentiles = {f"p{p}": None for p in PERCENTILES}
+    if total == 0:
+        return percentiles
+
+    cumulative = 0
+    remaining = list(PERCENTILES)
+    for bucket in sorted(histogram):
+        cumulative += histogram[bucket]
+        while remaining and cumulative >= total * remaining[0] / 100:
+            percentiles[f"p{remaining.pop(0)}"] = round(get_bucket_bound(bucket), 2)
+
+    return percentiles
+
+
+async def record_job_stats(redis, job_id, run_time, queue_wait=None, outcome=None):
+    """Add a job that ended to the job statistics.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    job_id : str
+    run_time : float
+        seconds job ran
+    queue_wait : float, optional (default: None)
+        seconds job waited in queue before starting
+    outcome : str, optional (default: None)
+        outcome of job, e.g., "success", "error"
+    """
+    now = time()
+    job_class = get_job_class(job_id)
+    outcome = outcome or "unknown"
+    key = f"{STATS_PREFIX}{int(now // 3600)}"
+
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.hincrby(key, f"{job_class}|count", 1)
+    pipeline.hincrby(key, f"{job_class}|outcome|{outcome}", 1)
+    pipeline.hincrby(key, f"{job_class}|run_time|{get_bucket(run_time)}", 1)
+    if queue_wait is not None:
+        pipeline.hincrby(key, f"{job_class}|queue_wait|{get_bucket(queue_wait)}", 1)
+    pipeline.expire(key, JOB_STATS_RETENTION)
+
+    summary = {
+        "job": job_id,
+        "job_class": job_class,
+        "outcome": outcome,
+        "queue_wait": round(queue_wait, 2) if queue_wait is not None else None,
+        "run_time": round(run_time, 2),
+        "end": round(now, 3),
+    }
+    pipeline.zadd(HISTORY_KEY, {json.dumps(summary): now})
+    pipeline.zremrangebyscore(HISTORY_KEY, 0, now - JOB_STATS_RETENTION)
+
+    await pipeline.execute()
+
+
+async def get_job_stats(redis, start, end, offset=0, limit=100):
+    """Get aggregated statistics and a page of jobs that ended within a time
+    window.
+
+    Aggregated statistics are calculated from hourly counters, so include all
+    jobs that ended within the hours that overlap the window.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    start : float
+        start of window as seconds since epoch
+    end : float
+        end of window as seconds since epoch
+    offset : int, optional (default: 0)
+        number of jobs to skip, most recent first
+    limit : int, optional (default: 100)
+        max number of jobs to return
+
+    Returns
+    -------
+    dict
+    """
+    pipeline = redis.pipeline(transaction=False)
+    hours = range(int(start // 3600), int(end // 3600) + 1)
+    for hour in hours:
+        pipeline.hgetall(f"{STATS_PREFIX}{hour}")
+
+    pipeline.zcount(HISTORY_KEY, start, end)
+    pipeline.zrevrangebyscore(HISTORY_KEY, end, start, start=offset, num=limit)
+    *hourly, total, jobs = await pipeline.execute()
+
+    stats = {}
+    for values in hourly:
+        for field, count in values.items():
+            job_class, kind, *rest = field.decode("UTF8").split("|")
+            class_stats = stats.setdefault(
+                job_class,
+                {"count": 0, "outcomes": {}, "queue_wait": {}, "run_time": {}},
+            )
+            count = int(count)
+
+            if kind == "count":
+                class_stats["count"] += count
+
+            else:
+                key = rest[0] if kind == "outcome" else int(rest[0])
+                class_stats[kind][key] = class_stats[kind].get(key, 0) + count
+
+    for class_stats in stats.values():
+        class_stats["queue_wait"] = get_percentiles(class_stats["queue_wait"])
+        class_stats["run_time"] = get_percentiles(class_stats["run_time"])
+
+    return {
+        "job_classes": stats,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "jobs": [json.loads(job) for job in jobs],
+    }
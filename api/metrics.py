@@ -0,0 +1,331 @@
+"""Stage-level performance metrics for report jobs, in Prometheus text format.
+
+Each report job collects the duration of each stage of the job (e.g.,
+calculating results, rendering maps, creating the PDF) while it runs.  After
+the job ends, these are written to a single Redis hash along with the time the
+job waited in the queue and the outcome of the job, so that metrics are
+aggregated across all workers.  The API exposes these on /metrics.
+
+Fields of the Redis hash are the Prometheus series names including labels, and
+values are the cumulative counts or sums for those series.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import inspect
+import math
+import time
+
+from api.errors import DataError, JobCancelledError
+from api.queue import get_job_class
+
+
+METRICS_KEY = "arq:metrics"
+
+# upper bounds of histogram buckets, in seconds
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, math.inf)
+
+METRICS = {
+    "report_stage_duration_seconds": (
+        "histogram",
+        "Duration of each stage of report jobs",
+    ),
+    "report_queue_wait_seconds": (
+        "histogram",
+        "Time report jobs waited in the queue before starting",
+    ),
+    "report_jobs_total": ("counter", "Number of report jobs by outcome"),
+    "report_cache_requests_total": (
+        "counter",
+        "Number of lookups in caches used by report jobs, by result (hit or miss)",
+    ),
+    "worker_warmup_seconds": (
+        "histogram",
+        "Time spent warming up worker processes when workers start",
+    ),
+}
+
+# metrics for the job running in the current task; None outside of jobs
+_job_metrics = ContextVar("job_metrics", default=None)
+
+
+class JobMetrics(object):
+    """Stage durations, cache lookups, queue wait time, and outcome of a
+    single job"""
+
+    def __init__(self, queue_wait=None):
+        self.queue_wait = queue_wait
+        self.stages = []
+        self.cache_lookups = []
+        self.outcome = None
+
+    def add_stage(self, stage, seconds):
+        self.stages.append((stage, seconds))
+
+    def add_cache_lookup(self, cache, hit):
+        self.cache_lookups.append((cache, hit))
+
+
+def format_labels(**labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def format_bucket(bound):
+    return "+Inf" if bound == math.inf else f"{bound:g}"
+
+
+def observe(increments, name, seconds, **labels):
+    """Add increments for an observation of a histogram.
+
+    Parameters
+    ----------
+    increments : dict
+        series name to increment, updated in place
+    name : str
+        name of histogram
+    seconds : float
+        observed value
+    **labels
+        labels of the series
+    """
+    label_str = format_labels(**labels)
+    for bound in BUCKETS:
+        if seconds <= bound:
+            series = f'{name}_bucket{{{label_str},le="{format_bucket(bound)}"}}'
+            increments[series] = increments.get(series, 0) + 1
+
+    for suffix, value in (("sum", seconds), ("count", 1)):
+        series = f"{name}_{suffix}{{{label_str}}}"
+        increments[series] = increments.get(series, 0) + value
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time a stage of the current job.
+
+    This does nothing if called outside of a job (e.g., when pre-rendering
+    reports).
+
+    Parameters
+    ----------
+    stage : str
+        name of stage
+    """
+    metrics = _job_metrics.get()
+    if metrics is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_stage(stage, time.perf_counter() - start)
+
+
+def count_cache_lookup(cache, hit):
+    """Count a lookup in a cache by the current job.
+
+    This does nothing if called outside of a job.
+
+    Parameters
+    ----------
+    cache : str
+        name of cache
+    hit : bool
+        True if value was found in cache
+    """
+    metrics = _job_metrics.get()
+    if metrics is not None:
+        metrics.add_cache_lookup(cache, hit)
+
+
+def timed(stage):
+    """Decorator to time a function, which may be async, as a stage of the
+    current job.
+
+    Parameters
+    ----------
+    stage : str
+        name of stage
+    """
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    return await func(*args, **kwargs)
+
+        else:
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def job_metrics(func):
+    """Decorator for job functions to collect stage metrics and the outcome of
+    the job.
+
+    Metrics are stored in ctx["metrics"] and written to Redis by
+    record_job_metrics() after the job ends.
+    """
+
+    @wraps(func)
+    async def wrapper(ctx, *args, **kwargs):
+        queue_wait = None
+        if ctx.get("enqueue_time") is not None:
+            queue_wait = max(time.time() - ctx["enqueue_time"].timestamp(), 0)
+
+        metrics = JobMetrics(queue_wait=queue_wait)
+        ctx["metrics"] = metrics
+        token = _job_metrics.set(metrics)
+
+        try:
+            with stage_timer("total"):
+                result = await func(ctx, *args, **kwargs)
+
+            metrics.outcome = "success"
+            return result
+
+        except DataError:
+            metrics.outcome = "invalid"
+            raise
+
+        except JobCancelledError:
+            metrics.outcome = "cancelled"
+            raise
+
+        except asyncio.CancelledError:
+            # raised when the job times out
+            metrics.outcome = "timeout"
+            raise
+
+        except Exception:
+            metrics.outcome = "error"
+            raise
+
+        finally:
+            _job_metrics.reset(token)
+
+    return wrapper
+
+
+async def record_job_metrics(redis, job_id, metrics):
+    """Add the metrics of a job that ended to the aggregate metrics in Redis.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    job_id : str
+    metrics : JobMetrics
+    """
+    job_class = get_job_class(job_id)
+
+    increments = {}
+    for stage, seconds in metrics.stages:
+        observe(
+            increments,
+            "report_stage_duration_seconds",
+            seconds,
+            job_class=job_class,
+            stage=stage,
+        )
+
+    if metrics.queue_wait is not None:
+        observe(
+            increments,
+            "report_queue_wait_seconds",
+            metrics.queue_wait,
+            job_class=job_class,
+        )
+
+    for cache, hit in metrics.cache_lookups:
+        labels = format_labels(cache=cache, result="hit" if hit else "miss")
+        series = f"report_cache_requests_total{{{labels}}}"
+        increments[series] = increments.get(series, 0) + 1
+
+    labels = format_labels(job_class=job_class, outcome=metrics.outcome or "unknown")
+    increments[f"report_jobs_total{{{labels}}}"] = 1
+
+    pipeline = redis.pipeline(transaction=False)
+    for series, value in increments.items():
+        pipeline.hincrbyfloat(METRICS_KEY, series, value)
+
+    await pipeline.execute()
+
+
+async def record_warmup(redis, seconds, process):
+    """Add the time spent warming up a worker to the aggregate metrics.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    seconds : float
+    process : str
+        "worker" for the worker process, "pool" for its process pool, or
+        "map_pool" for its map rendering process pool
+    """
+    increments = {}
+    observe(increments, "worker_warmup_seconds", seconds, process=process)
+
+    pipeline = redis.pipeline(transaction=False)
+    for series, value in increments.items():
+        pipeline.hincrbyfloat(METRICS_KEY, series, value)
+
+    await pipeline.execute()
+
+
+def sort_key(item):
+    """Sort series by labels other than le, then by increasing bucket bound,
+    so that histogram buckets are listed in order."""
+    series = item[0]
+    if ',le="' not in series:
+        return series, 0
+
+    labels, bound = series.rsplit(',le="', 1)
+    bound = bound.rstrip('"}')
+    return labels, math.inf if bound == "+Inf" else float(bound)
+
+
+async def get_metrics(redis):
+    """Get aggregate metrics from Redis in Prometheus text format.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+
+    Returns
+    -------
+    str
+    """
+    values = await redis.hgetall(METRICS_KEY)
+
+    series_by_metric = {name: [] for name in METRICS}
+    for series, value in values.items():
+        series = series.decode("UTF8")
+        series_name = series.split("{", 1)[0]
+        for name in METRICS:
+            if series_name == name or series_name.startswith(f"{name}_"):
+                series_by_metric[name].append((series, float(value)))
+                break
+
+    lines = []
+    for name, (metric_type, help) in METRICS.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(
+            f"{series} {value}"
+            for series, value in sorted(series_by_metric[name], key=sort_key)
+        )
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,88 @@
+"""Pre-rendered summary unit reports.
+
+Reports are stored by data version, unit type, and unit ID:
+<PREBUILT_REPORT_DIR>/<DATA_VERSION>/<unit_type>/<unit_id>.pdf
+
+Each report has a corresponding <unit_id>.json file that contains the filename
+used for downloads.  This is written after the PDF, so a report is only
+considered complete once its JSON file exists.
+"""
+
+import json
+import os
+from pathlib import Path
+import tempfile
+
+from api.settings import DATA_VERSION, PREBUILT_REPORT_DIR
+
+
+UNIT_TYPES = {"huc12", "marine_hex"}
+
+
+def get_prebuilt_report_dir(unit_type):
+    return PREBUILT_REPORT_DIR / DATA_VERSION / unit_type
+
+
+def is_valid_unit(unit_type, unit_id):
+    # unit_id comes from the request path, so make sure it can't escape the
+    # report directory
+    return unit_type in UNIT_TYPES and unit_id and Path(unit_id).name == unit_id
+
+
+def get_prebuilt_report(unit_type, unit_id):
+    """Get the path and download filename of a pre-rendered report, if available.
+
+    Parameters
+    ----------
+    unit_type : str, one of {"huc12", "marine_hex"}
+    unit_id : str
+
+    Returns
+    -------
+    (Path, str) or None
+        tuple of path to PDF and download filename, or None if the report has
+        not been pre-rendered
+    """
+    if not is_valid_unit(unit_type, unit_id):
+        return None
+
+    report_dir = get_prebuilt_report_dir(unit_type)
+    try:
+        with open(report_dir / f"{unit_id}.json") as infile:
+            filename = json.load(infile)["filename"]
+
+    except FileNotFoundError:
+        return None
+
+    return report_dir / f"{unit_id}.pdf", filename
+
+
+def save_prebuilt_report(unit_type, unit_id, pdf, filename):
+    """Save a pre-rendered report.
+
+    Files are written to temporary files and then moved into place so that
+    interrupted writes never leave a partial report behind.
+
+    Parameters
+    ----------
+    unit_type : str, one of {"huc12", "marine_hex"}
+    unit_id : str
+    pdf : bytes
+    filename : str
+        filename used for downloads
+    """
+    if not is_valid_unit(unit_type, unit_id):
+        raise ValueError(f"Invalid summary unit: {unit_type} {unit_id}")
+
+    report_dir = get_prebuilt_report_dir(unit_type)
+    report_dir.mkdir(exist_ok=True, parents=True)
+
+    for suffix, content in [
+        (".pdf", pdf),
+        (".json", json.dumps({"filename": filename}).encode("UTF8")),
+    ]:
+        fp, tmp_name = tempfile.mkstemp(suffix=suffix, dir=report_dir)
+        with open(fp, "wb") as out:
+            out.write(content)
+
+        os.replace(tmp_name, report_dir / f"{unit_id}{suffix}")
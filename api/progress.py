@@ -1,19 +1,41 @@
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
 import logging
-import time
-
-from redis.exceptions import TimeoutError
 
+from api.connections import call_redis
 from api.settings import JOB_TIMEOUT
 
 log = logging.getLogger("api")
 
 
 JOB_PREFIX = "arq:job-progress:"
+CHANNEL_PREFIX = "arq:job-progress-channel:"
 EXPIRATION = JOB_TIMEOUT + 3600
 
 
+def parse_progress(value):
+    """Parse progress stored or published by set_progress.
+
+    Parameters
+    ----------
+    value : bytes
+
+    Returns
+    -------
+    (int, str, list)
+        tuple of progress percent, message, errors
+    """
+    progress, message, errors = value.decode("UTF8").split("|")
+    errors = errors.split(",") if errors else []
+
+    return int(progress), message, errors
+
+
 async def set_progress(redis, job_id, progress=0, message="", errors=None):
     """Store job progress to redis, and expire after EXPIRATION seconds.
+    Progress is also published to a channel for the job so that it can be
+    pushed to clients.
 
     Parameters
     ----------
@@ -27,22 +49,16 @@ async def set_progress(redis, job_id, progress=0, message="", errors=None):
     """
 
     error_str = ",".join(errors) if errors else ""
+    value = f"{progress}|{message}|{error_str}"
 
-    retry = 0
-    while retry <= 5:
-        try:
-            await redis.setex(
-                f"{JOB_PREFIX}{job_id}", EXPIRATION, f"{progress}|{message}|{error_str}"
-            )
-            return
-
-        except TimeoutError as ex:
-            retry += 1
-            if retry >= 5:
-                raise ex
+    async def store():
+        # use a single round trip to store and publish progress
+        pipeline = redis.pipeline(transaction=False)
+        pipeline.setex(f"{JOB_PREFIX}{job_id}", EXPIRATION, value)
+        pipeline.publish(f"{CHANNEL_PREFIX}{job_id}", value)
+        await pipeline.execute()
 
-            log.error(f"Redis connection timeout in set_progress, retry {retry}")
-            time.sleep(2)
+    await call_redis("set_progress", store)
 
 
 async def get_progress(redis, job_id):
@@ -59,24 +75,94 @@ async def get_progress(redis, job_id):
         tuple of progress percent, message, errors
     """
 
-    retry = 0
-    while retry <= 5:
-        try:
-            progress = await redis.get(f"{JOB_PREFIX}{job_id}")
+    progress = await call_redis(
+        "get_progress", lambda: redis.get(f"{JOB_PREFIX}{job_id}")
+    )
+
+    if progress is None:
+        return 0, "", []
 
-            if progress is None:
-                return 0, "", []
+    return parse_progress(progress)
 
-            progress, message, errors = progress.decode("UTF8").split("|")
-            errors = errors.split(",") if errors else []
 
-            return int(progress), message, errors
+class ProgressSubscriber(object):
+    """Subscribes to progress published by set_progress for all jobs and
+    dispatches it to listeners for individual jobs.
 
-        except TimeoutError as ex:
-            retry += 1
+    This uses a single Redis connection per API process regardless of the number
+    of listeners.
+    """
 
-            if retry >= 5:
-                raise ex
+    def __init__(self, redis):
+        """
+        Parameters
+        ----------
+        redis : redis connection pool
+        """
+        self.redis = redis
+        self._queues = defaultdict(set)
+        self._task = None
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+
+                try:
+                    async for message in pubsub.listen():
+                        if message["type"] != "pmessage":
+                            continue
+
+                        job_id = message["channel"].decode("UTF8")[
+                            len(CHANNEL_PREFIX) :
+                        ]
+                        for queue in self._queues.get(job_id, []):
+                            queue.put_nowait(parse_progress(message["data"]))
+
+                finally:
+                    await pubsub.aclose()
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as ex:
+                # listeners fall back to periodically checking job status
+                # until the subscription is restored
+                log.error(f"Error subscribing to job progress, retrying: {ex}")
+                await asyncio.sleep(2)
+
+    @asynccontextmanager
+    async def subscribe(self, job_id):
+        """Subscribe to progress updates for a job.
+
+        Parameters
+        ----------
+        job_id : str
+
+        Yields
+        ------
+        asyncio.Queue
+            queue of (progress, message, errors) tuples
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+        queue = asyncio.Queue()
+        self._queues[job_id].add(queue)
 
-            log.error(f"Redis connection timeout in get_progress, retry {retry}")
-            time.sleep(2)
+        try:
+            yield queue
+
+        finally:
+            self._queues[job_id].discard(queue)
+            if not self._queues[job_id]:
+                del self._queues[job_id]
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
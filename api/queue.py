@@ -0,0 +1,146 @@
+"""Route jobs to queues by job class, track queue position and estimated wait
+time for queued jobs, and create job IDs used to coalesce identical jobs.
+
+Job IDs are prefixed by job class (see JOB_CLASSES in settings), so that the
+queue of a job can be determined from its ID alone.
+
+arq stores each queue as a sorted set of job IDs scored by the time at which
+they should be run (enqueue time unless deferred), so a job's position in the
+queue is its rank in that sorted set.  Jobs remain in the sorted set while in
+progress, so jobs that are running are counted as ahead of the job.
+"""
+
+from hashlib import sha256
+import math
+
+from api.settings import DATA_VERSION, JOB_CLASSES
+
+
+DURATION_PREFIX = "arq:job-duration:"
+
+# weight of the most recent job duration in the moving average
+DURATION_WEIGHT = 0.2
+
+# update exponentially weighted moving average of job duration atomically
+UPDATE_DURATION_SCRIPT = """
+local value = tonumber(ARGV[1])
+local prev = redis.call('GET', KEYS[1])
+if prev then
+    value = tonumber(prev) * (1 - tonumber(ARGV[2])) + value * tonumber(ARGV[2])
+end
+redis.call('SET', KEYS[1], value)
+"""
+
+
+def get_job_class(job_id):
+    """Get the job class of a job from its ID.
+
+    Parameters
+    ----------
+    job_id : str
+
+    Returns
+    -------
+    str
+        one of JOB_CLASSES; IDs without a job class prefix are assumed to be
+        summary unit jobs
+    """
+    job_class = job_id.split("-", 1)[0]
+    if job_class in JOB_CLASSES:
+        return job_class
+
+    return "summary_unit"
+
+
+def get_job_queue(job_id):
+    """Get the name of the queue that a job is enqueued in from its ID.
+
+    Parameters
+    ----------
+    job_id : str
+
+    Returns
+    -------
+    str
+    """
+    return JOB_CLASSES[get_job_class(job_id)]["queue"]
+
+
+async def record_job_duration(redis, job_id, seconds):
+    """Update the moving average of job durations for the queue of a job.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    job_id : str
+        ID of job that completed
+    seconds : float
+        duration of job that completed
+    """
+    await redis.eval(
+        UPDATE_DURATION_SCRIPT,
+        1,
+        f"{DURATION_PREFIX}{get_job_queue(job_id)}",
+        seconds,
+        DURATION_WEIGHT,
+    )
+
+
+async def get_queue_position(redis, job_id):
+    """Get the position of a job in its queue and the estimated time until it
+    is started.
+
+    This uses a rank lookup on the queue's sorted set, which is O(log n), instead
+    of fetching all queued jobs.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    job_id : str
+
+    Returns
+    -------
+    (int, int)
+        tuple of queue position (None if job is not in the queue) and estimated
+        wait time in seconds (None if no jobs have completed yet)
+    """
+    job_class = get_job_class(job_id)
+    queue_name = JOB_CLASSES[job_class]["queue"]
+
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.zrank(queue_name, job_id)
+    pipeline.get(f"{DURATION_PREFIX}{queue_name}")
+    position, duration = await pipeline.execute()
+
+    if position is None or duration is None:
+        return position, None
+
+    # jobs ahead of this one are run max_jobs at a time by the workers for
+    # this queue
+    max_jobs = JOB_CLASSES[job_class]["max_jobs"]
+    estimated_wait = int(round(math.ceil(position / max_jobs) * float(duration)))
+
+    return position, estimated_wait
+
+
+def get_job_id(job_class, *key):
+    """Create a deterministic job ID for a job class and the values that
+    determine its output, so that identical jobs share the same ID.
+
+    arq does not create a job if a job with the same ID is queued, in progress,
+    or has a result that has not yet expired; instead, clients are attached to
+    that job.
+
+    Parameters
+    ----------
+    job_class : str
+        one of JOB_CLASSES
+    *key : str
+        values that determine the output of the job
+
+    Returns
+    -------
+    str
+    """
+    digest = sha256("|".join([DATA_VERSION, *key]).encode("UTF8")).hexdigest()
+    return f"{job_class}-{digest[:32]}"
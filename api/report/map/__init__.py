@@ -1,14 +1,25 @@
 import asyncio
-from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import rasterio
 
 from .aoi import get_aoi_map_image
 from .basemap import get_basemap_image
 from .locator import get_locator_map_image
-from .raster import render_raster, WebMercatorReader
+from .pixel_layers import (
+    decode,
+    encoding_filename,
+    get_encoding,
+    get_group_filename,
+    group_by_pixel_layers,
+    NODATA,
+)
+from .raster import map_dir, render_data, render_raster, WebMercatorReader
+from .shared import image_array, share_images
 from .summary_unit import get_summary_unit_map_image
 from .mercator import get_zoom, get_map_bounds
-from .util import pad_bounds, get_center, merge_maps, to_png_bytes
+from .util import pad_bounds, get_center, to_png_bytes, to_rgba_array
 
 
 from analysis.constants import (
@@ -18,10 +29,14 @@ from analysis.constants import (
     PROTECTED_AREAS_COLORS,
     URBAN_COLORS,
     SLR_LEGEND,
+    INDICATORS,
     INDICATORS_INDEX,
     WILDFIRE_RISK_COLORS,
 )
-from api.settings import MAP_RENDER_THREADS
+from api.cancellation import TIME_BUDGET_EXCEEDED
+from api.executor import get_map_process_pool, submit
+from api.metrics import stage_timer, timed
+from api.settings import MAP_PNG_COLORS, MAP_RASTER_SOURCE, MAP_RENDER_THREADS
 
 
 WIDTH = 740
@@ -29,43 +44,154 @@ HEIGHT = 420
 PADDING = 5
 
 
-src_dir = Path("data/inputs")
-blueprint_filename = src_dir / "blueprint.tif"
-corridors_filename = src_dir / "corridors.tif"
-indicators_dir = src_dir / "indicators"
-parcas_filename = src_dir / "boundaries/parcas.tif"
-protected_areas_filename = src_dir / "boundaries/protected_areas.tif"
-slr_filename = src_dir / "threats/slr/slr.tif"
-urban_filename = src_dir / "threats/urban/urban_2060_binned.tif"
-wildfire_risk_filename = src_dir / "threats/wildfire_risk/wildfire_risk.tif"
+blueprint_filename = map_dir / "blueprint.tif"
+corridors_filename = map_dir / "corridors.tif"
+indicators_dir = map_dir / "indicators"
+parcas_filename = map_dir / "boundaries/parcas.tif"
+protected_areas_filename = map_dir / "boundaries/protected_areas.tif"
+slr_filename = map_dir / "threats/slr/slr.tif"
+urban_filename = map_dir / "threats/urban/urban_2060_binned.tif"
+wildfire_risk_filename = map_dir / "threats/wildfire_risk/wildfire_risk.tif"
+
+
+def check_map_rasters():
+    """Verify that rasters pre-warped for report maps are present.
 
+    If MAP_RASTER_SOURCE is "pixel_layers", the pixel layer encoding and each
+    group of pixel layers named in it must also be present.
+
+    Raises
+    ------
+    RuntimeError
+        if any are missing; these are created using
+        analysis/prep/prepare_map_rasters.py
+    """
+    filenames = [
+        blueprint_filename,
+        corridors_filename,
+        parcas_filename,
+        protected_areas_filename,
+        slr_filename,
+        urban_filename,
+        wildfire_risk_filename,
+    ] + [indicators_dir / indicator["filename"] for indicator in INDICATORS]
+
+    if MAP_RASTER_SOURCE == "pixel_layers":
+        filenames.append(encoding_filename)
+
+        if encoding_filename.exists():
+            groups = {group for group, *_ in get_encoding().values()}
+            filenames.extend(get_group_filename(group) for group in sorted(groups))
+
+    missing = [str(filename) for filename in filenames if not filename.exists()]
+    if missing:
+        raise RuntimeError(
+            f"Rasters for report maps are missing ({', '.join(missing)}); run analysis/prep/prepare_map_rasters.py to create them"
+        )
 
-def render_raster_map(reader, basemap_image, aoi_image, id, path, colors):
-    """Render raster dataset map based on bounds.  Merge this over basemap image
-    and under aoi_image.
+
+def render_raster_map(
+    reader, basemap_image, aoi_image, id, path, colors, cancellation=None
+):
+    """Render raster dataset map based on bounds.  Colorize and composite this
+    over basemap image and under aoi_image in a single pass.
 
     Parameters
     ----------
     reader : WebMercatorReader
-    basemap_image : Image object
-    aoi_image : Image object
+    basemap_image : uint8 array of shape (height, width, 4), SharedImage, or None
+    aoi_image : uint8 array of shape (height, width, 4), SharedImage, or None
     id : str
         map ID
     path : str
         path to raster dataset
     colors : list-like of colors
         colors to render map image based on values in raster
+    cancellation : Cancellation, optional (default: None)
+        If not None, raises JobCancelledError if cancelled, and map is skipped
+        if its time budget is exceeded
 
     Returns
     -------
-    id, Image object
-        Image object is None if it could not be rendered or does not overlap bounds
+    id, Image object, bool
+        Image object is None if it could not be rendered, does not overlap
+        bounds, or was skipped; bool is True if the map was skipped
     """
-    raster_img = render_raster(path, reader, colors)
-    map_image = merge_maps([basemap_image, raster_img, aoi_image])
-    map_image = to_png_bytes(map_image)
+    if cancellation is not None:
+        cancellation.check()
+
+        if cancellation.over_budget():
+            return id, None, True
+
+    with image_array(basemap_image) as basemap, image_array(aoi_image) as aoi:
+        map_image = render_raster(path, reader, colors, basemap, aoi)
 
-    return id, map_image
+        # release views of shared memory before it is closed
+        del basemap, aoi
+
+    map_image = to_png_bytes(map_image, colors=MAP_PNG_COLORS)
+
+    return id, map_image, False
+
+
+def render_pixel_layer_maps(
+    reader, basemap_image, aoi_image, group, layers, cancellation=None
+):
+    """Render raster maps for layers in a group of bit-packed pixel layers.
+    The group is read once and each layer is decoded from it.
+
+    Parameters
+    ----------
+    reader : WebMercatorReader
+    basemap_image : uint8 array of shape (height, width, 4), SharedImage, or None
+    aoi_image : uint8 array of shape (height, width, 4), SharedImage, or None
+    group : int
+        pixel layer group
+    layers : list of (id, offset, bits, value_shift, colors)
+    cancellation : Cancellation, optional (default: None)
+        If not None, raises JobCancelledError if cancelled, and maps are
+        skipped once its time budget is exceeded
+
+    Returns
+    -------
+    list of (id, bytes, bool)
+        PNG bytes are None if map could not be rendered, does not overlap
+        bounds, or was skipped; bool is True if the map was skipped
+    """
+    if cancellation is not None:
+        cancellation.check()
+
+        if cancellation.over_budget():
+            return [(layer[0], None, True) for layer in layers]
+
+    with rasterio.open(get_group_filename(group)) as src:
+        data = reader.read(src)
+
+    results = []
+    with image_array(basemap_image) as basemap, image_array(aoi_image) as aoi:
+        for id, offset, bits, value_shift, colors in layers:
+            if cancellation is not None:
+                cancellation.check()
+
+                if cancellation.over_budget():
+                    results.append((id, None, True))
+                    continue
+
+            map_image = render_data(
+                decode(data, offset, bits, value_shift),
+                NODATA,
+                reader,
+                colors,
+                basemap,
+                aoi,
+            )
+            map_image = to_png_bytes(map_image, colors=MAP_PNG_COLORS)
+            results.append((id, map_image, False))
+
+        # release views of shared memory before it is closed
+        del basemap, aoi
+
+    return results
 
 
 async def render_raster_maps(
@@ -79,9 +205,21 @@ async def render_raster_maps(
     slr=False,
     urban=False,
     wildfire_risk=False,
+    cancellation=None,
+    executor=None,
 ):
     """Asynchronously render Raster maps.
 
+    Each map is rendered end-to-end (read, colorize, composite, and encode) in
+    the map rendering process pool of the worker if it was started, otherwise
+    in threads.  The basemap and area of interest images are converted to RGBA
+    arrays once for all maps; when using processes, these are shared with the
+    processes via shared memory.
+
+    If MAP_RASTER_SOURCE is "pixel_layers", maps are rendered from bit-packed
+    pixel layers instead of individual layers, and each group of pixel layers
+    is read once for all maps in that group.
+
     Parameters
     ----------
     reader : WebMercatorReader
@@ -100,16 +238,23 @@ async def render_raster_maps(
         if True, will render urban map
     wildfire_risk : bool (default False)
         if True, will render wildfire_risk map
+    cancellation : Cancellation, optional (default: None)
+        If not None, is checked before rendering each map; maps that are
+        skipped because its time budget was exceeded have an error of
+        TIME_BUDGET_EXCEEDED
+    executor : Executor, optional (default: None)
+        If present, is used instead of the map rendering process pool or
+        MAP_RENDER_THREADS threads (e.g., for benchmarks)
 
     Returns
     -------
     dict, dict
         tuple of (maps, errors) keyed by map ID
     """
-    executor = ThreadPoolExecutor(max_workers=MAP_RENDER_THREADS)
-    loop = asyncio.get_event_loop()
-
-    base_args = (reader, basemap_image, aoi_image)
+    if executor is None:
+        executor = get_map_process_pool() or ThreadPoolExecutor(
+            max_workers=MAP_RENDER_THREADS
+        )
 
     task_args = [("blueprint", blueprint_filename, BLUEPRINT_COLORS)]
 
@@ -150,23 +295,61 @@ async def render_raster_maps(
         colors = WILDFIRE_RISK_COLORS
         task_args.append(("wildfire_risk", wildfire_risk_filename, colors))
 
-    # NOTE: have to have handle on pending or task loop gets closed too soon
-    completed, pending = await asyncio.wait(
-        [
-            loop.run_in_executor(executor, render_raster_map, *base_args, *args)
-            for args in task_args
-        ]
-    )
+    pixel_layer_groups = {}
+    if MAP_RASTER_SOURCE == "pixel_layers":
+        pixel_layer_groups, task_args = group_by_pixel_layers(task_args)
+
+    basemap_image = to_rgba_array(basemap_image)
+    aoi_image = to_rgba_array(aoi_image)
+
+    images = [basemap_image, aoi_image]
+    if not isinstance(executor, ProcessPoolExecutor):
+        # threads share memory with this process
+        images = []
+
+    with share_images(*images) as shared:
+        if shared:
+            basemap_image, aoi_image = shared
+
+        base_args = (reader, basemap_image, aoi_image)
+
+        # NOTE: have to have handle on pending or task loop gets closed too soon
+        completed, pending = await asyncio.wait(
+            [
+                submit(
+                    executor,
+                    partial(render_raster_map, cancellation=cancellation),
+                    *base_args,
+                    *args,
+                )
+                for args in task_args
+            ]
+            + [
+                submit(
+                    executor,
+                    partial(render_pixel_layer_maps, cancellation=cancellation),
+                    *base_args,
+                    group,
+                    layers,
+                )
+                for group, layers in pixel_layer_groups.items()
+            ]
+        )
 
-    results = [t.result() for t in completed]
-    maps = {k: v for k, v in results if v is not None}
+    results = []
+    for t in completed:
+        result = t.result()
+        # maps for pixel layer groups are returned as a list
+        results.extend(result if isinstance(result, list) else [result])
+    maps = {k: v for k, v, _ in results if v is not None}
 
-    # TODO: capture and return errors
-    errors = {}
+    # TODO: capture and return other errors
+    errors = {k: TIME_BUDGET_EXCEEDED for k, _, skipped in results if skipped}
 
     return maps, errors
 
 
+@timed("render_maps")
 async def render_maps(
     bounds,
     geometry=None,
@@ -179,6 +362,7 @@ async def render_maps(
     urban=False,
     wildfire_risk=False,
     add_mask=False,
+    cancellation=None,
 ):
     """Render maps for locator and each raster dataset that overlaps with area
     of interest.
@@ -207,6 +391,9 @@ async def render_maps(
         If True, wildfire risk will be rendered.
     add_mask : bool, optional (default: False)
         If True, will add a light transparent mask outside geometry
+    cancellation : Cancellation, optional (default: None)
+        If not None, raises JobCancelledError if cancelled, and raster maps
+        are skipped once its time budget is exceeded
 
     Returns
     -------
@@ -226,47 +413,68 @@ async def render_maps(
     bounds = get_map_bounds(center, zoom, WIDTH, HEIGHT)
     raster_map_reader = WebMercatorReader(bounds, WIDTH, HEIGHT)
 
-    locator_image, error = get_locator_map_image(
-        *center, bounds=bounds, geometry=geometry
-    )
+    if cancellation is not None:
+        cancellation.check()
+
+    # basemap, area of interest, and locator maps are rendered and encoded in
+    # a thread so that they do not block the event loop of the worker (e.g.,
+    # heartbeats and progress updates) while waiting on remote tiles or
+    # rendering; maps are checked out of a thread-safe pool
+    with stage_timer("render_locator"):
+        locator_image, error = await asyncio.to_thread(
+            get_locator_map_image, *center, bounds=bounds, geometry=geometry
+        )
     if error:
         errors["locator"] = error
     else:
         maps["locator"] = locator_image
 
-    basemap_image, error = get_basemap_image(center, zoom, WIDTH, HEIGHT)
+    with stage_timer("render_basemap"):
+        basemap_image, error = await asyncio.to_thread(
+            get_basemap_image, center, zoom, WIDTH, HEIGHT
+        )
     if error:
         errors["basemap"] = error
 
     aoi_image = None
 
     if geometry:
-        aoi_image, error = get_aoi_map_image(
-            geometry, center, zoom, WIDTH, HEIGHT, add_mask=add_mask
-        )
+        with stage_timer("render_aoi"):
+            aoi_image, error = await asyncio.to_thread(
+                get_aoi_map_image,
+                geometry,
+                center,
+                zoom,
+                WIDTH,
+                HEIGHT,
+                add_mask=add_mask,
+            )
         if error:
             errors["aoi"] = error
 
     elif summary_unit_id:
-        aoi_image, error = get_summary_unit_map_image(
-            summary_unit_id, center, zoom, WIDTH, HEIGHT
-        )
+        with stage_timer("render_aoi"):
+            aoi_image, error = await asyncio.to_thread(
+                get_summary_unit_map_image, summary_unit_id, center, zoom, WIDTH, HEIGHT
+            )
         if error:
             errors["aoi"] = error
 
     # Use background threads for rendering rasters
-    raster_maps, raster_map_errors = await render_raster_maps(
-        raster_map_reader,
-        basemap_image,
-        aoi_image,
-        indicators=indicators or [],
-        corridors=corridors,
-        parcas=parcas,
-        protected_areas=protected_areas,
-        slr=slr,
-        urban=urban,
-        wildfire_risk=wildfire_risk,
-    )
+    with stage_timer("render_raster_maps"):
+        raster_maps, raster_map_errors = await render_raster_maps(
+            raster_map_reader,
+            basemap_image,
+            aoi_image,
+            indicators=indicators or [],
+            corridors=corridors,
+            parcas=parcas,
+            protected_areas=protected_areas,
+            slr=slr,
+            urban=urban,
+            wildfire_risk=wildfire_risk,
+            cancellation=cancellation,
+        )
 
     maps.update(raster_maps)
     errors.update(raster_map_errors)
@@ -1,6 +1,3 @@
-from base64 import b64decode
-from copy import deepcopy
-from io import BytesIO
 import json
 import logging
 
@@ -11,6 +8,8 @@ import shapely
 from analysis.lib.geometry import to_dict
 from api.settings import TILE_DIR
 
+from .renderer import EMPTY_GEOJSON, add_crosshatch, pool
+
 
 log = logging.getLogger(__name__)
 
@@ -18,6 +17,7 @@ STYLE = {
     "version": 8,
     "sources": {
         "aoi": {"type": "geojson", "tolerance": 0.1, "data": ""},
+        "aoi_mask": {"type": "geojson", "data": ""},
         "mask": {
             "type": "vector",
             "url": f"mbtiles://{TILE_DIR}/se_mask.mbtiles",
@@ -39,6 +39,13 @@ STYLE = {
             "type": "fill",
             "paint": {"fill-pattern": "crosshatch", "fill-opacity": 0.25},
         },
+        {
+            "id": "aoi-mask-fill",
+            "source": "aoi_mask",
+            "source-layer": "aoi_mask",
+            "type": "fill",
+            "paint": {"fill-color": "#FFFFFF", "fill-opacity": 0.5},
+        },
         {
             "id": "aoi",
             "source": "aoi",
@@ -49,6 +56,12 @@ STYLE = {
 }
 
 
+def create_map(width, height):
+    map = Map(json.dumps(STYLE), width, height, 1, 0, 0, zoom=0)
+    add_crosshatch(map, sdf=False)
+    return map
+
+
 def get_aoi_map_image(geometry, center, zoom, width, height, add_mask=True):
     """Create a rendered map image of the area of interest.
 
@@ -69,44 +82,23 @@ def get_aoi_map_image(geometry, center, zoom, width, height, add_mask=True):
     Image object
     """
 
-    style = deepcopy(STYLE)
-    style["sources"]["aoi"]["data"] = to_dict(geometry)
-
+    mask = EMPTY_GEOJSON
     if add_mask:
         try:
-            mask = shapely.difference(shapely.box(-180, -90, 180, 90), geometry)
-            style["sources"]["aoi_mask"] = {"type": "geojson", "data": to_dict(mask)}
-            style["layers"].insert(
-                -1,  # make sure that boundary layer is on top
-                {
-                    "id": "aoi-mask-fill",
-                    "source": "aoi_mask",
-                    "source-layer": "aoi_mask",
-                    "type": "fill",
-                    "paint": {"fill-color": "#FFFFFF", "fill-opacity": 0.5},
-                },
+            mask = json.dumps(
+                to_dict(shapely.difference(shapely.box(-180, -90, 180, 90), geometry))
             )
         except Exception as ex:
             log.error(f"could not create mask around area of interest {str(ex)}")
 
     try:
-        map = Map(json.dumps(style), width, height, 1, *center, zoom=zoom)
-
-        # pattern generated using http://www.patternify.com/ on 10x10 grid
-        crosshatch_png = b64decode(
-            "iVBORw0KGgoAAAANSUhEUgAAAAoAAAAKCAYAAACNMs+9AAAAAXNSR0IArs4c6QAAADpJREFUKFONzEsKADAIA9Hk/oe2WGjpR6OzfgzRy9hwBoAVnMhnCm6k4IUy+KEIhuiFKTqhRAuWyOEA/DwKCnfY+F8AAAAASUVORK5CYII="
-        )
-        crosshatch_bytes = Image.open(BytesIO(crosshatch_png)).tobytes()
-        map.addImage(
-            "crosshatch",
-            crosshatch_bytes,
-            10,
-            10,
-            2.0,
-            False,
-        )
-
-        return Image.frombytes("RGBA", (width, height), map.renderBuffer()), None
+        with pool.get(("aoi", width, height), lambda: create_map(width, height)) as map:
+            map.setCenter(*center)
+            map.setZoom(zoom)
+            map.setGeoJSON("aoi", json.dumps(to_dict(geometry)))
+            map.setGeoJSON("aoi_mask", mask)
+
+            return Image.frombytes("RGBA", (width, height), map.renderBuffer()), None
 
     except Exception as ex:
         return None, f"Error generating aoi image ({type(ex)}): {ex}"
@@ -1,36 +1,170 @@
+"""Render basemap images for report maps.
+
+Basemaps are rendered using the Mapbox light style, or a local style
+(BASEMAP_STYLE) for rendering without network access.
+
+Rendered basemap images are cached on disk by center, zoom, size, and style
+version, so that maps for the same extent (e.g., summary units) do not fetch
+and render remote tiles each time.  The cache is shared by all workers and
+least recently used images are evicted once it exceeds BASEMAP_CACHE_SIZE_MB.
+Cache misses are rendered using pooled maps (see renderer.py).
+"""
+
+from functools import cache
+from hashlib import sha256
+from io import BytesIO
 import json
+import logging
+import os
+import tempfile
 
 from PIL import Image
 from pymgl import Map
 
-from api.settings import MAPBOX_ACCESS_TOKEN
+from api.metrics import count_cache_lookup
+from api.settings import (
+    BASEMAP_CACHE_DIR,
+    BASEMAP_CACHE_SIZE_MB,
+    BASEMAP_STYLE,
+    LOGGING_LEVEL,
+    MAPBOX_ACCESS_TOKEN,
+)
 
+from .renderer import pool
+
+
+log = logging.getLogger(__name__)
+log.setLevel(LOGGING_LEVEL)
+
+
+MAPBOX_STYLE = "mapbox://styles/mapbox/light-v9"
+
+# increment when changes to rendering (e.g., layer filters) should invalidate
+# cached basemaps
+BASEMAP_VERSION = 1
+
+
+@cache
+def get_style():
+    """Get the style used to render basemaps and its version.
+
+    Returns
+    -------
+    (str, str)
+        tuple of style URL or JSON, version
+    """
+    if BASEMAP_STYLE:
+        with open(BASEMAP_STYLE) as infile:
+            style = infile.read()
+
+        return style, sha256(style.encode("UTF8")).hexdigest()[:16]
+
+    return MAPBOX_STYLE, MAPBOX_STYLE
+
+
+def get_cache_path(center, zoom, width, height):
+    _, style_version = get_style()
+    key = "|".join(
+        [
+            str(BASEMAP_VERSION),
+            style_version,
+            f"{center[0]:.6f}",
+            f"{center[1]:.6f}",
+            f"{zoom:.4f}",
+            str(width),
+            str(height),
+        ]
+    )
+    return BASEMAP_CACHE_DIR / f"{sha256(key.encode('UTF8')).hexdigest()}.png"
 
-def get_basemap_image(center, zoom, width, height):
-    """Create a rendered map image of the basemap.
+
+def read_cached_basemap(path):
+    """Read a cached basemap image, if it exists.
 
     Parameters
     ----------
-    center : [longitude, latitude]
-    zoom : float
-    width : int
-        map width
-    height : int
-        map height
+    path : Path
 
     Returns
     -------
-    Image object
+    Image object or None
     """
+    try:
+        with open(path, "rb") as infile:
+            img = Image.open(BytesIO(infile.read())).convert("RGBA")
+
+        # update modification time to track least recently used images
+        os.utime(path)
 
+        return img
+
+    except FileNotFoundError:
+        return None
+
+    except Exception as ex:
+        log.error(f"Error reading cached basemap {path}: {ex}")
+        return None
+
+
+def write_cached_basemap(path, img):
+    """Write a basemap image to the cache, then evict least recently used
+    images if the cache exceeds BASEMAP_CACHE_SIZE_MB.
+
+    Parameters
+    ----------
+    path : Path
+    img : Image object
+    """
     try:
+        path.parent.mkdir(exist_ok=True, parents=True)
+
+        # write to a temporary file so that other workers never read a partial
+        # image
+        fp, tmp_name = tempfile.mkstemp(suffix=".png", dir=path.parent)
+        with open(fp, "wb") as out:
+            img.save(out, format="PNG", compress_level=1)
+
+        os.replace(tmp_name, path)
+
+        entries = []
+        for entry in os.scandir(path.parent):
+            if entry.name.endswith(".png"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(e[1] for e in entries)
+        max_size = BASEMAP_CACHE_SIZE_MB * 1024 * 1024
+        for _, entry_size, entry_path in sorted(entries):
+            if size <= max_size:
+                break
+
+            try:
+                os.unlink(entry_path)
+            except FileNotFoundError:
+                pass
+
+            size -= entry_size
+
+    except Exception as ex:
+        log.error(f"Error caching basemap {path}: {ex}")
+
+
+def create_map(width, height):
+    style, _ = get_style()
+
+    if BASEMAP_STYLE:
+        map = Map(style, width, height, 1, 0, 0, zoom=0)
+        map.load()
+
+    else:
         map = Map(
-            "mapbox://styles/mapbox/light-v9",
+            style,
             width,
             height,
             1,
-            *center,
-            zoom=zoom,
+            0,
+            0,
+            zoom=0,
             provider="mapbox",
             token=MAPBOX_ACCESS_TOKEN,
         )
@@ -50,9 +184,51 @@ def get_basemap_image(center, zoom, width, height):
             ),
         )
 
+    return map
+
+
+def render_basemap_image(center, zoom, width, height):
+    with pool.get(("basemap", width, height), lambda: create_map(width, height)) as map:
+        map.setCenter(*center)
+        map.setZoom(zoom)
         img_data = map.renderBuffer()
 
-        return Image.frombytes("RGBA", (width, height), img_data), None
+    return Image.frombytes("RGBA", (width, height), img_data)
+
+
+def get_basemap_image(center, zoom, width, height):
+    """Create a rendered map image of the basemap.
+
+    Parameters
+    ----------
+    center : [longitude, latitude]
+    zoom : float
+    width : int
+        map width
+    height : int
+        map height
+
+    Returns
+    -------
+    Image object
+    """
+
+    try:
+        path = None
+        if BASEMAP_CACHE_SIZE_MB > 0:
+            path = get_cache_path(center, zoom, width, height)
+            img = read_cached_basemap(path)
+            count_cache_lookup("basemap", img is not None)
+
+            if img is not None:
+                return img, None
+
+        img = render_basemap_image(center, zoom, width, height)
 
     except Exception as ex:
         return None, f"Error generating basemap image ({type(ex)}): {ex}"
+
+    if path is not None:
+        write_cached_basemap(path, img)
+
+    return img, None
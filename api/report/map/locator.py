@@ -1,11 +1,23 @@
-from copy import deepcopy
+"""Render locator map images.
+
+The locator map is a fixed view of the Southeast; only the marker or outline
+of the area of interest differs between reports.  The base map is rendered once
+per process and cached, and the area of interest is drawn over it for each
+report.
+"""
+
+from functools import cache
 import json
 
+import numpy as np
+from PIL import Image, ImageDraw
 from pymgl import Map
 import shapely
 
-from api.settings import MAPBOX_ACCESS_TOKEN, TILE_DIR
-from analysis.lib.geometry import to_dict
+from api.settings import MAP_PNG_COLORS, MAPBOX_ACCESS_TOKEN, TILE_DIR
+
+from .mercator import to_tile_px
+from .util import to_png_bytes
 
 
 CENTER = [-85.941, 29.283]
@@ -13,6 +25,14 @@ ZOOM = 2.25
 WIDTH = 300
 HEIGHT = 200
 
+# area of interest is drawn at this multiple of the image size and then
+# downsampled to antialias it
+SUPERSAMPLE = 4
+MARKER_COLOR = "#FF0000"
+MARKER_RADIUS = 4
+OUTLINE_COLOR = "#FF0000"
+OUTLINE_WIDTH = 3
+
 
 LOCATOR_STYLE = {
     "version": 8,
@@ -71,26 +91,95 @@ LOCATOR_STYLE = {
             "type": "line",
             "paint": {"line-color": "#333333", "line-width": 0.75},
         },
-        {
-            "id": "marker",
-            "source": "marker",
-            "type": "circle",
-            "paint": {
-                "circle-color": "#FF0000",
-                "circle-radius": 4,
-                "circle-opacity": 1,
-            },
-        },
-        {
-            "id": "feature-outline",
-            "source": "feature",
-            "type": "line",
-            "paint": {"line-color": "#FF0000", "line-width": 3, "line-opacity": 1},
-        },
     ],
 }
 
 
+def create_map():
+    return Map(
+        json.dumps(LOCATOR_STYLE),
+        WIDTH,
+        HEIGHT,
+        1,
+        *CENTER,
+        zoom=ZOOM,
+        token=MAPBOX_ACCESS_TOKEN,
+        provider="mapbox",
+    )
+
+
+@cache
+def get_locator_base_image():
+    """Render the locator map without an area of interest; this is rendered
+    once per process.
+
+    Returns
+    -------
+    Image object
+    """
+    map = create_map()
+    return Image.frombytes("RGBA", (WIDTH, HEIGHT), map.renderBuffer())
+
+
+def to_image_px(coords):
+    """Project longitude, latitude coordinates to pixel coordinates of the
+    supersampled locator image.
+
+    Parameters
+    ----------
+    coords : ndarray of shape (n, 2)
+
+    Returns
+    -------
+    ndarray of shape (n, 2)
+    """
+    # same as to_tile_px at ZOOM + 1 (512px tiles)
+    size = 256 * 2 ** (ZOOM + 1)
+    cx, cy = to_tile_px(*CENTER, ZOOM + 1)
+    f = np.clip(np.sin(np.radians(coords[:, 1])), -0.9999, 0.9999)
+    x = size / 2 + coords[:, 0] * size / 360
+    y = size / 2 - 0.5 * np.log((1 + f) / (1 - f)) * size / (2 * np.pi)
+
+    return np.column_stack(
+        [(x - cx + WIDTH / 2) * SUPERSAMPLE, (y - cy + HEIGHT / 2) * SUPERSAMPLE]
+    )
+
+
+def render_overlay(marker=None, feature=None):
+    """Draw the marker or outline of the area of interest.
+
+    Parameters
+    ----------
+    marker : (longitude, latitude), optional (default: None)
+    feature : shapely.Geometry, optional (default: None)
+        polygon(s) in geographic coordinates
+
+    Returns
+    -------
+    Image object
+        transparent RGBA image of the same size as the locator map
+    """
+    img = Image.new("RGBA", (WIDTH * SUPERSAMPLE, HEIGHT * SUPERSAMPLE))
+    draw = ImageDraw.Draw(img)
+
+    if marker is not None:
+        x, y = to_image_px(np.array([marker]))[0]
+        r = MARKER_RADIUS * SUPERSAMPLE
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=MARKER_COLOR)
+
+    if feature is not None:
+        feature = shapely.transform(feature, to_image_px)
+        for ring in shapely.get_rings(shapely.get_parts(feature)):
+            draw.line(
+                [tuple(c) for c in shapely.get_coordinates(ring)],
+                fill=OUTLINE_COLOR,
+                width=OUTLINE_WIDTH * SUPERSAMPLE,
+                joint="curve",
+            )
+
+    return img.resize((WIDTH, HEIGHT), Image.Resampling.BOX)
+
+
 def get_locator_map_image(longitude, latitude, bounds, geometry=None):
     """
     Create a rendered locator map image.
@@ -99,6 +188,9 @@ def get_locator_map_image(longitude, latitude, bounds, geometry=None):
     otherwise a box covering the bounds will be rendered.  Otherwise, a
     representative point will be displayed on the map.
 
+    The area of interest is drawn over a cached base map image, so that the
+    locator map is not rendered for each report.
+
     Parameters
     ----------
     latitude : float
@@ -117,7 +209,8 @@ def get_locator_map_image(longitude, latitude, bounds, geometry=None):
         PNG image bytes
     """
 
-    style = deepcopy(LOCATOR_STYLE)
+    marker = None
+    feature = None
 
     xmin, ymin, xmax, ymax = bounds
 
@@ -129,35 +222,21 @@ def get_locator_map_image(longitude, latitude, bounds, geometry=None):
     if xmax - xmin >= 0.5 or ymax - ymin >= 0.5:
         if geometry:
             if shapely.area(geometry) > 0.1:
-                geojson = to_dict(geometry)
+                feature = geometry
             else:
-                geojson = to_dict(shapely.envelope(geometry))
+                feature = shapely.envelope(geometry)
         else:
-            geojson = to_dict(shapely.box(xmin, ymin, xmax, ymax))
-
-        style["sources"]["feature"] = {"type": "geojson", "data": geojson}
+            feature = shapely.box(xmin, ymin, xmax, ymax)
 
     else:
-        style["sources"]["marker"] = {
-            "type": "geojson",
-            "tolerance": 0.1,
-            "data": {"type": "Point", "coordinates": [longitude, latitude]},
-        }
+        marker = (longitude, latitude)
 
     try:
-        return (
-            Map(
-                json.dumps(style),
-                WIDTH,
-                HEIGHT,
-                1,
-                *CENTER,
-                zoom=ZOOM,
-                token=MAPBOX_ACCESS_TOKEN,
-                provider="mapbox",
-            ).renderPNG(),
-            None,
+        img = Image.alpha_composite(
+            get_locator_base_image(), render_overlay(marker, feature)
         )
 
+        return to_png_bytes(img, colors=MAP_PNG_COLORS), None
+
     except Exception as ex:
         return None, f"Error generating locator image ({type(ex)}): {ex}"
@@ -0,0 +1,129 @@
+"""Read raster layers for report maps from bit-packed pixel layers.
+
+All indicators and core layers are packed into a small number of uint32
+rasters by group (see analysis/prep/tiles/encode_pixel_layers.py), which are
+pre-warped to Web Mercator for report maps (see
+analysis/prep/prepare_map_rasters.py).  Each group is read once for all maps in
+that group, and each layer is decoded from it using its bit offset.
+"""
+
+from functools import cache
+import logging
+
+import numpy as np
+import pandas as pd
+
+from api.settings import LOGGING_LEVEL
+
+from .raster import map_dir
+
+
+log = logging.getLogger(__name__)
+log.setLevel(LOGGING_LEVEL)
+
+
+pixel_layers_dir = map_dir / "pixel_layers"
+encoding_filename = pixel_layers_dir / "encoding.feather"
+
+# map IDs that are different from the IDs of pixel layers
+PIXEL_LAYER_IDS = {
+    "protected_areas": "protectedAreas",
+    "urban_2060": "urban",
+    "wildfire_risk": "wildfireRisk",
+}
+
+# NODATA value of decoded layers; decoded values are always less than this
+NODATA = np.uint8(255)
+
+
+@cache
+def get_encoding():
+    """Get the group, bit offset, number of bits, and value shift of each
+    pixel layer.
+
+    Returns
+    -------
+    dict
+        {<pixel layer ID>: (group, offset, bits, value_shift), ...}; empty if
+        pixel layers have not been prepared for maps
+    """
+    try:
+        df = pd.read_feather(encoding_filename).set_index("id")
+
+    except FileNotFoundError:
+        log.error(
+            f"Pixel layer encoding {encoding_filename} not found; maps are rendered from individual layers"
+        )
+        return {}
+
+    return {
+        id: (int(row.group), int(row.offset), int(row.bits), int(row.value_shift))
+        for id, row in df.iterrows()
+    }
+
+
+def get_group_filename(group):
+    return pixel_layers_dir / f"se_pixel_layers_{group}.tif"
+
+
+def group_by_pixel_layers(task_args):
+    """Group map tasks by the pixel layer group that contains their layer.
+
+    Parameters
+    ----------
+    task_args : list of (id, path, colors)
+
+    Returns
+    -------
+    (dict, list)
+        tuple of ({<group>: [(id, offset, bits, value_shift, colors), ...]},
+        list of (id, path, colors) for layers not found in pixel layers)
+    """
+    encoding = get_encoding()
+
+    groups = {}
+    remaining = []
+    for id, path, colors in task_args:
+        layer = encoding.get(PIXEL_LAYER_IDS.get(id, id))
+        if layer is None:
+            remaining.append((id, path, colors))
+            continue
+
+        group, offset, bits, value_shift = layer
+        groups.setdefault(group, []).append(
+            (id, offset, bits, value_shift, colors)
+        )
+
+    return groups, remaining
+
+
+def decode(data, offset, bits, value_shift):
+    """Decode the values of a layer from bit-packed pixel layer data.
+
+    Parameters
+    ----------
+    data : 2D uint32 array or None
+    offset : int
+        bit offset of layer
+    bits : int
+        number of bits of layer
+    value_shift : int
+        amount added to values of layer when encoded
+
+    Returns
+    -------
+    2D uint8 array or None
+        None if layer has no data; NODATA where layer has no data
+    """
+    if data is None:
+        return None
+
+    values = (data >> np.uint32(offset)) & np.uint32((1 << bits) - 1)
+    ix = values > 0
+    if not ix.any():
+        return None
+
+    out = np.full(values.shape, NODATA, dtype="uint8")
+    out[ix] = values[ix] - value_shift
+
+    return out
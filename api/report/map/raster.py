@@ -2,35 +2,58 @@ import math
 from pathlib import Path
 import warnings
 
-from affine import Affine
 import numba as nb
 import numpy as np
 from PIL import Image
-import rasterio
 from rasterio.enums import Resampling
 from rasterio import windows
-from rasterio.warp import (
-    transform_bounds,
-    calculate_default_transform,
-    reproject,
-)
+from rasterio.warp import transform_bounds
+import rasterio
 
-from analysis.constants import DATA_CRS, MAP_CRS, GEO_CRS, STANDARD_RESOLUTION
-from analysis.lib.raster import get_window, window_overlaps, shift_window
+from analysis.constants import MAP_CRS, MAP_RASTER_MAX_ZOOM, GEO_CRS
+from analysis.lib.raster import clip_window
 
-from .mercator import get_map_scale
+from .mercator import A, get_map_scale
 
 # silence rasterio warnings not applicable here
 warnings.filterwarnings("ignore", message=".*Dataset has no geotransform.*")
 
-data_dir = Path("data/inputs")
-extent_filename = data_dir / "boundaries/blueprint_extent.tif"
+# rasters used in maps are pre-warped to Web Mercator with overviews at each
+# zoom level (see analysis/prep/prepare_map_rasters.py)
+map_dir = Path("data/inputs/map")
+
+# distance from origin of Web Mercator to edge of tile grid, in meters
+MERCATOR_ORIGIN = math.pi * A
+
+# used in place of a basemap or area of interest image that is not present
+EMPTY_RGBA = np.zeros((0, 0, 4), dtype="uint8")
+
+
+def get_mercator_resolution(zoom, tile_size=256):
+    """Get the resolution of the Web Mercator tile grid at a zoom level.
+
+    Parameters
+    ----------
+    zoom : int
+    tile_size : int, optional (default 256)
+
+    Returns
+    -------
+    float
+        meters per pixel (at the equator)
+    """
+    return 2 * MERCATOR_ORIGIN / (tile_size * 2**zoom)
 
 
 class WebMercatorReader(object):
     def __init__(self, geo_bounds, width, height):
         """Construct WebMercatorReader for bounds and dimensions
 
+        Datasets pre-warped to the Web Mercator tile grid share the same pixel
+        grid at each zoom level, so the index of the source pixel for each
+        output pixel is calculated once here and reused to read every
+        dataset.
+
         Parameters
         ----------
         geo_bounds : list-like of [xmin,ymin,xmax,ymax]
@@ -40,44 +63,91 @@ class WebMercatorReader(object):
         height : int
             output image height
         """
-        self._transform_cache = {}
-
         self.geo_bounds = geo_bounds
         self.width = width
         self.height = height
         self.scale = get_map_scale(geo_bounds, width)
-        self.data_bounds = transform_bounds(
-            GEO_CRS, DATA_CRS, *geo_bounds, densify_pts=21
-        )
         self.mercator_bounds = transform_bounds(
             GEO_CRS, MAP_CRS, *geo_bounds, densify_pts=21
         )
 
-        # For smoother rendering, we want between 2 and 4 data pixels per
-        # screen pixel.
-        # ratio is number of data pixels per screen pixels
-        pixel_ratio = self.scale["resolution"] / STANDARD_RESOLUTION
-        self.densify = max(2, min(4, math.ceil(1.0 / pixel_ratio)))
-
-        # NOTE: we calculate the ratios based on overviews of [2,4,8,16,32,64]
-        # in order to get 2 screen pixels per data pixel
-        self.scale_factor = 1
-        for factor in [32, 16, 8, 4, 2]:
-            if pixel_ratio // factor >= 2:
-                self.scale_factor = factor
-                break
-
-        with rasterio.open(extent_filename) as src:
-            self.dataset_transform = src.transform
-            self.window = get_window(src, self.data_bounds, boundless=True)
-            self.window_transform = src.window_transform(self.window)
-            self.read_shape = (
-                int(self.window.height / self.scale_factor),
-                int(self.window.width / self.scale_factor),
-            )
+        # use the lowest zoom level with at least one data pixel per output
+        # pixel
+        xmin, _, xmax, _ = self.mercator_bounds
+        resolution = (xmax - xmin) / width
+        zoom = math.ceil(math.log2(get_mercator_resolution(0) / resolution))
+        self.zoom = max(0, min(zoom, MAP_RASTER_MAX_ZOOM))
+
+        self._index_cache = {self.zoom: self._get_pixel_index(self.zoom)}
+
+    def _get_pixel_index(self, zoom):
+        """Calculate the row and column in the Web Mercator tile grid at zoom
+        of the pixel at the center of each row and column of the output image.
+
+        Parameters
+        ----------
+        zoom : int
+
+        Returns
+        -------
+        (ndarray of shape (height, ), ndarray of shape (width, ))
+            rows, cols
+        """
+        resolution = get_mercator_resolution(zoom)
+        xmin, ymin, xmax, ymax = self.mercator_bounds
+        x = xmin + (np.arange(self.width) + 0.5) * ((xmax - xmin) / self.width)
+        y = ymax - (np.arange(self.height) + 0.5) * ((ymax - ymin) / self.height)
+
+        cols = np.floor((x + MERCATOR_ORIGIN) / resolution).astype("int64")
+        rows = np.floor((MERCATOR_ORIGIN - y) / resolution).astype("int64")
+
+        return rows, cols
+
+    def _get_zoom_level(self, dataset):
+        """Get the zoom level and overview level of dataset used to read
+        data.
+
+        Parameters
+        ----------
+        dataset : open Rasterio dataset
+
+        Returns
+        -------
+        (int, int)
+            zoom level and overview level (None for full resolution) or
+            (None, None) if dataset is not aligned to the Web Mercator tile grid
+        """
+        transform = dataset.transform
+        if dataset.crs != MAP_CRS or transform.b != 0 or transform.d != 0:
+            return None, None
+
+        full_zoom = math.log2(get_mercator_resolution(0) / transform.a)
+        col_off = (transform.c + MERCATOR_ORIGIN) / transform.a
+        row_off = (MERCATOR_ORIGIN - transform.f) / transform.a
+        if any(abs(v - round(v)) > 1e-6 for v in (full_zoom, col_off, row_off)):
+            return None, None
+
+        full_zoom = round(full_zoom)
+
+        # use the closest available overview that is not coarser than zoom
+        factors = dataset.overviews(1)
+        factor = 2 ** max(full_zoom - self.zoom, 0)
+        while factor > 1 and factor not in factors:
+            factor //= 2
+
+        level = factors.index(factor) if factor > 1 else None
+
+        return full_zoom - int(math.log2(factor)), level
 
     def read(self, dataset):
-        """Read and warp data into Web Mercator
+        """Read data from a dataset in Web Mercator, resampled to the output
+        image dimensions.
+
+        Dataset must be pre-warped to Web Mercator.  If it is aligned to the
+        Web Mercator tile grid and has an overview for the zoom level of the
+        map, data are read from that overview and each output pixel is
+        selected from these using the pixel index of the reader; otherwise data
+        are resampled (nearest neighbor) when read.
 
         Parameters
         ----------
@@ -87,102 +157,113 @@ class WebMercatorReader(object):
         -------
         ndarray of shape (height, width)
         """
-        if dataset.transform == self.dataset_transform:
-            read_window = self.window
+        zoom, level = self._get_zoom_level(dataset)
 
-        else:
-            read_window = shift_window(
-                self.window, self.window_transform, dataset.transform
-            )
-            if not window_overlaps(read_window, dataset):
-                return None
+        # resample when reading if dataset is not aligned to the tile grid, or
+        # does not have an overview for the zoom level of the map, instead of
+        # reading all pixels at full resolution
+        if zoom is None or zoom > self.zoom:
+            return self._read_resampled(dataset)
 
-        data = dataset.read(
-            1,
-            window=read_window,
-            boundless=True,
-            fill_value=dataset.nodata,
-            out_shape=self.read_shape,
+        if zoom not in self._index_cache:
+            self._index_cache[zoom] = self._get_pixel_index(zoom)
+
+        if level is not None:
+            with rasterio.open(dataset.name, overview_level=level) as src:
+                return self._read_indexed(src, *self._index_cache[zoom])
+
+        return self._read_indexed(dataset, *self._index_cache[zoom])
+
+    def _read_indexed(self, dataset, rows, cols):
+        """Read data for output pixels from dataset using the rows and columns
+        of the Web Mercator tile grid at the resolution of dataset.
+
+        Parameters
+        ----------
+        dataset : open Rasterio dataset
+        rows : ndarray of shape (height, )
+        cols : ndarray of shape (width, )
+
+        Returns
+        -------
+        ndarray of shape (height, width)
+        """
+        # shift index from tile grid to dataset
+        transform = dataset.transform
+        rows = rows - round((MERCATOR_ORIGIN - transform.f) / transform.a)
+        cols = cols - round((transform.c + MERCATOR_ORIGIN) / transform.a)
+
+        row_ix = (rows >= 0) & (rows < dataset.height)
+        col_ix = (cols >= 0) & (cols < dataset.width)
+        if not (row_ix.any() and col_ix.any()):
+            return None
+
+        rows = rows[row_ix]
+        cols = cols[col_ix]
+        row_off = rows.min()
+        col_off = cols.min()
+        window = windows.Window(
+            col_off, row_off, cols.max() - col_off + 1, rows.max() - row_off + 1
         )
+        src = dataset.read(1, window=window)
 
         nodata = getattr(np, dataset.dtypes[0])(dataset.nodata)
+        data = np.full((self.height, self.width), nodata, dtype=src.dtype)
+        data[np.ix_(row_ix, col_ix)] = src[np.ix_(rows - row_off, cols - col_off)]
+
         if not np.any(data != nodata):
-            # entire area is nodata, no point in warping nodata pixels
+            # entire area is nodata
             return None
 
-        read_window_bounds = dataset.window_bounds(read_window)
-        read_window_transform = dataset.window_transform(read_window)
-
-        # scale window transform
-        scaling = Affine.scale(self.scale_factor, self.scale_factor)
-        read_window_transform *= scaling
-
-        # Calculate initial transform to project to Spherical Mercator
-        # NOTE: this is slow, so we cache it based on bounds
-        if read_window_bounds not in self._transform_cache:
-            src_height, src_width = data.shape
-            self._transform_cache[read_window_bounds] = calculate_default_transform(
-                dataset.crs,
-                MAP_CRS,
-                src_width,
-                src_height,
-                *read_window_bounds,
-                dst_width=self.width * self.densify,
-                dst_height=self.height * self.densify,
-            )
-
-        proj_transform, proj_width, proj_height = self._transform_cache[
-            read_window_bounds
-        ]
-
-        # Project to Spherical Mercator
-        projected = np.empty(shape=(proj_height, proj_width), dtype=data.dtype)
-        reproject(
-            source=data,
-            destination=projected,
-            src_transform=read_window_transform,
-            src_crs=dataset.crs,
-            src_nodata=nodata,
-            dst_transform=proj_transform,
-            dst_crs=MAP_CRS,
-            dst_nodata=nodata,
-            resampling=Resampling.nearest,
-            num_threads=2,
-        )
+        return data
+
+    def _read_resampled(self, dataset):
+        """Read data from dataset resampled to the output image dimensions.
+
+        Parameters
+        ----------
+        dataset : open Rasterio dataset
 
-        # Clip to bounds after reprojection
-        clip_window = (
-            windows.from_bounds(*self.mercator_bounds, proj_transform)
-            .round_offsets(op="floor")
-            .round_lengths(op="ceil")
+        Returns
+        -------
+        ndarray of shape (height, width)
+        """
+        window = windows.from_bounds(*self.mercator_bounds, dataset.transform)
+
+        # only read the part of the window within the dataset, into the
+        # corresponding part of the output image
+        read_window = clip_window(window, dataset.width, dataset.height)
+        if read_window.width <= 0 or read_window.height <= 0:
+            return None
+
+        x_scale = self.width / window.width
+        y_scale = self.height / window.height
+        col_start = round((read_window.col_off - window.col_off) * x_scale)
+        col_end = round(
+            (read_window.col_off + read_window.width - window.col_off) * x_scale
+        )
+        row_start = round((read_window.row_off - window.row_off) * y_scale)
+        row_end = round(
+            (read_window.row_off + read_window.height - window.row_off) * y_scale
         )
-        clip_transform = windows.transform(clip_window, proj_transform)
-
-        # read projected data within window
-        data = projected[clip_window.toslices()]
-        height, width = data.shape
-
-        scaling = Affine.scale(width / self.width, height / self.height)
-        final_transform = clip_transform * scaling
-
-        clipped = np.empty(shape=(self.height, self.width), dtype=data.dtype)
-        reproject(
-            source=data,
-            destination=clipped,
-            src_transform=clip_transform,
-            src_crs=MAP_CRS,
-            dst_transform=final_transform,
-            dst_crs=MAP_CRS,
+
+        if col_end <= col_start or row_end <= row_start:
+            return None
+
+        nodata = getattr(np, dataset.dtypes[0])(dataset.nodata)
+        data = np.full((self.height, self.width), nodata, dtype=dataset.dtypes[0])
+        data[row_start:row_end, col_start:col_end] = dataset.read(
+            1,
+            window=read_window,
+            out_shape=(row_end - row_start, col_end - col_start),
             resampling=Resampling.nearest,
-            num_threads=2,
         )
 
-        # if DEBUG:
-        # filename = os.path.splitext(os.path.split(dataset.name)[-1])[0]
-        # filename = f"/tmp/{filename}-warped-clipped.tif"
-        # write_raster(filename, clipped, final_transform, MAP_CRS, nodata)
+        if not np.any(data != nodata):
+            # entire area is nodata
+            return None
 
-        return clipped
+        return data
 
 
 def hex_to_rgb(color):
@@ -206,86 +287,176 @@ def hex_to_rgb(color):
     return tuple(int(color[i : i + 2], 16) for i in (0, 2, 4))
 
 
-def hex_to_rgba(colors, alpha=0):
-    """Convert value, hex dict to RGBA array
+def hex_to_palette(colors, nodata, alpha=255):
+    """Convert value, hex dict to an RGBA palette of 256 colors, indexed by
+    value.
 
     Parameters
     ----------
     colors : dict
         lookup of value to hex color
-    alpha : int, optional (default 0)
-        alpha value
-    """
+    nodata : uint8
+        NODATA value; always completely transparent
+    alpha : int, optional (default 255)
+        alpha value of colors
 
-    #
-    max_value = max(colors.keys())
-    out_colors = np.zeros((max_value + 1, 4), dtype="uint8")
+    Returns
+    -------
+    uint8 array of shape (256, 4)
+        values not present in colors are completely transparent
+    """
+    palette = np.zeros((256, 4), dtype="uint8")
     for value, color in colors.items():
-        out_colors[value, :] = [int(color[i : i + 2], 16) for i in (1, 3, 5)] + [alpha]
-    return out_colors
+        palette[value, :] = [int(color[i : i + 2], 16) for i in (1, 3, 5)] + [alpha]
+
+    palette[nodata, 3] = 0
+
+    return palette
+
+
+@nb.njit(fastmath=True, nogil=True, cache=True, inline="always")
+def _over(src, dst):
+    """Alpha composite src RGBA color over dst RGBA color; colors are not
+    premultiplied by alpha.
+
+    Parameters
+    ----------
+    src : tuple of (red, green, blue, alpha) floats in 0-255
+    dst : tuple of (red, green, blue, alpha) floats in 0-255
+
+    Returns
+    -------
+    tuple of (red, green, blue, alpha) floats in 0-255
+    """
+    src_a = src[3] / 255.0
+    dst_a = dst[3] / 255.0 * (1.0 - src_a)
+    out_a = src_a + dst_a
+    if out_a == 0:
+        return (0.0, 0.0, 0.0, 0.0)
+
+    return (
+        (src[0] * src_a + dst[0] * dst_a) / out_a,
+        (src[1] * src_a + dst[1] * dst_a) / out_a,
+        (src[2] * src_a + dst[2] * dst_a) / out_a,
+        out_a * 255.0,
+    )
 
 
 @nb.njit(
-    (nb.uint8[:, :], nb.uint8[:, :], nb.uint8),
+    (nb.uint8[:, :], nb.uint8[:, :], nb.uint8[:, :, :], nb.uint8[:, :, :]),
     fastmath=True,
     nogil=True,
     cache=True,
 )
-def to_rgba(data, colors, nodata):
-    """Convert 2D array of data into RGBA color values
+def composite_rgb(data, palette, basemap, aoi):
+    """Colorize a 2D array of data and composite it over basemap and under
+    area of interest RGBA images, in a single pass.
 
     Parameters
     ----------
     data : 2D uint8 array
-    colors : dict
-        lookup of value to hex color
-    nodata : uint8
-        NODATA value
+        values are indexes into palette
+    palette : uint8 array of shape (256, 4)
+        RGBA color of each value
+    basemap : uint8 array of shape (rows, cols, 4)
+        basemap RGBA image; ignored if it has no rows (EMPTY_RGBA)
+    aoi : uint8 array of shape (rows, cols, 4)
+        area of interest RGBA image; ignored if it has no rows (EMPTY_RGBA)
 
     Returns
     -------
-    uint8 array of shape (rows, cols, 4)
+    uint8 array of shape (rows, cols, 3)
+        composited RGB image; the composited alpha channel is dropped
     """
-    rgba = np.zeros(shape=data.shape + (4,), dtype="uint8")
+    has_basemap = basemap.shape[0] > 0
+    has_aoi = aoi.shape[0] > 0
+
+    rgb = np.empty(shape=data.shape + (3,), dtype="uint8")
     for i in range(0, data.shape[0]):
         for j in range(0, data.shape[1]):
-            value = data[i, j]
-            if value != nodata:
-                color = colors[value]
-                for c in range(4):
-                    rgba[i, j, c] = color[c]
-
-    return rgba
-
-
-def render_array(data, colors, nodata, alpha=255):
-    """Render a data array to a PIL Image.
+            color = (0.0, 0.0, 0.0, 0.0)
+            if has_basemap:
+                color = (
+                    float(basemap[i, j, 0]),
+                    float(basemap[i, j, 1]),
+                    float(basemap[i, j, 2]),
+                    float(basemap[i, j, 3]),
+                )
 
-    Data values must be indexes into colors.
+            value = data[i, j]
+            if palette[value, 3] > 0:
+                color = _over(
+                    (
+                        float(palette[value, 0]),
+                        float(palette[value, 1]),
+                        float(palette[value, 2]),
+                        float(palette[value, 3]),
+                    ),
+                    color,
+                )
+
+            if has_aoi and aoi[i, j, 3] > 0:
+                color = _over(
+                    (
+                        float(aoi[i, j, 0]),
+                        float(aoi[i, j, 1]),
+                        float(aoi[i, j, 2]),
+                        float(aoi[i, j, 3]),
+                    ),
+                    color,
+                )
+
+            for c in range(3):
+                rgb[i, j, c] = np.uint8(min(color[c] + 0.5, 255.0))
+
+    return rgb
+
+
+def render_data(data, nodata, reader, colors, basemap=None, aoi=None):
+    """Render a data array composited over basemap and under area of interest
+    to a PIL Image.
 
     Parameters
     ----------
-    data : 2D uint8 array
-        Values must be indexes into colors.  Any value not present in colors
-        is rendered as completely transparent.
-    colors : dict of hex colors
-        lookup table of pixel values to colors
+    data : 2D uint8 array of shape (height, width) or None
+        None if data do not overlap bounds
     nodata : uint8
         NODATA value
-    alpha : alpha value, optional (default: 255)
+    reader : WebMercatorReader
+    colors : dict of hex colors
+        lookup table of pixel values to colors
+    basemap : uint8 array of shape (height, width, 4), optional (default: None)
+        basemap RGBA image
+    aoi : uint8 array of shape (height, width, 4), optional (default: None)
+        area of interest RGBA image
 
     Returns
     -------
     PIL Image
+        RGB image, or None if data do not overlap bounds and there is no
+        basemap or area of interest image
     """
+    if data is None:
+        if basemap is None and aoi is None:
+            return None
+
+        data = np.full((reader.height, reader.width), nodata, dtype="uint8")
+
+    palette = hex_to_palette(colors, nodata, 175)  # about 68% opacity
+
+    rgb = composite_rgb(
+        data,
+        palette,
+        EMPTY_RGBA if basemap is None else basemap,
+        EMPTY_RGBA if aoi is None else aoi,
+    )
 
-    rgba_colors = hex_to_rgba(colors, alpha)
-    rgba = to_rgba(data, rgba_colors, nodata)
-    return Image.fromarray(rgba)
+    return Image.fromarray(rgb)
 
 
-def render_raster(path, reader, colors):
-    """Render a raster dataset to a PIL Image.
+def render_raster(path, reader, colors, basemap=None, aoi=None):
+    """Render a raster dataset composited over basemap and under area of
+    interest to a PIL Image.
 
     Parameters
     ----------
@@ -293,28 +464,19 @@ def render_raster(path, reader, colors):
     reader : WebMercatorReader
     colors : dict of hex colors
         lookup table of pixel values to colors
+    basemap : uint8 array of shape (height, width, 4), optional (default: None)
+        basemap RGBA image
+    aoi : uint8 array of shape (height, width, 4), optional (default: None)
+        area of interest RGBA image
 
     Returns
     -------
     PIL Image
+        RGB image, or None if dataset does not overlap bounds and there is no
+        basemap or area of interest image
     """
     with rasterio.open(path) as src:
         data = reader.read(src)
         nodata = getattr(np, src.dtypes[0])(src.nodata)
 
-        if data is not None:
-            # DEBUG
-            # print(
-            #     f"Memory of map data ({path}): {data.size * data.itemsize / (1024 * 1024):0.2f} MB",
-            #     data.dtype,
-            # )
-
-            # does not overlap with bounds
-            return render_array(
-                data,
-                colors,
-                nodata,
-                175,  # about 68% opacity
-            )
-
-    return None
+    return render_data(data, nodata, reader, colors, basemap, aoi)
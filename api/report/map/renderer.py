@@ -0,0 +1,101 @@
+"""Pool of initialized pymgl maps used to render report maps.
+
+Creating a map loads its style, opens its MBTiles sources, registers images
+such as the crosshatch pattern, and sets up a GL context.  Instead of creating
+a map for each render, maps are kept in a pool per style and image size;
+rendering a map only updates its camera, layer filters, and GeoJSON source
+data.
+
+Maps are checked out of the pool while they are used, so that a map is never
+used to render more than one image at a time.
+"""
+
+from base64 import b64decode
+from collections import defaultdict
+from contextlib import contextmanager
+from io import BytesIO
+import json
+import threading
+
+from PIL import Image
+
+from api.metrics import count_cache_lookup
+from api.settings import MAP_RENDERER_POOL_SIZE
+
+
+EMPTY_GEOJSON = json.dumps({"type": "FeatureCollection", "features": []})
+
+# pattern generated using http://www.patternify.com/ on 10x10 grid
+CROSSHATCH_PNG = "iVBORw0KGgoAAAANSUhEUgAAAAoAAAAKCAYAAACNMs+9AAAAAXNSR0IArs4c6QAAADpJREFUKFONzEsKADAIA9Hk/oe2WGjpR6OzfgzRy9hwBoAVnMhnCm6k4IUy+KEIhuiFKTqhRAuWyOEA/DwKCnfY+F8AAAAASUVORK5CYII="
+
+# decoded crosshatch pattern image
+CROSSHATCH = Image.open(BytesIO(b64decode(CROSSHATCH_PNG))).tobytes()
+
+
+def add_crosshatch(map, sdf=False):
+    """Register the crosshatch pattern image in a map.
+
+    Parameters
+    ----------
+    map : pymgl.Map
+    sdf : bool, optional (default: False)
+        if True, image is registered as a signed distance field
+    """
+    map.addImage("crosshatch", CROSSHATCH, 10, 10, 2.0, sdf)
+
+
+class MapPool(object):
+    """Pool of idle maps keyed by style and image size"""
+
+    def __init__(self, max_idle):
+        """
+        Parameters
+        ----------
+        max_idle : int
+            max number of idle maps kept for each key
+        """
+        self.max_idle = max_idle
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def get(self, key, create):
+        """Check out an idle map for key, or create one if none are idle.
+
+        The map is returned to the pool when done unless an error was raised
+        while using it.
+
+        Parameters
+        ----------
+        key : tuple
+            style name, width, height
+        create : function
+            called without arguments to create and initialize a new map for key
+
+        Yields
+        ------
+        pymgl.Map
+        """
+        with self._lock:
+            idle = self._idle[key]
+            map = idle.pop() if idle else None
+
+        count_cache_lookup("map_renderer", map is not None)
+
+        if map is None:
+            map = create()
+
+        yield map
+
+        # only reached if no error was raised
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self.max_idle:
+                idle.append(map)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+
+
+pool = MapPool(MAP_RENDERER_POOL_SIZE)
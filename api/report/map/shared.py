@@ -0,0 +1,111 @@
+"""Images stored in shared memory, so that images used by every raster map
+(basemap and area of interest) are written once per report instead of being
+pickled and sent to a process for each map.
+"""
+
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+class SharedImage(object):
+    """RGBA image array stored in shared memory.
+
+    Only the name and shape of the shared memory block are pickled; the image
+    is used directly from shared memory in the process that uses it.
+    """
+
+    def __init__(self, arr):
+        """Copy image array into a new shared memory block.
+
+        Parameters
+        ----------
+        arr : uint8 array of shape (height, width, 4)
+        """
+        self.shape = arr.shape
+        self._shm = SharedMemory(create=True, size=arr.nbytes)
+        np.ndarray(self.shape, dtype="uint8", buffer=self._shm.buf)[:] = arr
+        self.name = self._shm.name
+
+    def __getstate__(self):
+        return {"name": self.name, "shape": self.shape}
+
+    def __setstate__(self, state):
+        self.name = state["name"]
+        self.shape = state["shape"]
+        self._shm = None
+
+    @contextmanager
+    def as_array(self):
+        """Attach to the shared memory block while in context, without
+        copying it.
+
+        Yields
+        ------
+        uint8 array of shape (height, width, 4)
+            only valid while in context
+        """
+        shm = SharedMemory(name=self.name)
+        arr = np.ndarray(self.shape, dtype="uint8", buffer=shm.buf)
+        try:
+            yield arr
+
+        finally:
+            # views of the block must be released before it can be closed
+            del arr
+            shm.close()
+
+    def unlink(self):
+        """Release the shared memory block; only called by the process that
+        created it."""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+@contextmanager
+def share_images(*images):
+    """Store image arrays in shared memory while in context.
+
+    Parameters
+    ----------
+    *images : uint8 arrays of shape (height, width, 4) or None
+
+    Yields
+    ------
+    list of SharedImage or None
+    """
+    shared = []
+    try:
+        for img in images:
+            shared.append(SharedImage(img) if img is not None else None)
+
+        yield shared
+
+    finally:
+        for img in shared:
+            if img is not None:
+                img.unlink()
+
+
+@contextmanager
+def image_array(img):
+    """Get the array of an image that may be stored in shared memory while in
+    context.
+
+    Parameters
+    ----------
+    img : uint8 array of shape (height, width, 4), SharedImage, or None
+
+    Yields
+    ------
+    uint8 array of shape (height, width, 4) or None
+    """
+    if isinstance(img, SharedImage):
+        with img.as_array() as arr:
+            yield arr
+
+    else:
+        yield img
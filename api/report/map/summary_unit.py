@@ -1,6 +1,3 @@
-from base64 import b64decode
-from copy import deepcopy
-from io import BytesIO
 import json
 
 from PIL import Image
@@ -8,6 +5,8 @@ from pymgl import Map
 
 from api.settings import TILE_DIR
 
+from .renderer import add_crosshatch, pool
+
 
 STYLE = {
     "version": 8,
@@ -49,6 +48,12 @@ STYLE = {
 }
 
 
+def create_map(width, height):
+    map = Map(json.dumps(STYLE), width, height, 1, 0, 0, zoom=0)
+    add_crosshatch(map, sdf=True)
+    return map
+
+
 def get_summary_unit_map_image(id, center, zoom, width, height):
     """Create a rendered map image of an existing summary unit.
 
@@ -68,28 +73,16 @@ def get_summary_unit_map_image(id, center, zoom, width, height):
     Image object
     """
 
-    style = deepcopy(STYLE)
-    # filter IN current unit
-    style["layers"][-1]["filter"] = ["==", ["get", "id"], id]
-
     try:
-        map = Map(json.dumps(style), width, height, 1, *center, zoom=zoom)
-
-        # pattern generated using http://www.patternify.com/ on 10x10 grid
-        crosshatch_png = b64decode(
-            "iVBORw0KGgoAAAANSUhEUgAAAAoAAAAKCAYAAACNMs+9AAAAAXNSR0IArs4c6QAAADpJREFUKFONzEsKADAIA9Hk/oe2WGjpR6OzfgzRy9hwBoAVnMhnCm6k4IUy+KEIhuiFKTqhRAuWyOEA/DwKCnfY+F8AAAAASUVORK5CYII="
-        )
-        crosshatch_bytes = Image.open(BytesIO(crosshatch_png)).tobytes()
-        map.addImage(
-            "crosshatch",
-            crosshatch_bytes,
-            10,
-            10,
-            2.0,
-            True,
-        )
+        with pool.get(
+            ("summary_unit", width, height), lambda: create_map(width, height)
+        ) as map:
+            map.setCenter(*center)
+            map.setZoom(zoom)
+            # filter IN current unit
+            map.setFilter("units-outline", json.dumps(["==", ["get", "id"], id]))
 
-        return Image.frombytes("RGBA", (width, height), map.renderBuffer()), None
+            return Image.frombytes("RGBA", (width, height), map.renderBuffer()), None
 
     except Exception as ex:
         return None, f"Error generating summary_unit image ({type(ex)}): {ex}"
@@ -1,6 +1,7 @@
 from base64 import b64encode
 from io import BytesIO
 
+import numpy as np
 from PIL import Image
 
 
@@ -30,6 +31,7 @@ def merge_maps(maps):
     Parameters
     ----------
     maps: list-like of PIL Image objects
+        palette-mode images are converted to RGBA before compositing
 
     Returns
     -------
@@ -44,11 +46,34 @@ def merge_maps(maps):
     img = maps[0]
 
     for map in maps[1:]:
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")
+
+        if map.mode != "RGBA":
+            map = map.convert("RGBA")
+
         img = Image.alpha_composite(img, map)
 
     return img
 
 
+def to_rgba_array(img):
+    """Convert a PIL Image to a writeable RGBA array.
+
+    Parameters
+    ----------
+    img : PIL Image object or None
+
+    Returns
+    -------
+    uint8 array of shape (height, width, 4) or None
+    """
+    if img is None:
+        return None
+
+    return np.array(img.convert("RGBA"), dtype="uint8")
+
+
 def pad_bounds(bounds, percent=0):
     """Pad the bounds by a percentage
 
@@ -122,14 +147,18 @@ def to_base64(img):
     return b64encode(buffer.getvalue()).decode("utf-8")
 
 
-def to_png_bytes(img):
-    """Convert a PIL Image to encoded RGB PNG bytes.
+def to_png_bytes(img, colors=0):
+    """Convert a PIL Image to encoded RGB or palette-mode PNG bytes.
 
     NOTE: the alpha channel is currently dropped as it is not used in maps.
 
     Parameters
     ----------
     img : PIL Image object
+    colors : int, optional (default: 0)
+        If > 0, image is quantized to at most this many colors (max 256) and
+        encoded as a palette-mode PNG, which is much smaller and faster to
+        encode and decode than an RGB PNG.
 
     Returns
     -------
@@ -139,9 +168,16 @@ def to_png_bytes(img):
     if img is None:
         return None
 
-    if img.mode == "RGBA":
+    if img.mode in ("RGBA", "P"):
         img = img.convert("RGB")
 
+    if colors > 0:
+        img = img.quantize(
+            colors=min(colors, 256),
+            method=Image.Quantize.FASTOCTREE,
+            dither=Image.Dither.NONE,
+        )
+
     # Compression costs time, but since this is all transported in memory
     # we can likely handle larger files
     buffer = BytesIO()
@@ -9,12 +9,39 @@ load_dotenv()
 TEMP_DIR = Path(os.getenv("TEMP_DIR", "/tmp/se-reports"))
 TEMP_DIR.mkdir(exist_ok=True, parents=True)
 
+# generated reports are stored by content hash
+RESULTS_DIR = TEMP_DIR / "results"
+RESULTS_DIR.mkdir(exist_ok=True, parents=True)
+
 # CORS is only set by API server when running in local development
 ENABLE_CORS = bool(os.getenv("ENABLE_CORS", False))
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 
 TILE_DIR = os.getenv("TILE_DIR", "/data/tiles")
+
+# version of the Blueprint and other input data; used to key stored outputs
+# so that they are not reused across data releases
+DATA_VERSION = os.getenv("DATA_VERSION", "2025")
+
+# pre-rendered summary unit reports (see analysis/post/prerender_summary_unit_reports.py)
+PREBUILT_REPORT_DIR = Path(os.getenv("PREBUILT_REPORT_DIR", "data/reports"))
+
+# number of summary unit results to cache in memory in the API
+RESULTS_CACHE_SIZE = int(os.getenv("RESULTS_CACHE_SIZE", 10000))
+# max age (seconds) of summary unit results in HTTP caches
+RESULTS_MAX_AGE = int(os.getenv("RESULTS_MAX_AGE", 86400))
+
 MAPBOX_ACCESS_TOKEN = os.getenv("MAPBOX_ACCESS_TOKEN")
+
+# optional path to a local Mapbox GL style JSON file (e.g., using mbtiles://
+# sources in TILE_DIR) used to render basemaps offline instead of the Mapbox
+# light style
+BASEMAP_STYLE = os.getenv("BASEMAP_STYLE")
+# rendered basemap images are cached on disk, shared by all workers; least
+# recently used images are evicted once the cache exceeds this size (MB).  If
+# 0, basemaps are not cached
+BASEMAP_CACHE_DIR = Path(os.getenv("BASEMAP_CACHE_DIR", TEMP_DIR / "basemaps"))
+BASEMAP_CACHE_SIZE_MB = int(os.getenv("BASEMAP_CACHE_SIZE_MB", 512))
 API_TOKEN = os.getenv("API_TOKEN")
 API_SECRET = os.getenv("API_SECRET")
 LOGGING_LEVEL = os.getenv("LOGGING_LEVEL", "INFO")
@@ -27,7 +54,37 @@ REDIS = RedisSettings(host=REDIS_HOST, port=REDIS_PORT, retry_on_timeout=True, c
 
 REDIS_QUEUE = "southeast"
 
+# shared Redis connection pool used by the API
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+# seconds to wait for a connection from the pool when all are in use
+REDIS_POOL_TIMEOUT = int(os.getenv("REDIS_POOL_TIMEOUT", 5))
+# seconds a connection can be idle before it is checked before use
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+# retry Redis timeouts / connection errors with jittered exponential backoff
+REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", 5))
+REDIS_RETRY_BASE_DELAY = float(os.getenv("REDIS_RETRY_BASE_DELAY", 0.25))  # seconds
+REDIS_RETRY_MAX_DELAY = float(os.getenv("REDIS_RETRY_MAX_DELAY", 4))  # seconds
+# stop calling Redis for REDIS_CIRCUIT_RESET seconds after this many
+# consecutive failures
+REDIS_CIRCUIT_FAILURES = int(os.getenv("REDIS_CIRCUIT_FAILURES", 10))
+REDIS_CIRCUIT_RESET = int(os.getenv("REDIS_CIRCUIT_RESET", 30))
+
+# raster maps are rendered in a separate pool of MAP_RENDER_PROCESSES
+# processes in each background worker if MAP_RENDER_BACKEND is "process",
+# otherwise in MAP_RENDER_THREADS threads
+MAP_RENDER_BACKEND = os.getenv("MAP_RENDER_BACKEND", "process")
 MAP_RENDER_THREADS = int(os.getenv("MAP_RENDER_THREADS", 2))
+# if "pixel_layers", raster maps are rendered from the bit-packed pixel layer
+# rasters (one read per group of layers) instead of individual layers
+MAP_RASTER_SOURCE = os.getenv("MAP_RASTER_SOURCE", "layers")
+# raster maps are quantized to at most this many colors (max 256) and encoded
+# as palette-mode PNGs, which are several times smaller than RGB PNGs; if 0,
+# they are encoded as RGB PNGs
+MAP_PNG_COLORS = int(os.getenv("MAP_PNG_COLORS", 256))
+# max number of initialized maps kept for each map style and size (e.g.,
+# basemap, area of interest); see api/report/map/renderer.py
+MAP_RENDERER_POOL_SIZE = int(os.getenv("MAP_RENDERER_POOL_SIZE", 2))
 MAX_JOBS = int(os.getenv("MAX_JOBS", 2))
 CUSTOM_REPORT_MAX_ACRES = int(os.getenv("CUSTOM_REPORT_MAX_ACRES", 50000000))
 
@@ -38,5 +95,66 @@ MAX_VERTICES = int(os.getenv("MAX_VERTICES", 2500000))
 # retain files for 24 hours to aid troubleshooting
 FILE_RETENTION = 86400
 
+# seconds between full job status checks when streaming job status to clients
+SSE_STATUS_INTERVAL = int(os.getenv("SSE_STATUS_INTERVAL", 5))
+
 # time jobs out after 10 minutes
 JOB_TIMEOUT = 600
+
+# retain job results for 1 hour; identical report requests within this time
+# reuse the existing result
+JOB_RESULT_RETENTION = int(os.getenv("JOB_RESULT_RETENTION", 3600))
+
+# retain aggregated job statistics for 30 days
+JOB_STATS_RETENTION = int(os.getenv("JOB_STATS_RETENTION", 2592000))
+
+# fraction of the job timeout after which optional sections of reports are
+# skipped so that the report completes before the job times out
+JOB_TIME_BUDGET = float(os.getenv("JOB_TIME_BUDGET", 0.75))
+
+# seconds between checks for cancellation requests while a job is running
+CANCEL_CHECK_INTERVAL = int(os.getenv("CANCEL_CHECK_INTERVAL", 2))
+
+# estimated peak memory (MB) of report jobs that each background worker runs at
+# the same time; jobs that do not fit are deferred and retried every
+# ADMISSION_RETRY_DELAY seconds, up to ADMISSION_MAX_DEFERRALS times (counted
+# separately from arq's max_tries).  If 0, jobs are only limited by max_jobs for
+# their job class
+WORKER_MEMORY_BUDGET_MB = int(os.getenv("WORKER_MEMORY_BUDGET_MB", 4096))
+ADMISSION_RETRY_DELAY = int(os.getenv("ADMISSION_RETRY_DELAY", 5))
+ADMISSION_MAX_DEFERRALS = int(os.getenv("ADMISSION_MAX_DEFERRALS", 120))
+
+# report jobs are routed to separate queues by job class, and each queue is
+# processed by separate workers (see api/worker.py) so that expensive custom
+# reports do not delay quick summary unit reports
+JOB_CLASSES = {
+    "summary_unit": {
+        "queue": REDIS_QUEUE,
+        "max_jobs": int(os.getenv("SUMMARY_UNIT_MAX_JOBS", MAX_JOBS)),
+        "timeout": int(os.getenv("SUMMARY_UNIT_JOB_TIMEOUT", 180)),
+    },
+    "custom": {
+        "queue": f"{REDIS_QUEUE}:custom",
+        "max_jobs": int(os.getenv("CUSTOM_MAX_JOBS", MAX_JOBS)),
+        "timeout": JOB_TIMEOUT,
+    },
+    "large_custom": {
+        "queue": f"{REDIS_QUEUE}:large_custom",
+        "max_jobs": int(os.getenv("LARGE_CUSTOM_MAX_JOBS", 1)),
+        "timeout": JOB_TIMEOUT,
+    },
+}
+
+# a worker is run for each job class on the same host, so by default each
+# worker only uses its share of the CPUs of the host
+WORKER_CPUS = max((os.cpu_count() or 1) // len(JOB_CLASSES), 1)
+# number of processes used by each background worker to run CPU-bound stages
+# of reports; if 0, these are run on the worker's event loop
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", WORKER_CPUS))
+# number of processes used by each background worker to render raster maps
+# (see MAP_RENDER_BACKEND)
+MAP_RENDER_PROCESSES = int(os.getenv("MAP_RENDER_PROCESSES", min(WORKER_CPUS, 2)))
+
+# custom reports with more than this many 30m pixels within the bounds of the
+# area of interest are routed to the large custom report queue (~1M acres)
+LARGE_CUSTOM_REPORT_PIXELS = int(os.getenv("LARGE_CUSTOM_REPORT_PIXELS", 4500000))
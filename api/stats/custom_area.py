@@ -18,7 +18,7 @@ bnd_dir = data_dir / "boundaries"
 subregions_filename = bnd_dir / "subregions.feather"
 
 
-async def get_custom_area_results(df, progress_callback=None):
+async def get_custom_area_results(df, progress_callback=None, cancellation=None):
     """Calculate statistics for custom area
 
     df : GeoDataFrame
@@ -26,6 +26,11 @@ async def get_custom_area_results(df, progress_callback=None):
     progress_callback : async function
         If not None, is an async function that is called with the percent that
         this task is complete
+    cancellation : Cancellation, optional (default: None)
+        If not None, is checked between sections; raises JobCancelledError if
+        cancelled, and optional sections (PARCAs, protected areas, SLR, urban,
+        wildfire risk) are skipped once its time budget is exceeded.  Skipped
+        sections are listed in "skipped" in the results.
     """
 
     # full_start = time()
@@ -56,6 +61,9 @@ async def get_custom_area_results(df, progress_callback=None):
     if progress_callback is not None:
         await progress_callback(5)
 
+    if cancellation is not None:
+        cancellation.check()
+
     # there was an intersection but no data once rasterized (e.g., slivers)
     if rasterized_geometry.acres == 0:
         return None
@@ -79,31 +87,52 @@ async def get_custom_area_results(df, progress_callback=None):
             await progress_callback(5 + int(round((percent / 100) * 55)))
 
     blueprint = await summarize_blueprint_in_aoi(
-        rasterized_geometry, subregions, progress_callback=blueprint_progress_callback
+        rasterized_geometry,
+        subregions,
+        progress_callback=blueprint_progress_callback,
+        cancellation=cancellation,
     )
     results.update(blueprint)
 
     if progress_callback is not None:
         await progress_callback(60)
 
-    parca = summarize_parcas_in_aoi(rasterized_geometry, df)
+    skipped = []
+
+    def skip(section):
+        # returns True if optional section should be skipped
+        if cancellation is None:
+            return False
+
+        cancellation.check()
+
+        if cancellation.over_budget():
+            skipped.append(section)
+            return True
+
+        return False
 
-    if parca is not None:
-        results["parcas"] = parca
+    if not skip("parcas"):
+        parca = summarize_parcas_in_aoi(rasterized_geometry, df)
+
+        if parca is not None:
+            results["parcas"] = parca
 
     if progress_callback is not None:
         await progress_callback(70)
 
-    protected_areas = summarize_protected_areas_in_aoi(rasterized_geometry, df)
-    if protected_areas is not None:
-        results["protected_areas"] = protected_areas
+    if not skip("protected_areas"):
+        protected_areas = summarize_protected_areas_in_aoi(rasterized_geometry, df)
+        if protected_areas is not None:
+            results["protected_areas"] = protected_areas
 
     if progress_callback is not None:
         await progress_callback(75)
 
-    slr = summarize_slr_in_aoi(rasterized_geometry, geometry=geometry)
-    if slr is not None:
-        results["slr"] = slr
+    if not skip("slr"):
+        slr = summarize_slr_in_aoi(rasterized_geometry, geometry=geometry)
+        if slr is not None:
+            results["slr"] = slr
 
     if progress_callback is not None:
         await progress_callback(80)
@@ -113,15 +142,20 @@ async def get_custom_area_results(df, progress_callback=None):
             # urban progress scales between 80 and 95% of total progress
             await progress_callback(80 + int(round((percent / 100) * 15)))
 
-    urban = await summarize_urban_in_aoi(
-        rasterized_geometry, progress_callback=urban_progress_callback
-    )
-    if urban is not None:
-        results["urban"] = urban
+    if not skip("urban"):
+        urban = await summarize_urban_in_aoi(
+            rasterized_geometry, progress_callback=urban_progress_callback
+        )
+        if urban is not None:
+            results["urban"] = urban
+
+    if not skip("wildfire_risk"):
+        wildfire_risk = summarize_wildfire_risk_in_aoi(rasterized_geometry)
+        if wildfire_risk is not None:
+            results["wildfire_risk"] = wildfire_risk
 
-    wildfire_risk = summarize_wildfire_risk_in_aoi(rasterized_geometry)
-    if wildfire_risk is not None:
-        results["wildfire_risk"] = wildfire_risk
+    if skipped:
+        results["skipped"] = skipped
 
     if progress_callback is not None:
         await progress_callback(100)
@@ -0,0 +1,116 @@
+"""Embedded key-value store for precomputed summary unit results.
+
+Results for each summary unit are pickled, compressed using zlib, and stored
+in a SQLite database keyed by unit type and unit ID.  The database is created
+by `analysis/prep/package_unit_results.py` and is read-only at runtime.
+"""
+
+import pickle
+import sqlite3
+import zlib
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    unit_type TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (unit_type, id)
+) WITHOUT ROWID
+"""
+
+
+def serialize_results(results):
+    """Serialize results dictionary to compressed bytes.
+
+    Parameters
+    ----------
+    results : dict
+
+    Returns
+    -------
+    bytes
+    """
+    return zlib.compress(pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def deserialize_results(data):
+    """Deserialize compressed bytes created by serialize_results.
+
+    Parameters
+    ----------
+    data : bytes
+
+    Returns
+    -------
+    dict
+    """
+    return pickle.loads(zlib.decompress(data))
+
+
+class SummaryUnitResultsStore(object):
+    def __init__(self, filename, readonly=True):
+        """Open the results store at filename.
+
+        Parameters
+        ----------
+        filename : str or Path
+        readonly : bool, optional (default: True)
+            if False, the database is created if it does not exist and can be
+            written to using put_many()
+        """
+        self.filename = filename
+
+        if readonly:
+            # connection is shared by threads used by API; this is safe because
+            # it is only used for reading
+            self._conn = sqlite3.connect(
+                f"file:{filename}?mode=ro&immutable=1",
+                uri=True,
+                check_same_thread=False,
+            )
+
+        else:
+            self._conn = sqlite3.connect(filename)
+            self._conn.execute(SCHEMA)
+
+    def get(self, unit_type, unit_id):
+        """Get results for a single summary unit.
+
+        Parameters
+        ----------
+        unit_type : str, one of {"huc12", "marine_hex"}
+        unit_id : str
+
+        Returns
+        -------
+        dict or None
+            None if the unit is not present in the store
+        """
+        row = self._conn.execute(
+            "SELECT data FROM results WHERE unit_type = ? AND id = ?",
+            (unit_type, unit_id),
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return deserialize_results(row[0])
+
+    def put_many(self, unit_type, items):
+        """Write serialized results for many summary units in a single transaction.
+
+        Parameters
+        ----------
+        unit_type : str, one of {"huc12", "marine_hex"}
+        items : iterable of (unit_id, data)
+            data must be created using serialize_results()
+        """
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (unit_type, id, data) VALUES (?, ?, ?)",
+                ((unit_type, unit_id, data) for unit_id, data in items),
+            )
+
+    def close(self):
+        self._conn.close()
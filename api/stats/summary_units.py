@@ -1,5 +1,11 @@
+from functools import lru_cache
+from hashlib import sha1
+import json
+import math
 from pathlib import Path
 
+import numpy as np
+
 from analysis.lib.stats.blueprint import get_blueprint_unit_results
 from analysis.lib.stats.parca import get_parca_unit_results
 from analysis.lib.stats.protected_areas import get_protected_areas_unit_results
@@ -7,13 +13,59 @@ from analysis.lib.stats.slr import get_slr_unit_results
 from analysis.lib.stats.summary_units import read_unit_from_feather
 from analysis.lib.stats.urban import get_urban_unit_results
 from analysis.lib.stats.wildfire_risk import get_wildfire_risk_unit_results
+from api.settings import DATA_VERSION, RESULTS_CACHE_SIZE
+from api.stats.store import SummaryUnitResultsStore
 
 data_dir = Path("data")
+results_store_filename = data_dir / "results/summary_units.db"
+
+_results_store = None
+
+
+def get_results_store():
+    """Get the store of precomputed summary unit results, if available.
+
+    The store is opened once per process and reused for all requests.
+
+    Returns
+    -------
+    SummaryUnitResultsStore or None
+        None if the store has not been created
+    """
+    global _results_store
+
+    if _results_store is None and results_store_filename.exists():
+        _results_store = SummaryUnitResultsStore(results_store_filename)
+
+    return _results_store
 
 
 def get_summary_unit_results(unit_type, unit_id):
     """Get statistics for a single summary unit (HUC12 / marine hex)
 
+    Results are read from the precomputed results store if available, otherwise
+    they are calculated from the tabulated summary unit results.
+
+    Parameters
+    ----------
+    unit_type : str, one of {"huc12", "marine_hex"}
+    unit_id : str
+
+    Returns
+    -------
+    dict (None if id not present)
+    """
+    store = get_results_store()
+    if store is not None:
+        return store.get(unit_type, unit_id)
+
+    return calculate_summary_unit_results(unit_type, unit_id)
+
+
+def calculate_summary_unit_results(unit_type, unit_id):
+    """Calculate statistics for a single summary unit (HUC12 / marine hex)
+    from the tabulated summary unit results.
+
     Parameters
     ----------
     unit_type : str, one of {"huc12", "marine_hex"}
@@ -94,3 +146,77 @@ def get_summary_unit_results(unit_type, unit_id):
             results["wildfire_risk"] = wildfire_risk_results
 
     return results
+
+
+def to_json_compatible(value):
+    """Recursively convert results to types that can be serialized to JSON.
+
+    Sets are converted to sorted lists, numpy values are converted to native
+    Python types, and NaN values are converted to None.
+
+    Parameters
+    ----------
+    value : any
+
+    Returns
+    -------
+    any
+    """
+    if isinstance(value, dict):
+        return {k: to_json_compatible(v) for k, v in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        return [to_json_compatible(v) for v in value]
+
+    if isinstance(value, set):
+        return sorted(to_json_compatible(v) for v in value)
+
+    if isinstance(value, np.ndarray):
+        return to_json_compatible(value.tolist())
+
+    if isinstance(value, np.generic):
+        value = value.item()
+
+    if isinstance(value, float) and math.isnan(value):
+        return None
+
+    return value
+
+
+@lru_cache(maxsize=RESULTS_CACHE_SIZE)
+def _load_summary_unit_json(unit_type, unit_id):
+    # raises KeyError for unknown IDs so that these are not cached and do not
+    # evict existing summary units from the cache
+    results = get_summary_unit_results(unit_type, unit_id)
+    if results is None:
+        raise KeyError(unit_id)
+
+    content = json.dumps(
+        to_json_compatible(results), separators=(",", ":"), allow_nan=False
+    ).encode("UTF8")
+    etag = f'"{DATA_VERSION}-{sha1(content).hexdigest()}"'
+
+    return content, etag
+
+
+def get_summary_unit_json(unit_type, unit_id):
+    """Get JSON-encoded statistics for a single summary unit (HUC12 / marine hex)
+
+    Results are cached in memory by unit type and ID, since they only change
+    between data versions.  Unknown IDs are not cached.
+
+    Parameters
+    ----------
+    unit_type : str, one of {"huc12", "marine_hex"}
+    unit_id : str
+
+    Returns
+    -------
+    (bytes, str) or None
+        tuple of JSON bytes and ETag, or None if id not present
+    """
+    try:
+        return _load_summary_unit_json(unit_type, unit_id)
+
+    except KeyError:
+        return None
@@ -0,0 +1,211 @@
+"""Content-addressed storage of generated reports and index-driven expiry of
+temporary files.
+
+Report PDFs are stored by the SHA-256 hash of their contents:
+<RESULTS_DIR>/<hash[:2]>/<hash>.pdf
+
+so identical reports are only stored once.  An index in Redis maps each job
+ID to the hash and download filename of its report.
+
+Temporary files (stored reports and uploaded files) are tracked in a Redis
+sorted set scored by the time at which they expire, so that expired files can
+be found and deleted without scanning TEMP_DIR.  Tracking requires Redis >= 6.2
+(ZADD GT).
+
+Storing a report and expiring it hold a per-file Redis lock, so that an
+identical report that is reused while it is being expired is never deleted.
+"""
+
+import asyncio
+from hashlib import sha256
+import json
+import os
+from pathlib import Path
+import tempfile
+from time import time
+
+from api.settings import FILE_RETENTION, RESULTS_DIR, TEMP_DIR
+
+
+RESULT_INDEX_PREFIX = "arq:job-report:"
+EXPIRY_KEY = "arq:file-expiry"
+FILE_LOCK_PREFIX = "arq:file-lock:"
+
+# max seconds a file lock is held, in case the process holding it dies
+FILE_LOCK_TIMEOUT = 60
+
+
+def get_result_path(content_hash):
+    return RESULTS_DIR / content_hash[:2] / f"{content_hash}.pdf"
+
+
+def file_lock(redis, path):
+    return redis.lock(f"{FILE_LOCK_PREFIX}{path}", timeout=FILE_LOCK_TIMEOUT)
+
+
+async def track_file(redis, path):
+    """Add a temporary file to the expiry index, so that it is deleted after
+    FILE_RETENTION seconds.
+
+    If the file is already tracked, its expiry is extended (requires
+    Redis >= 6.2).
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    path : Path
+    """
+    await redis.zadd(EXPIRY_KEY, {str(path): time() + FILE_RETENTION}, gt=True)
+
+
+async def store_result(redis, job_id, pdf, filename):
+    """Store a report PDF by content hash and index it by job ID.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    job_id : str
+    pdf : bytes
+    filename : str
+        filename used for downloads
+
+    Returns
+    -------
+    str
+        hash of PDF
+    """
+    content_hash = sha256(pdf).hexdigest()
+    path = get_result_path(content_hash)
+
+    path.parent.mkdir(exist_ok=True, parents=True)
+
+    # write to a temporary file so that a partial report is never served
+    fp, tmp_name = tempfile.mkstemp(suffix=".pdf", dir=path.parent)
+    with open(fp, "wb") as out:
+        out.write(pdf)
+
+    # track and move into place under the same lock used to expire the file,
+    # so that an identical report that is being expired is not deleted after
+    # it is reused
+    try:
+        async with file_lock(redis, path):
+            await track_file(redis, path)
+
+            if not path.exists():
+                os.replace(tmp_name, path)
+
+    finally:
+        # remove temporary file if not moved into place
+        Path(tmp_name).unlink(missing_ok=True)
+
+    await redis.set(
+        f"{RESULT_INDEX_PREFIX}{job_id}",
+        json.dumps({"hash": content_hash, "filename": filename}),
+        ex=FILE_RETENTION,
+    )
+
+    return content_hash
+
+
+async def get_result(redis, job_id):
+    """Get the stored report for a job.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+    job_id : str
+
+    Returns
+    -------
+    (Path, str, str) or None
+        tuple of path to PDF, download filename, and hash of PDF, or None if
+        there is no stored report for the job
+    """
+    value = await redis.get(f"{RESULT_INDEX_PREFIX}{job_id}")
+    if value is None:
+        return None
+
+    value = json.loads(value)
+    path = get_result_path(value["hash"])
+    if not path.exists():
+        return None
+
+    return path, value["filename"], value["hash"]
+
+
+async def expire_files(redis):
+    """Delete temporary files that have expired according to the expiry index.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+
+    Returns
+    -------
+    int
+        number of files deleted
+    """
+    now = time()
+
+    # fetch and remove expired entries atomically so that files are only
+    # deleted by one worker
+    pipeline = redis.pipeline(transaction=True)
+    pipeline.zrangebyscore(EXPIRY_KEY, 0, now)
+    pipeline.zremrangebyscore(EXPIRY_KEY, 0, now)
+    paths, _ = await pipeline.execute()
+
+    count = 0
+    for path in paths:
+        path = path.decode("UTF8")
+
+        async with file_lock(redis, path):
+            # skip files that were tracked again after they were fetched above
+            if await redis.zscore(EXPIRY_KEY, path) is not None:
+                continue
+
+            Path(path).unlink(missing_ok=True)
+            count += 1
+
+    return count
+
+
+def _find_temp_files():
+    # uploaded files are at the top level of TEMP_DIR; other directories
+    # (e.g., basemap cache) manage their own files
+    paths = [path for path in TEMP_DIR.iterdir() if path.is_file()]
+    paths.extend(path for path in RESULTS_DIR.rglob("*") if path.is_file())
+
+    files = {}
+    for path in paths:
+        try:
+            files[str(path)] = path.stat().st_mtime + FILE_RETENTION
+
+        except FileNotFoundError:
+            # deleted while scanning
+            continue
+
+    return files
+
+
+async def track_untracked_files(redis):
+    """Add temporary files that are not in the expiry index (e.g., created
+    before the index was used or left behind by a failed write) to the index,
+    so that they expire FILE_RETENTION seconds after they were last modified.
+
+    This scans TEMP_DIR and should only be run once on startup.
+
+    Parameters
+    ----------
+    redis : redis connection pool
+
+    Returns
+    -------
+    int
+        number of files added to the index
+    """
+    files = await asyncio.to_thread(_find_temp_files)
+    if not files:
+        return 0
+
+    # files that are already tracked keep their expiry
+    return await redis.zadd(EXPIRY_KEY, files, nx=True)
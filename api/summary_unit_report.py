@@ -1,48 +1,67 @@
 import logging
-import tempfile
 
+from api.cancellation import TIME_BUDGET_EXCEEDED, cancellable
 from api.errors import DataError
+from api.executor import run_in_process
+from api.metrics import job_metrics, stage_timer
 from api.report.map import render_maps
 from api.report import create_report
-from api.settings import LOGGING_LEVEL, TEMP_DIR
+from api.settings import LOGGING_LEVEL
 from api.stats.summary_units import get_summary_unit_results
+from api.storage import store_result
 from api.progress import set_progress
 
 log = logging.getLogger(__name__)
 log.setLevel(LOGGING_LEVEL)
 
 
-async def create_summary_unit_report(ctx, unit_type, unit_id):
-    """Generate Southeast Blueprint Report for a HUC12
-    or marine hex grid cell
+async def render_summary_unit_report(
+    unit_type, unit_id, progress_callback=None, cancellation=None
+):
+    """Render Southeast Blueprint Report PDF for a HUC12 or marine hex grid cell
 
     Parameters
     ----------
-    ctx : job context
     unit_type : str
         one of "huc12", "marine_hex"
     unit_id : str
+    progress_callback : async function, optional (default: None)
+        If not None, is an async function that is called with the percent that
+        this task is complete, a status message, and a list of errors
+    cancellation : Cancellation, optional (default: None)
+        If not None, raises JobCancelledError if cancelled, and maps are
+        skipped once its time budget is exceeded
+
+    Returns
+    -------
+    (bytes, str, list)
+        tuple of PDF bytes, output filename, errors
     """
 
+    async def update_progress(percent, message, errors=None):
+        if progress_callback is not None:
+            await progress_callback(percent, message, errors=errors)
+
     errors = []
-    await set_progress(ctx["redis"], ctx["job_id"], 0, "Calculating results")
+    await update_progress(0, "Calculating results")
 
-    results = get_summary_unit_results(unit_type, unit_id)
+    with stage_timer("get_summary_unit_results"):
+        results = get_summary_unit_results(unit_type, unit_id)
     if results is None:
         raise DataError(
             "Unit id is not valid (not an existing subwatershed or marine hex grid ID)"
         )
 
     name = results["name"]
-    print("unit type", unit_type)
     if unit_type == "marine_hex":
         name = "Marine " + name.replace(":", " ")
 
     filename = f"Southeast Blueprint Summary Report - {name}.pdf"
 
-    await set_progress(
-        ctx["redis"], ctx["job_id"], 50, "Creating maps (this might take a while)"
-    )
+    await update_progress(50, "Creating maps (this might take a while)")
+
+    if cancellation is not None:
+        cancellation.check()
 
     # compile indicator IDs across all ecosystems
     indicators = []
@@ -59,6 +78,7 @@ async def create_summary_unit_report(ctx, unit_type, unit_id):
         slr="slr" in results and results["slr"].get("na", False) is not True,
         urban="urban" in results,
         wildfire_risk="wildfire_risk" in results,
+        cancellation=cancellation,
     )
 
     if map_errors:
@@ -69,31 +89,66 @@ async def create_summary_unit_report(ctx, unit_type, unit_id):
         if "aoi" in map_errors:
             errors.append("Error rendering area of interest on maps")
 
-        if set(map_errors.keys()).difference(["basemap", "aoi"]):
+        skipped_maps = {k for k, v in map_errors.items() if v == TIME_BUDGET_EXCEEDED}
+        if skipped_maps:
+            errors.append(
+                "Some maps were omitted because this report took too long to create"
+            )
+
+        if set(map_errors.keys()).difference(["basemap", "aoi"], skipped_maps):
             errors.append("Error creating one or more maps")
 
-    await set_progress(
-        ctx["redis"],
-        ctx["job_id"],
-        75,
-        "Creating PDF (this might take a while)",
-        errors=errors,
-    )
+    await update_progress(75, "Creating PDF (this might take a while)", errors=errors)
 
     results["scale"] = scale
 
-    pdf = create_report(
-        maps=maps, results=results, name=results["name"], area_type=unit_type
+    if cancellation is not None:
+        cancellation.check()
+
+    with stage_timer("create_report"):
+        pdf = await run_in_process(
+            create_report,
+            maps=maps,
+            results=results,
+            name=results["name"],
+            area_type=unit_type,
+        )
+
+    return pdf, filename, errors
+
+
+@job_metrics
+@cancellable
+async def create_summary_unit_report(ctx, unit_type, unit_id):
+    """Generate Southeast Blueprint Report for a HUC12
+    or marine hex grid cell
+
+    Parameters
+    ----------
+    ctx : job context
+    unit_type : str
+        one of "huc12", "marine_hex"
+    unit_id : str
+    """
+
+    async def progress_callback(percent, message, errors=None):
+        await set_progress(
+            ctx["redis"], ctx["job_id"], percent, message, errors=errors
+        )
+
+    pdf, filename, errors = await render_summary_unit_report(
+        unit_type,
+        unit_id,
+        progress_callback=progress_callback,
+        cancellation=ctx["cancellation"],
     )
 
     await set_progress(ctx["redis"], ctx["job_id"], 95, "Nearly done", errors=errors)
 
-    fp, name = tempfile.mkstemp(suffix=".pdf", dir=TEMP_DIR)
-    with open(fp, "wb") as out:
-        out.write(pdf)
+    content_hash = await store_result(ctx["redis"], ctx["job_id"], pdf, filename)
 
     await set_progress(ctx["redis"], ctx["job_id"], 100, "All done!", errors=errors)
 
-    log.debug(f"Created PDF at: {name}")
+    log.debug(f"Created PDF: {content_hash}")
 
-    return name, filename, errors
+    return content_hash, filename, errors
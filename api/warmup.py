@@ -0,0 +1,139 @@
+"""Warm up a background worker process before it runs its first job.
+
+The first report created in a new process is much slower than later reports
+because it loads or compiles numba kernels, initializes GDAL drivers and opens
+datasets for the first time, and discovers fonts in WeasyPrint.  These are done
+here when the worker starts, so that the first job runs at the same speed as
+later jobs.
+"""
+
+import logging
+import time
+
+from PIL import Image
+import numpy as np
+import rasterio
+from weasyprint import HTML
+
+from analysis.lib.raster import count_values_inplace, unique
+from analysis.lib.stats.rasterized_geometry import extent_filename
+from api.report import assets_dir, load_asset
+from api.report.map import blueprint_filename
+from api.report.map.locator import get_locator_base_image
+from api.report.map.raster import composite_rgb, hex_to_palette
+from api.report.map.util import to_png_bytes
+from api.settings import LOGGING_LEVEL, MAP_PNG_COLORS
+
+
+log = logging.getLogger(__name__)
+log.setLevel(LOGGING_LEVEL)
+
+
+# uses the same fonts as the report
+WARMUP_HTML = """
+<html>
+<body>
+<h1 style="font-family: Raleway, sans-serif">Warm up</h1>
+<p style="font-family: 'Source Sans 3', sans-serif">Warm up</p>
+</body>
+</html>
+"""
+
+
+def warm_up_map_rendering():
+    """Load and initialize resources used to render raster maps.
+
+    Errors are logged rather than raised, since these only affect performance
+    of the first job.
+
+    Returns
+    -------
+    float
+        seconds elapsed
+    """
+    start = time.perf_counter()
+
+    try:
+        # numba kernel is loaded from the on-disk cache or compiled on first
+        # use
+        data = np.zeros((2, 2), dtype="uint8")
+        rgba = np.zeros((2, 2, 4), dtype="uint8")
+        palette = hex_to_palette({0: "#000000"}, np.uint8(255))
+        rgb = composite_rgb(data, palette, rgba, rgba)
+
+        # quantization and PNG encoder
+        to_png_bytes(Image.fromarray(rgb), colors=MAP_PNG_COLORS)
+
+        # GDAL drivers and first open / read of a map raster
+        with rasterio.open(blueprint_filename) as src:
+            src.read(1, window=((0, 1), (0, 1)))
+
+    except Exception as ex:
+        log.error(f"Error warming up map rendering: {ex}")
+
+    return time.perf_counter() - start
+
+
+def warm_up_worker():
+    """Load and initialize resources used by stages of reports that always run
+    in the worker's main process (basemap, area of interest, and locator maps).
+
+    Errors are logged rather than raised, since these only affect performance
+    of the first job.
+
+    Returns
+    -------
+    float
+        seconds elapsed
+    """
+    start = time.perf_counter()
+
+    try:
+        # locator base map is rendered once and cached
+        get_locator_base_image()
+
+    except Exception as ex:
+        log.error(f"Error warming up worker: {ex}")
+
+    return time.perf_counter() - start
+
+
+def warm_up():
+    """Load and initialize resources used to calculate results and create the
+    PDF, which are run in the process pool of the worker if it was started.
+
+    Errors are logged rather than raised, since these only affect performance
+    of the first job.
+
+    Returns
+    -------
+    float
+        seconds elapsed
+    """
+    start = time.perf_counter()
+
+    try:
+        # numba kernels are loaded from the on-disk cache or compiled on first use
+        data = np.zeros((2, 2), dtype="uint8")
+        count_values_inplace(
+            data, np.ones((2, 2), dtype="bool"), np.zeros((1,), dtype="uint64"), 255
+        )
+        unique(data)
+
+        # GDAL drivers and first open / read of the extent dataset
+        with rasterio.open(extent_filename) as src:
+            src.read(1, window=((0, 1), (0, 1)))
+
+        # report assets are cached after first load
+        for path in assets_dir.iterdir():
+            if path.suffix in {".png", ".svg"}:
+                load_asset(f"assets:{path.name}")
+
+        # WeasyPrint font discovery and layout (report templates are loaded
+        # when api.report is imported)
+        HTML(string=WARMUP_HTML).write_pdf()
+
+    except Exception as ex:
+        log.error(f"Error warming up worker: {ex}")
+
+    return time.perf_counter() - start
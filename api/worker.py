@@ -6,17 +6,29 @@ from arq import cron
 import sentry_sdk
 
 from api.custom_report import create_custom_report
+from api.executor import (
+    start_map_process_pool,
+    start_process_pool,
+    shutdown_process_pool,
+    warm_up_process_pool,
+)
+from api.job_stats import record_job_stats
+from api.metrics import record_job_metrics, record_warmup
+from api.queue import record_job_duration
+from api.report.map import check_map_rasters
+from api.storage import expire_files, track_untracked_files
 from api.summary_unit_report import create_summary_unit_report
+from api.warmup import warm_up, warm_up_map_rendering, warm_up_worker
 from api.settings import (
-    TEMP_DIR,
-    JOB_TIMEOUT,
-    FILE_RETENTION,
+    JOB_CLASSES,
+    JOB_RESULT_RETENTION,
+    MAP_RENDER_BACKEND,
+    MAP_RENDER_PROCESSES,
     SENTRY_DSN,
     SENTRY_ENV,
     LOGGING_LEVEL,
     REDIS,
-    REDIS_QUEUE,
-    MAX_JOBS,
+    WORKER_PROCESSES,
 )
 
 
@@ -42,21 +54,59 @@ if SENTRY_DSN:
 
 """Cleanup user-uploaded files and generated PDFs in a background task.
 
+Files are found using the expiry index instead of scanning TEMP_DIR.
+
 Parameters
 ----------
-ctx : arq ctx (unused)
+ctx : arq ctx
 """
 
 
 async def cleanup_files(ctx):
-    for path in TEMP_DIR.rglob("*"):
-        if path.stat().st_mtime < time() - FILE_RETENTION:
-            path.unlink()
+    count = await expire_files(ctx["redis"])
+    if count:
+        log.info(f"deleted {count} expired files")
 
 
 async def startup(ctx):
+    # fail before accepting jobs instead of failing every report map
+    check_map_rasters()
+
     ctx["redis"] = await arq.create_pool(REDIS)
 
+    # warm up processes that run CPU-bound stages of reports before accepting
+    # jobs, so that the first job runs at steady-state speed; each process only
+    # warms up the stages that run there
+    warmups = []
+
+    # stages that always run in this process
+    worker_seconds = warm_up_worker()
+
+    if WORKER_PROCESSES > 0:
+        start_process_pool(WORKER_PROCESSES)
+        warmups.append(("pool", await warm_up_process_pool()))
+
+    else:
+        worker_seconds += warm_up()
+
+    if MAP_RENDER_BACKEND == "process" and MAP_RENDER_PROCESSES > 0:
+        start_map_process_pool(MAP_RENDER_PROCESSES)
+        warmups.append(("map_pool", await warm_up_process_pool(map_pool=True)))
+
+    else:
+        worker_seconds += warm_up_map_rendering()
+
+    warmups.append(("worker", worker_seconds))
+
+    for process, seconds in warmups:
+        log.info(f"warmed up worker {process} in {seconds:.2f}s")
+
+        try:
+            await record_warmup(ctx["redis"], seconds, process)
+
+        except Exception as ex:
+            log.error(f"Could not record warm up time: {ex}")
+
     logging.config.dictConfig(
         {
             "version": 1,
@@ -91,18 +141,100 @@ async def startup(ctx):
     )
 
 
+async def cleanup_startup(ctx):
+    await startup(ctx)
+
+    # files created before the expiry index was used are otherwise never
+    # deleted; this worker runs cleanup, so only it scans TEMP_DIR
+    count = await track_untracked_files(ctx["redis"])
+    if count:
+        log.info(f"added {count} untracked temporary files to expiry index")
+
+
 async def shutdown(ctx):
+    shutdown_process_pool()
     await ctx["redis"].close()
 
 
+async def on_job_start(ctx):
+    ctx["job_start"] = time()
+
+
+async def after_job_end(ctx):
+    # used to estimate wait time for queued jobs; cron jobs are not queued
+    # by users so are excluded
+    if ctx["job_id"].startswith("cron:") or "job_start" not in ctx:
+        return
+
+    # jobs deferred by admission control are retried later
+    if ctx.get("deferred"):
+        return
+
+    run_time = time() - ctx["job_start"]
+    await record_job_duration(ctx["redis"], ctx["job_id"], run_time)
+
+    if "metrics" in ctx:
+        try:
+            await record_job_metrics(ctx["redis"], ctx["job_id"], ctx["metrics"])
+            await record_job_stats(
+                ctx["redis"],
+                ctx["job_id"],
+                run_time,
+                queue_wait=ctx["metrics"].queue_wait,
+                outcome=ctx["metrics"].outcome,
+            )
+
+        except Exception as ex:
+            log.error(f"Could not record job metrics: {ex}")
+
+
+"""Workers are run separately for each job class so that expensive custom
+reports do not delay quick summary unit reports, and so that each pool can be
+sized independently (see JOB_CLASSES in settings):
+
+arq api.worker.WorkerSettings
+arq api.worker.CustomReportWorkerSettings
+arq api.worker.LargeCustomReportWorkerSettings
+"""
+
+
 class WorkerSettings:
+    """Worker for summary unit reports; also runs cleanup of temporary files"""
+
     redis_settings = REDIS
-    job_timeout = JOB_TIMEOUT
-    max_jobs = MAX_JOBS
-    queue_name = REDIS_QUEUE
+    job_timeout = JOB_CLASSES["summary_unit"]["timeout"]
+    keep_result = JOB_RESULT_RETENTION
+    max_jobs = JOB_CLASSES["summary_unit"]["max_jobs"]
+    queue_name = JOB_CLASSES["summary_unit"]["queue"]
     # run cleanup every 60 minutes
     cron_jobs = [cron(cleanup_files, run_at_startup=True, minute=0, second=0)]
-    functions = [create_custom_report, create_summary_unit_report]
+    functions = [create_summary_unit_report]
+
+    on_startup = cleanup_startup
+    on_shutdown = shutdown
+    on_job_start = on_job_start
+    after_job_end = after_job_end
+
+
+class CustomReportWorkerSettings:
+    """Worker for custom reports"""
+
+    redis_settings = REDIS
+    job_timeout = JOB_CLASSES["custom"]["timeout"]
+    keep_result = JOB_RESULT_RETENTION
+    max_jobs = JOB_CLASSES["custom"]["max_jobs"]
+    queue_name = JOB_CLASSES["custom"]["queue"]
+    functions = [create_custom_report]
 
     on_startup = startup
     on_shutdown = shutdown
+    on_job_start = on_job_start
+    after_job_end = after_job_end
+
+
+class LargeCustomReportWorkerSettings(CustomReportWorkerSettings):
+    """Worker for custom reports for large areas"""
+
+    job_timeout = JOB_CLASSES["large_custom"]["timeout"]
+    max_jobs = JOB_CLASSES["large_custom"]["max_jobs"]
+    queue_name = JOB_CLASSES["large_custom"]["queue"]
@@ -0,0 +1,97 @@
+"""Compare rendering raster maps for summary units using threads vs processes.
+
+Maps for each summary unit are rendered NUM_RUNS times with each backend and
+concurrency level; the first run of each backend is excluded so that process
+start up and warm up are not included.
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+from statistics import median
+from time import perf_counter
+
+from api.executor import init_map_process
+from api.report.map import HEIGHT, PADDING, WIDTH, render_raster_maps
+from api.report.map.basemap import get_basemap_image
+from api.report.map.mercator import get_map_bounds, get_zoom
+from api.report.map.raster import WebMercatorReader
+from api.report.map.summary_unit import get_summary_unit_map_image
+from api.report.map.util import get_center, pad_bounds
+from api.stats.summary_units import get_summary_unit_results
+
+NUM_RUNS = 5
+CONCURRENCY = [2, 4, 8]
+
+ids = {
+    "huc12": [
+        "031200030902",  # at overlap area between FL, MidSE, and SA
+        "060200020506",  # in AppLCC area
+    ],
+    "marine_hex": [],
+}
+
+
+def prepare(unit_type, unit_id):
+    results = get_summary_unit_results(unit_type, unit_id)
+
+    indicators = []
+    for ecosystem in results.get("ecosystems", []):
+        indicators.extend([i["id"] for i in ecosystem["indicators"]])
+
+    bounds = pad_bounds(results["bounds"], PADDING)
+    center = get_center(bounds)
+    zoom = get_zoom(bounds, WIDTH, HEIGHT)
+    bounds = get_map_bounds(center, zoom, WIDTH, HEIGHT)
+
+    basemap_image, _ = get_basemap_image(center, zoom, WIDTH, HEIGHT)
+    aoi_image, _ = get_summary_unit_map_image(unit_id, center, zoom, WIDTH, HEIGHT)
+
+    return (
+        WebMercatorReader(bounds, WIDTH, HEIGHT),
+        basemap_image,
+        aoi_image,
+    ), dict(
+        indicators=indicators,
+        corridors="corridors" in results,
+        parcas="parcas" in results,
+        protected_areas="protected_areas" in results,
+        slr="slr" in results and results["slr"].get("na", False) is not True,
+        urban="urban" in results,
+        wildfire_risk="wildfire_risk" in results,
+    )
+
+
+async def benchmark(executor, args, kwargs):
+    times = []
+    for _ in range(NUM_RUNS + 1):
+        start = perf_counter()
+        await render_raster_maps(*args, executor=executor, **kwargs)
+        times.append(perf_counter() - start)
+
+    # exclude first run
+    return median(times[1:])
+
+
+if __name__ == "__main__":
+    context = multiprocessing.get_context("spawn")
+
+    for unit_type in ids:
+        for unit_id in ids[unit_type]:
+            args, kwargs = prepare(unit_type, unit_id)
+            num_maps = len(kwargs["indicators"]) + 1
+
+            print(f"\n{unit_type} {unit_id} ({num_maps}+ maps)")
+
+            for concurrency in CONCURRENCY:
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    elapsed = asyncio.run(benchmark(executor, args, kwargs))
+                    print(f"threads   x{concurrency}: {elapsed:.3f}s")
+
+                with ProcessPoolExecutor(
+                    max_workers=concurrency,
+                    mp_context=context,
+                    initializer=init_map_process,
+                ) as executor:
+                    elapsed = asyncio.run(benchmark(executor, args, kwargs))
+                    print(f"processes x{concurrency}: {elapsed:.3f}s")
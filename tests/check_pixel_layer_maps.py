@@ -0,0 +1,127 @@
+"""Compare layers decoded from bit-packed pixel layers to the individual layers
+used to render report maps, for a summary unit at a low zoom level.
+
+Individual layers are read from overviews created using mode, whereas pixel
+layers are read from overviews created using nearest neighbor, so values are
+not expected to match exactly at low zoom levels; however, the coverage of each
+layer (number of pixels with data) and most values should be the same.
+"""
+
+import sys
+
+import numpy as np
+import rasterio
+
+from api.report.map import (
+    HEIGHT,
+    WIDTH,
+    blueprint_filename,
+    corridors_filename,
+    indicators_dir,
+    parcas_filename,
+    protected_areas_filename,
+    slr_filename,
+    urban_filename,
+    wildfire_risk_filename,
+)
+from api.report.map.mercator import get_map_bounds, get_zoom
+from api.report.map.pixel_layers import (
+    NODATA,
+    decode,
+    get_group_filename,
+    group_by_pixel_layers,
+)
+from api.report.map.raster import WebMercatorReader
+from api.report.map.util import get_center, pad_bounds
+from api.stats.summary_units import get_summary_unit_results
+from analysis.constants import INDICATORS
+
+# pad bounds of summary unit so that map is at a low zoom level
+PADDING = 2000
+
+# min fraction of pixels with data in either that must match
+MIN_AGREEMENT = 0.8
+
+# max relative difference in number of pixels with data
+MAX_COVERAGE_DIFFERENCE = 0.2
+
+unit_type = "huc12"
+unit_id = "031200030902"
+
+
+def read(path, reader):
+    with rasterio.open(path) as src:
+        data = reader.read(src)
+        nodata = src.nodata
+
+    return data, nodata
+
+
+results = get_summary_unit_results(unit_type, unit_id)
+bounds = pad_bounds(results["bounds"], PADDING)
+center = get_center(bounds)
+zoom = get_zoom(bounds, WIDTH, HEIGHT)
+reader = WebMercatorReader(get_map_bounds(center, zoom, WIDTH, HEIGHT), WIDTH, HEIGHT)
+
+print(f"{unit_type} {unit_id}: map zoom {zoom:.2f}, data zoom {reader.zoom}")
+
+task_args = [
+    ("blueprint", blueprint_filename, None),
+    ("corridors", corridors_filename, None),
+    ("parcas", parcas_filename, None),
+    ("protected_areas", protected_areas_filename, None),
+    ("slr", slr_filename, None),
+    ("urban_2060", urban_filename, None),
+    ("wildfire_risk", wildfire_risk_filename, None),
+] + [(e["id"], indicators_dir / e["filename"], None) for e in INDICATORS]
+paths = {id: path for id, path, _ in task_args}
+
+groups, remaining = group_by_pixel_layers(task_args)
+if remaining:
+    print(f"Not found in pixel layers: {', '.join(id for id, _, _ in remaining)}")
+
+failed = []
+for group, layers in groups.items():
+    with rasterio.open(get_group_filename(group)) as src:
+        packed = reader.read(src)
+
+    for id, offset, bits, value_shift, _ in layers:
+        decoded = decode(packed, offset, bits, value_shift)
+        if decoded is None:
+            decoded = np.full((HEIGHT, WIDTH), NODATA, dtype="uint8")
+
+        expected, nodata = read(paths[id], reader)
+        if expected is None:
+            expected = np.full((HEIGHT, WIDTH), nodata, dtype="uint8")
+
+        decoded_mask = decoded != NODATA
+        expected_mask = expected != nodata
+
+        decoded_count = decoded_mask.sum()
+        expected_count = expected_mask.sum()
+        either = decoded_mask | expected_mask
+        if not either.any():
+            continue
+
+        # pixels match if neither has data or both have the same value
+        agreement = (
+            (decoded_mask == expected_mask) & (~decoded_mask | (decoded == expected))
+        )[either].mean()
+        coverage_difference = abs(decoded_count - expected_count) / max(
+            expected_count, 1
+        )
+
+        ok = (
+            agreement >= MIN_AGREEMENT
+            and coverage_difference <= MAX_COVERAGE_DIFFERENCE
+        )
+        if not ok:
+            failed.append(id)
+
+        print(
+            f"{'ok  ' if ok else 'FAIL'} {id} (group {group}): {agreement:.1%} agreement, {decoded_count:,} decoded vs {expected_count:,} individual pixels with data"
+        )
+
+if failed:
+    print(f"\n{len(failed)} layers do not match: {', '.join(failed)}")
+    sys.exit(1)
@@ -95,7 +95,13 @@ def test_huc12_report(huc12_id):
     json = r.json()
 
     if not json:
-        raise Exception(r.status)
+        raise Exception(r.status_code)
+
+    # pre-rendered reports are returned immediately without a job
+    if json.get("status") == "success":
+        print(f"Pre-rendered report at: {json['result']}")
+        download_file(json["result"])
+        return
 
     job_id = json.get("job")
 
@@ -27,7 +27,7 @@ export const uploadFile = async (file: File, name: string, onProgress: ProgressC
 	})
 
 	const json = await response.json()
-	const { job, detail } = json
+	const { job, client, detail } = json
 
 	if (response.status === 400) {
 		// indicates error with user request, show error to user
@@ -47,7 +47,7 @@ export const uploadFile = async (file: File, name: string, onProgress: ProgressC
 		throw new Error(response.statusText)
 	}
 
-	const result = await pollJob(job, onProgress)
+	const result = await watchJob(job, client, onProgress)
 	return result
 }
 
@@ -69,7 +69,7 @@ export const createSummaryUnitReport = async (
 	})
 
 	const json = await response.json()
-	const { job, detail } = json
+	const { job, client, result, detail } = json
 
 	if (response.status === 400) {
 		// indicates error with user request, show error to user
@@ -88,8 +88,126 @@ export const createSummaryUnitReport = async (
 		throw new Error(response.statusText)
 	}
 
-	const result = await pollJob(job, onProgress)
-	return result
+	// pre-rendered reports are returned immediately without creating a job
+	if (result) {
+		return { result: `${apiHost}${result}`, errors: [] }
+	}
+
+	return await watchJob(job, client, onProgress)
+}
+
+type JobStatus = {
+	status?: string | null
+	progress?: number | null
+	queue_position?: number | null
+	elapsed_time?: number | null
+	message?: string | null
+	errors?: string[] | null
+	detail?: string | null
+	result?: string | null
+}
+
+/**
+ * Handle job status returned by the API.  Returns the outcome of the job if
+ * it succeeded or failed, otherwise reports progress and returns null.
+ */
+const handleJobStatus = (json: JobStatus, onProgress: ProgressCallback) => {
+	const {
+		status = null,
+		progress = null,
+		queue_position: queuePosition = null,
+		elapsed_time: elapsedTime = null,
+		message = null,
+		errors = null,
+		detail: error = null, // error message
+		result = null
+	} = json
+
+	if (status === 'failed') {
+		captureException('Report job failed', json)
+		return {
+			error:
+				error ||
+				'unexpected errors prevented your report from completing successfully.  Please try again.'
+		}
+	}
+
+	if (status === 'success') {
+		return { result: `${apiHost}${result}`, errors }
+	}
+
+	if (status === 'queued' || status === 'in_progress' || progress !== null) {
+		onProgress({
+			status,
+			progress: progress || 0,
+			queuePosition: queuePosition || 0,
+			elapsedTime: elapsedTime || null,
+			message,
+			errors
+		})
+	}
+
+	return null
+}
+
+/**
+ * Watch job status using updates pushed by the server, falling back to polling
+ * if the event stream is not available.
+ */
+const watchJob = async (jobId: string, clientId: string, onProgress: ProgressCallback) => {
+	if (!browser || typeof EventSource === 'undefined') {
+		return pollJob(jobId, onProgress)
+	}
+
+	return new Promise((resolve) => {
+		const source = new EventSource(`${API}/events/${jobId}`)
+		let receivedEvent = false
+
+		// cancel the job if the user leaves the page before it completes; this
+		// is only sent once per request
+		const cancel = () => {
+			window.removeEventListener('pagehide', cancel)
+			navigator.sendBeacon(`${API}/cancel/${jobId}?client=${encodeURIComponent(clientId)}`)
+		}
+		window.addEventListener('pagehide', cancel)
+
+		const done = (outcome: unknown) => {
+			window.removeEventListener('pagehide', cancel)
+			resolve(outcome)
+		}
+
+		const timeout = setTimeout(() => {
+			source.close()
+			captureException('Report job timed out')
+			done({
+				error: 'timeout while creating report.  Your area of interest may be too big.'
+			})
+		}, jobTimeout)
+
+		source.onmessage = (event) => {
+			receivedEvent = true
+			const outcome = handleJobStatus(JSON.parse(event.data), onProgress)
+			if (outcome !== null) {
+				clearTimeout(timeout)
+				source.close()
+				done(outcome)
+			}
+		}
+
+		source.onerror = () => {
+			// EventSource automatically reconnects after a dropped connection once
+			// events have been received; otherwise the stream is not available
+			if (!receivedEvent || source.readyState === EventSource.CLOSED) {
+				clearTimeout(timeout)
+				source.close()
+				resolve(
+					pollJob(jobId, onProgress).finally(() => {
+						window.removeEventListener('pagehide', cancel)
+					})
+				)
+			}
+		}
+	})
 }
 
 const pollJob = async (jobId: string, onProgress: ProgressCallback) => {